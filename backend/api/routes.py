@@ -5,16 +5,18 @@ Auto-Patent Architect - API Routes
 import asyncio
 import json
 import os
-import shutil
+import re
 import uuid
 import traceback
-from typing import Optional
+from urllib.parse import quote
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
 from fastapi.responses import FileResponse, StreamingResponse, Response
 from pydantic import BaseModel
 
-from services.pdf_parser import parse_pdf
+from services.pdf_parser import HAS_MARKER, parse_pdf, cache_stats as pdf_cache_stats
+from services.ocr_worker import ocr_worker
 from services.llm_engine import (
     step_1_basic_structure,
     step_2_embodiments,
@@ -22,17 +24,94 @@ from services.llm_engine import (
     step_4_abstract,
     step_5_visual_prompts,
     step_6_generate_figure,
+    summarize_paper_chunk,
     parse_figure_prompts,
     collect_completion,
+    cache_stats as llm_cache_stats,
     MODEL_GEMINI_PRO,
 )
-from services.doc_generator import generator
+from services.doc_generator import MarkdownCleaner, clean_markdown, generator
+from services.dag import PipelineDAG
+from services.checkpoint import CheckpointStore
+from services.task_store import create_task_store
+from services.job_queue import JobQueue, QueueFullError
+from services.broadcaster import Broadcaster
+from services.chunk_batcher import ChunkBatcher
+from services.resilience import STREAM_RESET, stats as resilience_stats
+from services import rate_limiter
+from services.rate_limiter import estimate_tokens
+from services.summarizer import PAPER_TOKEN_BUDGET, build_digest
+from services.uploads import MAX_PDF_BYTES, MAX_SAMPLE_BYTES, UploadTooLarge, save_upload
+from services.templates import TEMPLATE_KINDS, is_template_id, parse_template_file
+from services.templates import library as template_library
+from services.io_executor import run_io, write_bytes, write_text
+from services.bundle import iter_zip
+from services.figure_process import postprocess_figure, thumbnail_path
+from services.loop_monitor import monitor as loop_monitor
 
 router = APIRouter()
 
-# ==================== In-Memory State ====================
-# task_id -> { status, step, step_label, content, error, files, api_key, ... }
-tasks: dict = {}
+# 同时执行的管道数与最大排队数；关闭服务时等待执行中任务的最长时间（秒）
+MAX_CONCURRENT_PIPELINES = int(os.getenv("MAX_CONCURRENT_PIPELINES", "2"))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "20"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "600"))
+
+# SSE 心跳间隔；共享存储（多 worker）下跨进程事件的轮询间隔（秒）
+SSE_HEARTBEAT_INTERVAL = 10.0
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "1.0"))
+
+# 缩略图的浏览器缓存时长（秒）
+THUMBNAIL_MAX_AGE = int(os.getenv("THUMBNAIL_MAX_AGE", str(7 * 24 * 3600)))
+
+# 附图并发上限：单任务内同时生成的附图数、整个进程同时进行的图片请求数
+FIGURE_CONCURRENCY = int(os.getenv("FIGURE_CONCURRENCY", "3"))
+FIGURE_GLOBAL_CONCURRENCY = int(os.getenv("FIGURE_GLOBAL_CONCURRENCY", "8"))
+_figure_global_semaphore = asyncio.Semaphore(FIGURE_GLOBAL_CONCURRENCY)
+
+# ==================== Task State ====================
+# task_id -> { status, step, step_label, content, error, files, figures, ... }
+# 通过 TaskStore 读写（TASK_STORE=memory|sqlite），SSE 事件与状态分开存放；
+# sqlite 后端只共享任务状态与事件，下面的 API Key、job_queue 与速率限制仍按进程各自计算
+store = create_task_store()
+
+# API Key 仅保存在执行该任务的进程内存中，不写入任务存储
+_task_api_keys: Dict[str, str] = {}
+
+# 新事件到达时唤醒本进程内的 SSE 订阅者
+broadcaster = Broadcaster()
+
+
+def _emit(task_id: str, msg: dict):
+    """写入事件并唤醒订阅者"""
+    store.append_event(task_id, msg)
+    broadcaster.publish(task_id)
+
+
+# 连续的 content 增量合并为批量帧后再写入事件
+batcher = ChunkBatcher(_emit)
+
+
+def _update_task(task_id: str, **fields):
+    """更新任务状态并唤醒订阅者（状态变化如完成 / 失败需要立即推送给客户端）"""
+    batcher.flush(task_id)
+    store.update(task_id, **fields)
+    if fields.get("status") in ("completed", "failed"):
+        # 任务结束：释放事件日志的内存缓冲，之后的订阅者从磁盘回放
+        store.close_events(task_id)
+    broadcaster.publish(task_id)
+
+
+def _mark_dropped(task_id: str):
+    """服务关闭时未能执行完的任务标记为失败，可稍后通过 /resume 继续"""
+    _update_task(task_id, status="failed", error="服务关闭，任务未完成，可重新提交恢复")
+    _task_api_keys.pop(task_id, None)
+
+
+def _get_task_or_404(task_id: str) -> dict:
+    t = store.get(task_id)
+    if t is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return t
 
 
 # ==================== Models ====================
@@ -52,68 +131,209 @@ async def set_config(payload: ConfigPayload):
 _current_api_key: str = ""
 
 
+async def _stage_template(upload: UploadFile, kind: str) -> Tuple[str, str]:
+    """把上传的范本文件写入 samples/ 暂存，返回 (暂存路径, SHA-256)；超限时抛出 UploadTooLarge"""
+    ext = os.path.splitext(upload.filename or ".txt")[1]
+    staging_path = os.path.join("samples", f"{uuid.uuid4().hex}{ext}")
+    sha256, _ = await save_upload(upload, staging_path, f"{kind}_sample", MAX_SAMPLE_BYTES)
+    return staging_path, sha256
+
+
+async def _register_template(staging_path: str, sha256: str, filename: str, kind: str) -> dict:
+    """登记已暂存的范本文件到范本库（解析在线程中执行），返回范本元信息；文件无法解析时返回 400"""
+    try:
+        return await asyncio.to_thread(template_library.add, staging_path, sha256, filename, kind)
+    except Exception as e:
+        # 损坏的 .docx 会抛出 PackageNotFoundError / BadZipFile 等各类异常，一律视为文件无效
+        raise HTTPException(status_code=400, detail=f"范本文件无法解析: {type(e).__name__}: {e}")
+
+
+def _remove_files(paths: List[str]):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def _add_template(upload: UploadFile, kind: str) -> dict:
+    """暂存上传的范本文件并登记到范本库，返回范本元信息"""
+    staging_path = None
+    try:
+        staging_path, sha256 = await _stage_template(upload, kind)
+        return await _register_template(staging_path, sha256, upload.filename or "", kind)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    finally:
+        _remove_files([staging_path] if staging_path else [])
+
+
+@router.post("/templates")
+async def upload_template(
+    file: UploadFile = File(...),
+    kind: str = Form(...),
+):
+    """上传范本到范本库，返回范本 ID；同一文件重复上传返回同一 ID"""
+    if kind not in TEMPLATE_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind 须为 {', '.join(TEMPLATE_KINDS)} 之一")
+    return await _add_template(file, kind)
+
+
+@router.get("/templates")
+async def list_templates():
+    """范本库中的全部范本"""
+    return {"templates": template_library.list()}
+
+
 @router.post("/upload")
 async def upload_pdf(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     spec_sample: Optional[UploadFile] = File(None),
     claims_sample: Optional[UploadFile] = File(None),
     abstract_sample: Optional[UploadFile] = File(None),
+    spec_template_id: Optional[str] = Form(None),
+    claims_template_id: Optional[str] = Form(None),
+    abstract_template_id: Optional[str] = Form(None),
+    api_key: Optional[str] = Form(None),
 ):
     """
-    上传论文 PDF 和可选范本文件，启动后台专利生成管道
+    上传论文 PDF，启动后台专利生成管道。
+    范本可按 ID 引用范本库中的范本（*_template_id），也可直接上传文件（*_sample，会登记到范本库）。
+    api_key 可随上传一并提交（多 worker 部署时 /config 只作用于单个进程）。
     """
+    store.evict_expired()
+    if job_queue.is_full:
+        raise HTTPException(status_code=429, detail="任务队列已满，请稍后重试")
+
+    # 先校验引用的范本 ID，避免写盘后才发现无效
+    samples = {}
+    for kind, template_id in [
+        ("spec", spec_template_id),
+        ("claims", claims_template_id),
+        ("abstract", abstract_template_id),
+    ]:
+        if template_id:
+            if template_library.get(template_id) is None:
+                raise HTTPException(status_code=400, detail=f"范本不存在: {template_id}")
+            samples[f"{kind}_sample"] = template_id
+
     task_id = str(uuid.uuid4())
     task_dir = os.path.join("output", task_id)
-    os.makedirs(task_dir, exist_ok=True)
 
-    # Save uploaded PDF
+    # 先把 PDF 与范本文件全部写盘并检查大小，全部通过后才登记范本，
+    # 任一字段超限（413）或范本无法解析（400）时删除本次请求已写入的全部文件
     pdf_path = os.path.join("temp", f"{task_id}.pdf")
-    with open(pdf_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-
-    # Save sample files if provided
-    samples = {}
-    for name, upload in [
-        ("spec_sample", spec_sample),
-        ("claims_sample", claims_sample),
-        ("abstract_sample", abstract_sample),
-    ]:
-        if upload:
-            ext = os.path.splitext(upload.filename or ".txt")[1]
-            sample_path = os.path.join("samples", f"{task_id}_{name}{ext}")
-            content = await upload.read()
-            with open(sample_path, "wb") as f:
-                f.write(content)
-            samples[name] = sample_path
+    staged = []  # (kind, 暂存路径, SHA-256, 原文件名)
+    try:
+        # Save uploaded PDF（分块写盘，同时计算内容哈希，供解析缓存使用）
+        pdf_sha256, _ = await save_upload(file, pdf_path, "file", MAX_PDF_BYTES)
+        for kind, upload in [
+            ("spec", spec_sample),
+            ("claims", claims_sample),
+            ("abstract", abstract_sample),
+        ]:
+            if upload:
+                staging_path, sha256 = await _stage_template(upload, kind)
+                staged.append((kind, staging_path, sha256, upload.filename or ""))
+
+        # 直接上传的范本文件优先于范本 ID
+        for kind, staging_path, sha256, filename in staged:
+            meta = await _register_template(staging_path, sha256, filename, kind)
+            samples[f"{kind}_sample"] = meta["template_id"]
+    except BaseException as e:
+        # 任何失败（超限、范本无法解析、写盘出错、客户端断开）都不留下本次请求的 PDF
+        _remove_files([pdf_path])
+        if isinstance(e, UploadTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        raise
+    finally:
+        _remove_files([path for _, path, _, _ in staged])
+    os.makedirs(task_dir, exist_ok=True)
 
     # Initialize task state
-    tasks[task_id] = {
-        "status": "queued",
-        "step": "0",
-        "step_label": "排队中",
-        "content": "",
-        "error": "",
+    store.create(task_id, _new_task(task_id, pdf_path, pdf_sha256, samples))
+    _task_api_keys[task_id] = api_key or _current_api_key
+
+    # 任务元信息落盘（不含 API Key），服务重启后仍可断点续跑
+    CheckpointStore(task_dir).save("task", {
         "pdf_path": pdf_path,
-        "task_dir": task_dir,
+        "pdf_sha256": pdf_sha256,
         "samples": samples,
-        "api_key": _current_api_key,
-        "files": {},
-        "figures": [],       # 附图路径列表
-        "stream_chunks": [],  # SSE chunks buffer
+    })
+
+    position = await _enqueue(task_id)
+    return {"task_id": task_id, "queue_position": position}
+
+
+@router.post("/resume/{task_id}")
+async def resume_task(task_id: str):
+    """从第一个缺失的检查点继续执行失败的任务，或为附图不全的已完成任务补生成缺失的附图"""
+    t = store.get(task_id)
+    if t is None:
+        task_dir = os.path.join("output", task_id)
+        ckpt = CheckpointStore(task_dir)
+        if not ckpt.has("task"):
+            raise HTTPException(status_code=404, detail="任务不存在")
+        meta = ckpt.load("task")
+        t = _new_task(task_id, meta["pdf_path"], meta.get("pdf_sha256"), meta["samples"])
+        t["status"] = "failed"  # 服务重启前未完成或已被淘汰的任务
+        store.create(task_id, t)
+
+    if t["status"] in ("queued", "processing"):
+        raise HTTPException(status_code=409, detail="任务正在执行中")
+    if t["status"] == "completed" and not t.get("figures_missing"):
+        raise HTTPException(status_code=409, detail="任务已完成，无需恢复")
+
+    ckpt = CheckpointStore(t["task_dir"])
+    resume_step = next(
+        (step for name, step in PIPELINE_CHECKPOINTS if not ckpt.has(name)), None
+    )
+    if resume_step == "0" and not os.path.exists(t["pdf_path"]):
+        raise HTTPException(status_code=410, detail="原始 PDF 已不存在，请重新上传")
+
+    _task_api_keys[task_id] = _task_api_keys.get(task_id) or _current_api_key
+    store.update(
+        task_id,
+        status="queued",
+        step_label="排队中",
+        error="",
+        **_restore_outputs(t["task_dir"]),
+    )
+
+    position = await _enqueue(task_id)
+    return {"task_id": task_id, "resume_from": resume_step, "queue_position": position}
+
+
+@router.get("/stats")
+async def get_stats():
+    """缓存命中与任务队列统计"""
+    # 磁盘缓存首次统计需扫描缓存目录、范本库需读取索引文件，放到 IO 线程池执行
+    pdf_cache, llm_cache, templates = await asyncio.gather(
+        run_io(pdf_cache_stats), run_io(llm_cache_stats), run_io(template_library.stats)
+    )
+    return {
+        "pdf_cache": pdf_cache,
+        "llm_cache": llm_cache,
+        "llm_resilience": resilience_stats(),
+        "templates": templates,
+        "job_queue": job_queue.stats(),
+        "event_loop": loop_monitor.stats(),
     }
 
-    background_tasks.add_task(process_patent_pipeline, task_id)
-    return {"task_id": task_id}
+
+@router.get("/health")
+async def health():
+    """健康检查：OCR 模型是否已加载预热、任务队列状态"""
+    return {
+        "status": "ok",
+        "ocr": {"available": HAS_MARKER, **ocr_worker.status()},
+        "job_queue": job_queue.stats(),
+    }
 
 
 @router.get("/status/{task_id}")
 async def get_status(task_id: str):
     """获取任务状态"""
-    if task_id not in tasks:
-        raise HTTPException(status_code=404, detail="任务不存在")
-    t = tasks[task_id]
-    return {
+    t = _get_task_or_404(task_id)
+    result = {
         "task_id": task_id,
         "status": t["status"],
         "step": t["step"],
@@ -121,56 +341,84 @@ async def get_status(task_id: str):
         "error": t["error"],
         "files": t["files"],
         "figures": len(t.get("figures", [])),
+        "figures_missing": t.get("figures_missing") or [],
     }
+    if t["status"] == "queued":
+        result["queue_position"] = job_queue.position(task_id)
+    rate_limit = rate_limiter.task_stats(task_id) or t.get("rate_limit")
+    if rate_limit:
+        result["rate_limit"] = rate_limit
+    if t.get("loop_lag"):
+        result["loop_lag"] = t["loop_lag"]
+    return result
 
 
-@router.get("/stream/{task_id}")
-async def stream_output(task_id: str):
-    """SSE 流式端点 - 实时推送内容生成进度"""
-    if task_id not in tasks:
-        raise HTTPException(status_code=404, detail="任务不存在")
-
-    async def event_generator():
-        last_index = 0
-        heartbeat_interval = 10
-        last_heartbeat = asyncio.get_event_loop().time()
+async def _event_stream(task_id: str):
+    """
+    单个订阅者的 SSE 事件流。
+    由 _push_chunk 通过 broadcaster 即时唤醒；无新事件时仅在心跳到期
+    （共享存储下还有跨进程轮询间隔）时醒来。
+    """
+    loop = asyncio.get_running_loop()
+    offset = 0
+    last_heartbeat = loop.time()
+    poll_interval = SSE_POLL_INTERVAL if store.shared else None
 
+    broadcaster.subscribe(task_id)
+    try:
         while True:
-            t = tasks.get(task_id)
-            if not t:
+            wakeup = broadcaster.listen(task_id)
+
+            # Send new chunks（事件日志中已是编码好的 SSE 帧，按字节偏移续读）
+            data, offset = store.read_frames(task_id, offset)
+            if data:
+                yield data
+                last_heartbeat = loop.time()
+
+            status = store.get_status(task_id)
+            if status is None:
                 break
 
-            # Send new chunks
-            chunks = t["stream_chunks"]
-            if last_index < len(chunks):
-                for i in range(last_index, len(chunks)):
-                    data = json.dumps(chunks[i], ensure_ascii=False)
-                    yield f"data: {data}\n\n"
-                last_index = len(chunks)
-                last_heartbeat = asyncio.get_event_loop().time()
-
-            # Check if done
-            if t["status"] in ("completed", "failed"):
+            # Check if done（结束状态写入前事件已全部推送，补读一次即可完整送达）
+            if status in ("completed", "failed"):
+                while True:
+                    data, offset = store.read_frames(task_id, offset)
+                    if not data:
+                        break
+                    yield data
+                t = store.get(task_id)
                 final = {
                     "type": "done",
                     "status": t["status"],
                     "files": t["files"],
                     "figures": len(t.get("figures", [])),
+                    "figures_missing": t.get("figures_missing") or [],
                     "error": t["error"],
                 }
                 yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n"
                 break
 
             # 心跳保活
-            now = asyncio.get_event_loop().time()
-            if now - last_heartbeat >= heartbeat_interval:
+            now = loop.time()
+            if now - last_heartbeat >= SSE_HEARTBEAT_INTERVAL:
                 yield ": heartbeat\n\n"
                 last_heartbeat = now
 
-            await asyncio.sleep(0.3)
+            timeout = last_heartbeat + SSE_HEARTBEAT_INTERVAL - loop.time()
+            if poll_interval is not None:
+                timeout = min(timeout, poll_interval)
+            await broadcaster.wait(wakeup, max(timeout, 0))
+    finally:
+        broadcaster.unsubscribe(task_id)
+
+
+@router.get("/stream/{task_id}")
+async def stream_output(task_id: str):
+    """SSE 流式端点 - 实时推送内容生成进度"""
+    _get_task_or_404(task_id)
 
     return StreamingResponse(
-        event_generator(),
+        _event_stream(task_id),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -183,10 +431,7 @@ async def stream_output(task_id: str):
 @router.get("/download/{task_id}/{doc_type}")
 async def download_doc(task_id: str, doc_type: str):
     """下载生成的文档"""
-    if task_id not in tasks:
-        raise HTTPException(status_code=404, detail="任务不存在")
-
-    t = tasks[task_id]
+    t = _get_task_or_404(task_id)
     file_path = t["files"].get(doc_type)
     if not file_path or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail=f"文件 {doc_type} 尚未生成")
@@ -195,6 +440,7 @@ async def download_doc(task_id: str, doc_type: str):
         "specification": "说明书.docx",
         "claims": "权利要求书.docx",
         "abstract": "说明书摘要.docx",
+        "figures_doc": "说明书附图.docx",
     }
     return FileResponse(
         path=file_path,
@@ -206,10 +452,7 @@ async def download_doc(task_id: str, doc_type: str):
 @router.get("/image/{task_id}/{index}")
 async def get_figure_image(task_id: str, index: int):
     """获取生成的附图"""
-    if task_id not in tasks:
-        raise HTTPException(status_code=404, detail="任务不存在")
-
-    figures = tasks[task_id].get("figures", [])
+    figures = _get_task_or_404(task_id).get("figures", [])
     if index < 0 or index >= len(figures):
         raise HTTPException(status_code=404, detail=f"附图 {index} 不存在")
 
@@ -224,13 +467,145 @@ async def get_figure_image(task_id: str, index: int):
     )
 
 
+@router.get("/thumbnail/{task_id}/{index}")
+async def get_figure_thumbnail(task_id: str, index: int, request: Request):
+    """
+    获取附图缩略图（供下载页图库使用）。
+    缩略图生成后不再变化，允许浏览器长期缓存；尚无缩略图（未启用后处理）时退回原图并要求每次校验。
+    """
+    figures = _get_task_or_404(task_id).get("figures", [])
+    if index < 0 or index >= len(figures):
+        raise HTTPException(status_code=404, detail=f"附图 {index} 不存在")
+
+    path = thumbnail_path(figures[index])
+    cache_control = f"public, max-age={THUMBNAIL_MAX_AGE}, immutable"
+    if not os.path.exists(path):
+        path = figures[index]
+        cache_control = "no-cache"
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="附图文件不存在")
+
+    st = os.stat(path)
+    headers = {"Cache-Control": cache_control, "ETag": f'"{st.st_mtime_ns:x}-{st.st_size:x}"'}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path=path, media_type="image/png", headers=headers)
+
+
+@router.get("/bundle/{task_id}")
+async def download_bundle(task_id: str):
+    """一次性下载任务的全部产物（文档、附图、提示词），ZIP 边打包边发送"""
+    t = _get_task_or_404(task_id)
+    entries = _bundle_entries(t)
+    if not entries:
+        raise HTTPException(status_code=404, detail="该任务尚无可下载的文件")
+
+    filename = f"专利申请文件_{task_id[:8]}.zip"
+    return StreamingResponse(
+        iter_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}"},
+    )
+
+
 # ==================== Pipeline ====================
 
+async def _enqueue(task_id: str) -> int:
+    """提交任务到队列；队列已满时任务记为失败并返回 429"""
+    try:
+        return await job_queue.submit(task_id)
+    except QueueFullError:
+        _update_task(task_id, status="failed", error="任务队列已满")
+        _task_api_keys.pop(task_id, None)
+        raise HTTPException(status_code=429, detail="任务队列已满，请稍后重试")
+
+
+# 说明书正文中 Step 1 与 Step 2 输出之间插入的章节标题
+SPEC_SECTION_SEPARATOR = "\n\n具体实施方式\n\n"
+
+# 需要落检查点的步骤（检查点名称, 所属步骤），按管道顺序排列
+PIPELINE_CHECKPOINTS = [
+    ("pdf_text", "0"),
+    ("paper_digest", "0"),
+    ("doc_part_1", "1"),
+    ("doc_part_2", "2"),
+    ("claims_text", "3"),
+    ("abstract_text", "4"),
+    ("visual_prompts", "5"),
+    ("figures", "6"),
+]
+
+# 任务目录中的输出文件 -> files 字段的键
+OUTPUT_FILES = {
+    "说明书.docx": "specification",
+    "权利要求书.docx": "claims",
+    "说明书摘要.docx": "abstract",
+    "附图提示词.txt": "visual_prompts",
+    "说明书附图.docx": "figures_doc",
+}
+
+
+def _new_task(task_id: str, pdf_path: str, pdf_sha256: Optional[str],
+              samples: Dict[str, str]) -> dict:
+    """初始化任务状态"""
+    return {
+        "status": "queued",
+        "step": "0",
+        "step_label": "排队中",
+        "content": "",
+        "error": "",
+        "pdf_path": pdf_path,
+        "pdf_sha256": pdf_sha256,
+        "task_dir": os.path.join("output", task_id),
+        "samples": samples,
+        "files": {},
+        "figures": [],       # 附图路径列表
+    }
+
+
+def _restore_outputs(task_dir: str) -> dict:
+    """根据任务目录中已有的文件恢复 files / figures 字段"""
+    files = {}
+    for filename, doc_type in OUTPUT_FILES.items():
+        path = os.path.join(task_dir, filename)
+        if os.path.exists(path):
+            files[doc_type] = path
+    figures = []
+    for name in os.listdir(task_dir):
+        m = re.fullmatch(r"图(\d+)\.png", name)
+        if m:
+            figures.append((int(m.group(1)), os.path.join(task_dir, name)))
+    return {"files": files, "figures": [path for _, path in sorted(figures)]}
+
+
+def _bundle_entries(t: dict) -> List[Tuple[str, str]]:
+    """打包下载的条目 (包内文件名, 路径)：先按 OUTPUT_FILES 顺序放文档，再放各张附图"""
+    entries = []
+    files = t.get("files", {})
+    for filename, doc_type in OUTPUT_FILES.items():
+        path = files.get(doc_type)
+        if path and os.path.exists(path):
+            entries.append((filename, path))
+    for path in t.get("figures", []):
+        if os.path.exists(path):
+            entries.append((os.path.basename(path), path))
+    return entries
+
+
+def _set_file(task_id: str, doc_type: str, path: str):
+    """登记已生成的输出文件"""
+    files = store.get(task_id)["files"]
+    files[doc_type] = path
+    store.update(task_id, files=files)
+
+
 def _push_chunk(task_id: str, chunk_type: str, **kwargs):
-    """向 SSE 缓冲区推送一条消息"""
-    if task_id in tasks:
-        msg = {"type": chunk_type, **kwargs}
-        tasks[task_id]["stream_chunks"].append(msg)
+    """向 SSE 缓冲区推送一条消息；纯文本 content 经 batcher 合并，其他事件先冲刷缓冲保证顺序"""
+    if chunk_type == "content" and kwargs.keys() == {"step", "text"}:
+        batcher.add(task_id, kwargs["step"], kwargs["text"])
+        return
+    batcher.flush(task_id)
+    _emit(task_id, {"type": chunk_type, **kwargs})
 
 
 def _push_log(task_id: str, message: str):
@@ -240,69 +615,181 @@ def _push_log(task_id: str, message: str):
 
 def _update_step(task_id: str, step: str, label: str):
     """更新任务步骤"""
-    if task_id in tasks:
-        tasks[task_id]["step"] = step
-        tasks[task_id]["step_label"] = label
-        _push_chunk(task_id, "step", step=step, label=label)
-        _push_log(task_id, f">>> 进入步骤 {step}: {label}")
+    store.update(task_id, step=step, step_label=label)
+    _push_chunk(task_id, "step", step=step, label=label)
+    _push_log(task_id, f">>> 进入步骤 {step}: {label}")
 
 
-async def _collect_stream(task_id: str, gen, step_id: str):
-    """从异步生成器收集内容，同时推送 SSE"""
+def _step_tracker(task_id: str) -> Callable[[str, Any], None]:
+    """
+    DAG 节点完成回调：某步骤的全部检查点节点完成后推送 step_done。
+    步骤 3/4/5 并发执行，前端按 step_done 逐个标记完成，而不是在进入新步骤时把编号更小的都视为完成。
+    """
+    remaining: Dict[str, set] = {}
+    for name, step in PIPELINE_CHECKPOINTS:
+        remaining.setdefault(step, set()).add(name)
+
+    def _on_done(name: str, value: Any):
+        step = next((s for n, s in PIPELINE_CHECKPOINTS if n == name), None)
+        if step is None:
+            return
+        remaining[step].discard(name)
+        if remaining[step]:
+            return
+        status = "completed"
+        if name == "figures" and store.get(task_id).get("figures_missing"):
+            status = "failed"
+        _push_chunk(task_id, "step_done", step=step, status=status)
+
+    return _on_done
+
+
+async def _collect_stream(task_id: str, gen, step_id: str, cleaner: Optional[MarkdownCleaner] = None):
+    """
+    从异步生成器收集内容，同时推送 SSE；上游中途失败重试时通知前端清空该步骤已显示的内容。
+    传入 cleaner 时边接收边清洗 Markdown，输出结束即可直接写入文档。
+    """
     full_text = []
     async for chunk in gen:
+        if chunk is STREAM_RESET:
+            full_text.clear()
+            if cleaner is not None:
+                cleaner.reset()
+            _push_chunk(task_id, "reset", step=step_id)
+            _push_log(task_id, f"Step {step_id} 上游输出中断，正在重新生成")
+            continue
         full_text.append(chunk)
+        if cleaner is not None:
+            cleaner.feed(chunk)
         _push_chunk(task_id, "content", step=step_id, text=chunk)
     return "".join(full_text)
 
 
-async def process_patent_pipeline(task_id: str):
-    """完整的专利生成管道"""
-    t = tasks[task_id]
-    api_key = t["api_key"]
-    task_dir = t["task_dir"]
-    samples = t["samples"]
+async def _generate_figures(task_id: str, figure_prompts: List[str], api_key: str) -> List[int]:
+    """
+    并发生成全部附图，返回生成失败的序号（从 0 开始）。
+    单任务并发受 FIGURE_CONCURRENCY 限制，全进程受 FIGURE_GLOBAL_CONCURRENCY 限制；
+    figure_ready 按完成顺序推送，文件名仍按原始序号命名为 图N.png。
+    """
+    task_dir = store.get(task_id)["task_dir"]
+    total = len(figure_prompts)
+    task_semaphore = asyncio.Semaphore(FIGURE_CONCURRENCY)
+    done: Dict[int, str] = {}
+
+    async def _one(i: int, fig_prompt: str):
+        fig_path = os.path.join(task_dir, f"图{i + 1}.png")
+        if os.path.exists(fig_path):
+            # 断点续跑：上次已生成的附图直接复用；写盘后未来得及后处理的补做一次
+            if not os.path.exists(thumbnail_path(fig_path)):
+                await postprocess_figure(fig_path)
+            done[i] = fig_path
+            store.update(task_id, figures=[done[k] for k in sorted(done)])
+            _push_log(task_id, f"图 {i + 1} 已存在，跳过生成")
+            return
+
+        async with task_semaphore, _figure_global_semaphore:
+            _push_log(task_id, f"正在生成图 {i + 1}/{total}...")
+            _push_chunk(task_id, "content", step="6",
+                        text=f"\n正在生成 图{i + 1}/{total}...\n")
+            img_data = await step_6_generate_figure(fig_prompt, i, api_key)
+
+        if img_data:
+            await run_io(write_bytes, fig_path, img_data)
+            processed = await postprocess_figure(fig_path)
+            if processed:
+                _push_log(task_id, f"图 {i + 1} 已转为黑白线条图: "
+                                   f"{processed['before'] // 1024} KB -> {processed['after'] // 1024} KB")
+            # 保持 figures 列表按原始序号排列，/image/{index} 取图不受完成顺序影响
+            done[i] = fig_path
+            store.update(task_id, figures=[done[k] for k in sorted(done)])
+            _push_chunk(task_id, "figure_ready", index=i, total=total, count=len(done))
+            _push_log(task_id, f"图 {i + 1} 生成成功，保存至 {fig_path}")
+        else:
+            _push_log(task_id, f"图 {i + 1} 生成失败，跳过")
+            _push_chunk(task_id, "content", step="6",
+                        text=f"  ⚠ 图{i + 1} 生成失败\n")
+
+    await asyncio.gather(*(_one(i, p) for i, p in enumerate(figure_prompts)))
+    return [i for i in range(total) if i not in done]
+
+
+def _read_sample(ref: str) -> str:
+    """范本文本：范本库 ID 直接查 LRU；旧任务检查点中记录的是文件路径，按文件解析"""
+    if is_template_id(ref):
+        return template_library.text(ref)
+    return parse_template_file(ref)
 
-    try:
-        t["status"] = "processing"
-        _push_log(task_id, "管道启动")
 
-        # ===== Step 0: PDF 解析 =====
+def _build_pipeline(task_id: str) -> PipelineDAG:
+    """
+    构建专利生成管道的依赖图：
+        pdf_text ─> paper_digest ─┐
+        samples ──────────────────┴─> doc_part_1 ─> doc_part_2 ─> full_spec ─┬─> specification
+                                                                              ├─> claims_text
+                                                                              ├─> abstract_text
+                                                                              └─> visual_prompts ─> figures ─> figures_doc
+    权利要求书、摘要、附图提示词仅依赖 full_spec，三者并发生成，各自完成后立即写出文档。
+    paper_digest 仅在论文超出 PAPER_TOKEN_BUDGET 时生成，否则为 None，step 1 直接使用全文。
+    """
+    t = store.get(task_id)
+    api_key = _task_api_keys.get(task_id, "")
+    task_dir = t["task_dir"]
+    samples = t["samples"]
+    ckpt = CheckpointStore(task_dir)
+
+    def _checkpointed(name: str, func):
+        """已有检查点的步骤直接读取结果，否则执行并保存检查点"""
+        async def _node(r):
+            if ckpt.has(name):
+                _push_log(task_id, f"从检查点恢复: {name}")
+                return await run_io(ckpt.load, name)
+            value = await func(r)
+            await run_io(ckpt.save, name, value)
+            return value
+        return _node
+
+    # ===== Step 0: PDF 解析 =====
+    async def _pdf_text(r):
         _update_step(task_id, "0", "PDF 预处理")
         _push_log(task_id, f"开始解析 PDF: {t['pdf_path']}")
-        pdf_text = await parse_pdf(t["pdf_path"])
+        pdf_text = await parse_pdf(t["pdf_path"], file_hash=t.get("pdf_sha256"))
         _push_chunk(task_id, "content", step="0", text=f"PDF 解析完成，共 {len(pdf_text)} 字符\n")
         _push_log(task_id, f"PDF 解析完成，提取 {len(pdf_text)} 字符")
+        return pdf_text
+
+    # 超长论文先分块提取要点
+    async def _paper_digest(r):
+        pdf_text = r["pdf_text"]
+        tokens = estimate_tokens(pdf_text)
+        if tokens <= PAPER_TOKEN_BUDGET:
+            return None
+        _push_log(task_id, f"论文约 {tokens} tokens，超出预算 {PAPER_TOKEN_BUDGET}，分块提取要点")
+
+        def _progress(done: int, total: int):
+            _push_chunk(task_id, "content", step="0", text=f"论文分块摘要 {done}/{total}\n")
+
+        digest = await build_digest(
+            pdf_text,
+            lambda chunk, target: summarize_paper_chunk(chunk, target, api_key),
+            on_progress=_progress,
+        )
+        _push_log(task_id, f"论文摘要完成: {len(pdf_text)} -> {len(digest)} 字符")
+        return digest
 
-        # 读取范本（如有）
-        def _read_sample(path: str) -> str:
-            """读取范本文件，支持 .docx 和纯文本"""
-            if path.endswith((".docx", ".doc")):
-                from docx import Document as DocxDocument
-                doc = DocxDocument(path)
-                return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
-            else:
-                for enc in ["utf-8", "gbk", "gb2312", "latin-1"]:
-                    try:
-                        with open(path, "r", encoding=enc) as f:
-                            return f.read()
-                    except (UnicodeDecodeError, LookupError):
-                        continue
-                with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                    return f.read()
-
+    # 读取范本（如有）
+    async def _samples(r):
         spec_sample_text = ""
         claims_sample_text = ""
         abstract_sample_text = ""
 
         if "spec_sample" in samples:
-            spec_sample_text = _read_sample(samples["spec_sample"])
+            spec_sample_text = await run_io(_read_sample, samples["spec_sample"])
             _push_log(task_id, f"已读取说明书范本: {len(spec_sample_text)} 字符")
         if "claims_sample" in samples:
-            claims_sample_text = _read_sample(samples["claims_sample"])
+            claims_sample_text = await run_io(_read_sample, samples["claims_sample"])
             _push_log(task_id, f"已读取权利要求书范本: {len(claims_sample_text)} 字符")
         if "abstract_sample" in samples:
-            abstract_sample_text = _read_sample(samples["abstract_sample"])
+            abstract_sample_text = await run_io(_read_sample, samples["abstract_sample"])
             _push_log(task_id, f"已读取说明书摘要范本: {len(abstract_sample_text)} 字符")
 
         if not spec_sample_text:
@@ -312,122 +799,218 @@ async def process_patent_pipeline(task_id: str):
         if not abstract_sample_text:
             abstract_sample_text = "（无范本提供，请按照标准说明书摘要格式撰写）"
 
-        # ===== Step 1: 基础构建 =====
+        return {
+            "spec": spec_sample_text,
+            "claims": claims_sample_text,
+            "abstract": abstract_sample_text,
+        }
+
+    # Step 1、2 边生成边清洗的说明书正文；从检查点恢复的部分不在此列，生成说明书时再整段清洗
+    spec_cleaned: Dict[str, str] = {}
+
+    # ===== Step 1: 基础构建 =====
+    async def _doc_part_1(r):
         _update_step(task_id, "1", "基础构建与术语锁定")
         _push_log(task_id, f"调用模型: google/gemini-3-pro-preview")
+        cleaner = MarkdownCleaner()
         doc_part_1 = await _collect_stream(
             task_id,
-            step_1_basic_structure(pdf_text, spec_sample_text, api_key),
+            step_1_basic_structure(r["paper_digest"] or r["pdf_text"], r["samples"]["spec"], api_key),
             "1",
+            cleaner,
         )
+        spec_cleaned["doc_part_1"] = cleaner.close()
         _push_log(task_id, f"Step 1 完成，生成 {len(doc_part_1)} 字符")
+        return doc_part_1
 
+    # ===== Step 2: 具体实施例 =====
+    async def _doc_part_2(r):
+        doc_part_1 = r["doc_part_1"]
         terms = doc_part_1[:500]
-
-        # ===== Step 2: 具体实施例 =====
         _update_step(task_id, "2", "实施例深度撰写")
         _push_log(task_id, f"调用模型: google/gemini-3-pro-preview")
+        cleaner = MarkdownCleaner()
         doc_part_2 = await _collect_stream(
             task_id,
-            step_2_embodiments(doc_part_1, terms, spec_sample_text, api_key),
+            step_2_embodiments(doc_part_1, terms, r["samples"]["spec"], api_key),
             "2",
+            cleaner,
         )
+        spec_cleaned["doc_part_2"] = cleaner.close()
         _push_log(task_id, f"Step 2 完成，生成 {len(doc_part_2)} 字符")
-
-        full_spec = doc_part_1 + "\n\n具体实施方式\n\n" + doc_part_2
-
-        # 生成说明书 .docx
-        spec_title = full_spec.split("\n")[0][:25] if full_spec else "发明专利说明书"
+        return doc_part_2
+
+    async def _full_spec(r):
+        return r["doc_part_1"] + SPEC_SECTION_SEPARATOR + r["doc_part_2"]
+
+    # 生成说明书 .docx（正文已在 Step 1、2 生成时清洗，不再对全文整段清洗）
+    async def _specification(r):
+        parts = []
+        for name in ("doc_part_1", "doc_part_2"):
+            cleaned = spec_cleaned.get(name)
+            if cleaned is None:
+                cleaned = await run_io(clean_markdown, r[name])
+            parts.append(cleaned)
+        content = SPEC_SECTION_SEPARATOR.join(parts)
+        spec_title = content.split("\n")[0][:25] if content else "发明专利说明书"
         spec_path = os.path.join(task_dir, "说明书.docx")
-        generator.generate_specification(spec_title, full_spec, spec_path)
-        t["files"]["specification"] = spec_path
+        await run_io(generator.generate_specification, spec_title, content, spec_path, clean=False)
+        _set_file(task_id, "specification", spec_path)
         _push_chunk(task_id, "file_ready", doc_type="specification")
         _push_log(task_id, f"说明书已保存: {spec_path}")
+        return spec_path
 
-        # ===== Step 3: 权利要求书 =====
+    # ===== Step 3: 权利要求书 =====
+    async def _claims_text(r):
         _update_step(task_id, "3", "权利要求书生成")
         _push_log(task_id, f"调用模型: google/gemini-3-pro-preview")
+        cleaner = MarkdownCleaner()
         claims_text = await _collect_stream(
             task_id,
-            step_3_claims(full_spec, claims_sample_text, api_key),
+            step_3_claims(r["full_spec"], r["samples"]["claims"], api_key),
             "3",
+            cleaner,
         )
         _push_log(task_id, f"Step 3 完成，生成 {len(claims_text)} 字符")
 
         claims_path = os.path.join(task_dir, "权利要求书.docx")
-        generator.generate_claims(claims_text, claims_path)
-        t["files"]["claims"] = claims_path
+        await run_io(generator.generate_claims, cleaner.close(), claims_path, clean=False)
+        _set_file(task_id, "claims", claims_path)
         _push_chunk(task_id, "file_ready", doc_type="claims")
         _push_log(task_id, f"权利要求书已保存: {claims_path}")
+        return claims_text
 
-        # ===== Step 4: 说明书摘要 =====
+    # ===== Step 4: 说明书摘要 =====
+    async def _abstract_text(r):
         _update_step(task_id, "4", "说明书摘要生成")
         _push_log(task_id, f"调用模型: google/gemini-3-pro-preview")
+        cleaner = MarkdownCleaner()
         abstract_text = await _collect_stream(
             task_id,
-            step_4_abstract(full_spec, abstract_sample_text, api_key),
+            step_4_abstract(r["full_spec"], r["samples"]["abstract"], api_key),
             "4",
+            cleaner,
         )
         _push_log(task_id, f"Step 4 完成，生成 {len(abstract_text)} 字符")
 
         abstract_path = os.path.join(task_dir, "说明书摘要.docx")
-        generator.generate_abstract(abstract_text, abstract_path)
-        t["files"]["abstract"] = abstract_path
+        await run_io(generator.generate_abstract, cleaner.close(), abstract_path, clean=False)
+        _set_file(task_id, "abstract", abstract_path)
         _push_chunk(task_id, "file_ready", doc_type="abstract")
         _push_log(task_id, f"说明书摘要已保存: {abstract_path}")
+        return abstract_text
 
-        # ===== Step 5: 附图提示词 =====
+    # ===== Step 5: 附图提示词 =====
+    async def _visual_prompts(r):
         _update_step(task_id, "5", "附图提示词生成")
         _push_log(task_id, f"调用模型: openai/gpt-5.2")
         visual_prompts = await _collect_stream(
             task_id,
-            step_5_visual_prompts(full_spec, 5, api_key),
+            step_5_visual_prompts(r["full_spec"], 5, api_key),
             "5",
         )
         _push_log(task_id, f"Step 5 完成，生成 {len(visual_prompts)} 字符")
 
         # Save prompts as text file
         prompts_path = os.path.join(task_dir, "附图提示词.txt")
-        with open(prompts_path, "w", encoding="utf-8") as f:
-            f.write(visual_prompts)
-        t["files"]["visual_prompts"] = prompts_path
+        await run_io(write_text, prompts_path, visual_prompts)
+        _set_file(task_id, "visual_prompts", prompts_path)
+        return visual_prompts
 
-        # ===== Step 6: 附图生成 =====
+    # ===== Step 6: 附图生成 =====
+    async def _figures(r):
         _update_step(task_id, "6", "附图生成")
         _push_log(task_id, f"调用模型: google/gemini-3-pro-image-preview")
 
-        figure_prompts = parse_figure_prompts(visual_prompts)
+        figure_prompts = parse_figure_prompts(r["visual_prompts"])
         _push_log(task_id, f"解析出 {len(figure_prompts)} 张附图提示词")
 
-        for i, fig_prompt in enumerate(figure_prompts):
-            _push_log(task_id, f"正在生成图 {i + 1}/{len(figure_prompts)}...")
-            _push_chunk(task_id, "content", step="6",
-                        text=f"\n正在生成 图{i + 1}/{len(figure_prompts)}...\n")
+        missing = await _generate_figures(task_id, figure_prompts, api_key)
+
+        figures = store.get(task_id)["figures"]
+        _push_log(task_id, f"附图生成完毕，共 {len(figures)} 张")
+        # 有附图失败时不写检查点，任务结束后记为失败，断点续跑只补生成缺失的附图
+        store.update(task_id, figures_missing=[i + 1 for i in missing])
+        if not missing:
+            await run_io(ckpt.save, "figures", figures)
+        return figures
+
+    async def _figures_or_checkpoint(r):
+        """附图检查点只在全部附图生成成功后由 _figures 自行保存"""
+        if ckpt.has("figures"):
+            _push_log(task_id, "从检查点恢复: figures")
+            return await run_io(ckpt.load, "figures")
+        return await _figures(r)
+
+    # 生成说明书附图 .docx（附图嵌入文档，图下标注图号）
+    async def _figures_doc(r):
+        figures = r["figures"]
+        if not figures:
+            return None
+        captions = [(os.path.splitext(os.path.basename(path))[0], path) for path in figures]
+        figures_doc_path = os.path.join(task_dir, "说明书附图.docx")
+        await run_io(generator.generate_figures, captions, figures_doc_path)
+        _set_file(task_id, "figures_doc", figures_doc_path)
+        _push_chunk(task_id, "file_ready", doc_type="figures_doc")
+        _push_log(task_id, f"说明书附图已保存: {figures_doc_path}")
+        return figures_doc_path
+
+    dag = PipelineDAG()
+    dag.add("pdf_text", _checkpointed("pdf_text", _pdf_text))
+    dag.add("samples", _samples)
+    dag.add("paper_digest", _checkpointed("paper_digest", _paper_digest), deps=["pdf_text"])
+    dag.add("doc_part_1", _checkpointed("doc_part_1", _doc_part_1), deps=["pdf_text", "paper_digest", "samples"])
+    dag.add("doc_part_2", _checkpointed("doc_part_2", _doc_part_2), deps=["doc_part_1", "samples"])
+    dag.add("full_spec", _full_spec, deps=["doc_part_1", "doc_part_2"])
+    dag.add("specification", _specification, deps=["full_spec"])
+    dag.add("claims_text", _checkpointed("claims_text", _claims_text), deps=["full_spec", "samples"])
+    dag.add("abstract_text", _checkpointed("abstract_text", _abstract_text), deps=["full_spec", "samples"])
+    dag.add("visual_prompts", _checkpointed("visual_prompts", _visual_prompts), deps=["full_spec"])
+    dag.add("figures", _figures_or_checkpoint, deps=["visual_prompts"])
+    dag.add("figures_doc", _figures_doc, deps=["figures"])
+    return dag
 
-            img_data = await step_6_generate_figure(fig_prompt, i, api_key)
 
-            if img_data:
-                fig_path = os.path.join(task_dir, f"图{i + 1}.png")
-                with open(fig_path, "wb") as f:
-                    f.write(img_data)
-                t["figures"].append(fig_path)
-                _push_chunk(task_id, "figure_ready", index=i, total=len(figure_prompts))
-                _push_log(task_id, f"图 {i + 1} 生成成功，保存至 {fig_path}")
-            else:
-                _push_log(task_id, f"图 {i + 1} 生成失败，跳过")
-                _push_chunk(task_id, "content", step="6",
-                            text=f"  ⚠ 图{i + 1} 生成失败\n")
+async def process_patent_pipeline(task_id: str):
+    """完整的专利生成管道"""
+    # 管道内全部模型调用的限流等待归集到该任务
+    context_token = rate_limiter.current_task.set(task_id)
+    lag_mark = loop_monitor.mark()
+    try:
+        store.update(task_id, status="processing")
+        _push_log(task_id, "管道启动")
 
-        _push_log(task_id, f"附图生成完毕，共 {len(t['figures'])} 张")
+        await _build_pipeline(task_id).run(on_done=_step_tracker(task_id))
 
         # ===== Done =====
-        t["status"] = "completed"
-        t["step_label"] = "全部完成"
-        _push_log(task_id, "管道执行完毕")
+        # 部分附图失败时任务仍记为完成（文档均已生成可下载），
+        # figures_missing 随状态返回，可通过 /resume 只补生成缺失的附图
+        missing = store.get(task_id).get("figures_missing")
+        if missing:
+            _push_log(task_id, f"管道执行完毕，图{'、图'.join(map(str, missing))} 生成失败，可断点续跑补齐")
+            _update_task(task_id, status="completed", step_label="完成（部分附图缺失）")
+        else:
+            _push_log(task_id, "管道执行完毕")
+            _update_task(task_id, status="completed", step_label="全部完成")
 
     except Exception as e:
-        t["status"] = "failed"
-        t["error"] = str(e)
         _push_chunk(task_id, "error", message=str(e))
         _push_log(task_id, f"管道异常: {str(e)}")
+        _update_task(task_id, status="failed", error=str(e))
         traceback.print_exc()
+    finally:
+        _task_api_keys.pop(task_id, None)
+        rate_limit = rate_limiter.forget_task(task_id)
+        if rate_limit:
+            store.update(task_id, rate_limit=rate_limit)
+        rate_limiter.current_task.reset(context_token)
+        # 任务执行期间事件循环的最大阻塞与卡顿次数（与同时运行的其他任务共用同一事件循环）
+        store.update(task_id, loop_lag=loop_monitor.since(lag_mark))
+
+
+job_queue = JobQueue(
+    process_patent_pipeline,
+    max_concurrent=MAX_CONCURRENT_PIPELINES,
+    max_queued=MAX_QUEUED_JOBS,
+    on_dropped=_mark_dropped,
+)
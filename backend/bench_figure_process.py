@@ -0,0 +1,53 @@
+"""附图后处理基准 - 模拟 4K 彩色附图，对比处理前后的文件大小、缩略图大小与单张处理耗时
+
+用法: python bench_figure_process.py [张数]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+from services.figure_process import FIGURE_DPI, FIGURE_MAX_WIDTH_PX, process_figure, thumbnail_path
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+
+def _model_output(path: str, seed: int):
+    """图片模型的典型输出：3840x2160、抗锯齿线条、带轻微噪点的浅色底"""
+    width, height = 3840, 2160
+    noise = Image.effect_noise((width, height), 10 + seed).convert("RGB")
+    img = Image.blend(Image.new("RGB", (width, height), (240, 238, 232)), noise, 0.12)
+    draw = ImageDraw.Draw(img)
+    for row in range(3):
+        for col in range(5):
+            x, y = 200 + col * 700, 250 + row * 650
+            draw.rounded_rectangle([x, y, x + 480, y + 360], radius=30, outline=(30, 30, 30), width=6)
+            draw.line([x + 480, y + 180, x + 700, y + 180], fill=(30, 30, 30), width=6)
+    img.save(path, format="PNG")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as d:
+        before = after = thumbs = 0
+        elapsed = []
+        for i in range(COUNT):
+            path = os.path.join(d, f"图{i + 1}.png")
+            _model_output(path, i)
+            start = time.perf_counter()
+            result = process_figure(path, thumbnail_path(path))
+            elapsed.append(time.perf_counter() - start)
+            before += result["before"]
+            after += result["after"]
+            thumbs += result["thumbnail"]
+
+    print(f"{COUNT} 张 3840x2160 附图 -> {FIGURE_MAX_WIDTH_PX}px 宽 1 位黑白图（{FIGURE_DPI} DPI）")
+    print(f"  原图合计     {before / 1024 / 1024:8.2f} MB")
+    print(f"  处理后合计   {after / 1024:8.1f} KB  （{before / after:.0f}x）")
+    print(f"  缩略图合计   {thumbs / 1024:8.1f} KB  （图库首屏只需加载这些）")
+    print(f"  单张处理     {min(elapsed) * 1000:8.0f} ms（最快） / {sum(elapsed) / len(elapsed) * 1000:.0f} ms（平均）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""图片响应解析基准 - 合成 10 MB 图片的接口响应，用 tracemalloc 对比原 model_dump + 正则 + replace 提取与增量提取的内存峰值和耗时
+
+用法: python bench_image_payload.py [MB]
+"""
+import base64
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+from openai.types.chat import ChatCompletion
+
+from services.image_payload import ImagePayloadExtractor
+
+SIZE_MB = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+CHUNK = 64 * 1024  # 接近 httpx 单次产出的网络分块大小
+
+
+def _response_body(image: bytes, wrap: bool) -> bytes:
+    b64 = base64.b64encode(image).decode()
+    if wrap:
+        b64 = "\n".join(b64[i:i + 76] for i in range(0, len(b64), 76))
+    url = f"data:image/png;base64,{b64}"
+    return json.dumps({
+        "id": "gen-1", "object": "chat.completion", "created": 0, "model": "image-model",
+        "choices": [{
+            "index": 0, "finish_reason": "stop",
+            "message": {"role": "assistant", "content": "", "images": [{"type": "image_url", "image_url": {"url": url}}]},
+        }],
+    }).encode()
+
+
+def _before(body: bytes) -> bytes:
+    """改造前的路径：SDK 解析为对象后 model_dump，再正则匹配并逐个 replace 空白"""
+    response = ChatCompletion.model_validate(json.loads(body))
+    raw = response.model_dump()
+    url = raw["choices"][0]["message"]["images"][0]["image_url"]["url"]
+    m = re.search(r'base64,([A-Za-z0-9+/=\s]+)', url, re.DOTALL)
+    raw_b64 = m.group(1).replace("\n", "").replace(" ", "").replace("\r", "")
+    return base64.b64decode(raw_b64)
+
+
+def _after(body: bytes) -> bytearray:
+    """增量提取：模拟按网络分块读取响应体"""
+    extractor = ImagePayloadExtractor()
+    view = memoryview(body)
+    for i in range(0, len(view), CHUNK):
+        extractor.feed(bytes(view[i:i + CHUNK]))
+    return extractor.close()
+
+
+def _measure(func, body: bytes):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(body)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak, elapsed
+
+
+def main():
+    image = os.urandom(int(SIZE_MB * 1024 * 1024))
+    mb = 1024 * 1024
+    for wrap in (False, True):
+        body = _response_body(image, wrap)
+        # 响应体本身不计入（改造前 httpx 会整体读入，改造后只有当前分块）
+        old, old_peak, old_time = _measure(_before, body)
+        new, new_peak, new_time = _measure(_after, body)
+        assert old == new == image
+        print(f"{SIZE_MB:.0f} MB 图片，响应体 {len(body) / mb:.1f} MB{'（base64 按 76 列换行）' if wrap else ''}")
+        print(f"  model_dump + 正则  峰值 {old_peak / mb:6.1f} MB（图片的 {old_peak / len(image):.1f} 倍）  {old_time * 1000:6.0f} ms")
+        print(f"  增量提取           峰值 {new_peak / mb:6.1f} MB（图片的 {new_peak / len(image):.1f} 倍）  {new_time * 1000:6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""模型调用容错基准 - 不稳定上游下，无重试 vs 重试 vs 重试+对冲的任务失败率与 p50/p99 任务耗时
+
+每个模拟任务依次执行 5 次流式调用和 2 次出图调用（与真实管道的调用次数一致）。
+桩服务随机注入 503、流中断开与长尾延迟。
+
+用法: python bench_llm_resilience.py [任务数] [并发数]
+"""
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+import services.llm_engine as llm_engine
+import services.rate_limiter as rate_limiter
+import services.resilience as resilience
+from stub_openrouter import Fault, StubOpenRouter
+
+JOBS = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+BASE_LATENCY = 0.02
+ERROR_RATE = 0.08       # 503
+DROP_RATE = 0.04        # 流式响应中途断开
+SLOW_RATE = 0.03        # 长尾延迟
+SLOW_DELAY = 1.5
+
+
+def _flaky_fault() -> Fault:
+    r = random.random()
+    if r < ERROR_RATE:
+        return Fault(503)
+    r -= ERROR_RATE
+    if r < DROP_RATE:
+        return Fault(drop_after=2)
+    r -= DROP_RATE
+    if r < SLOW_RATE:
+        return Fault(delay=SLOW_DELAY)
+    return Fault()
+
+
+async def _job(i: int) -> bool:
+    messages = [{"role": "user", "content": f"任务 {i}"}]
+    try:
+        for _ in range(5):
+            await llm_engine.collect_completion(llm_engine.MODEL_GEMINI_PRO, messages, "bench-key")
+        for n in range(2):
+            if await llm_engine.step_6_generate_figure("流程图", n, "bench-key") is None:
+                return False
+        return True
+    except Exception:
+        return False
+
+
+async def _run(label: str, **config):
+    saved = {name: getattr(resilience, name) for name in config}
+    for name, value in config.items():
+        setattr(resilience, name, value)
+    resilience.latency = resilience.LatencyTracker()
+    random.seed(42)
+
+    stub = StubOpenRouter(text="专利说明书正文片段。" * 20, chunk_size=16, latency=BASE_LATENCY)
+    stub.fault_source = _flaky_fault
+    await stub.start()
+    llm_engine.OPENROUTER_BASE_URL = stub.base_url
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    durations, failures = [], 0
+
+    async def _timed(i: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            ok = await _job(i)
+            durations.append(time.perf_counter() - start)
+            failures += not ok
+
+    try:
+        await asyncio.gather(*(_timed(i) for i in range(JOBS)))
+    finally:
+        await llm_engine.aclose_clients()
+        await stub.stop()
+        for name, value in saved.items():
+            setattr(resilience, name, value)
+
+    durations.sort()
+    p50 = statistics.median(durations)
+    p99 = durations[max(0, int(len(durations) * 0.99) - 1)]
+    print(f"{label:<12} 失败率 {failures / JOBS:6.1%}  任务耗时 p50={p50:.2f}s p99={p99:.2f}s  "
+          f"请求数 {stub.requests}")
+
+
+async def main():
+    llm_engine.LLM_CACHE_ENABLED = False
+    # 只考察容错本身，关闭客户端限流
+    rate_limiter.LLM_RPM_LIMIT = rate_limiter.LLM_TPM_LIMIT = 0
+    print(f"任务 {JOBS} 个，并发 {CONCURRENCY}，503={ERROR_RATE:.0%} 断流={DROP_RATE:.0%} "
+          f"长尾={SLOW_RATE:.0%}({SLOW_DELAY}s)")
+    await _run("no-retry", LLM_RETRY_MAX_ATTEMPTS=1, LLM_HEDGE_PERCENTILE=0)
+    await _run("retry", LLM_RETRY_BASE_DELAY=0.05, LLM_HEDGE_PERCENTILE=0)
+    await _run("retry+hedge", LLM_RETRY_BASE_DELAY=0.05, LLM_HEDGE_PERCENTILE=90)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
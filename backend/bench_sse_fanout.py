@@ -0,0 +1,80 @@
+"""SSE 扇出基准 - 100 个订阅者下，事件驱动推送 vs 300ms 轮询的事件延迟与 CPU 占用
+
+用法: python bench_sse_fanout.py [订阅者数] [事件数]
+"""
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import api.routes as routes
+from services.event_log import decode_frames
+
+SUBSCRIBERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+EVENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+EVENT_INTERVAL = 0.01
+IDLE_SECONDS = 3.0
+
+
+async def _polling_stream(task_id: str):
+    """改造前的实现：每个客户端每 0.3 秒醒来一次检查新事件"""
+    offset = 0
+    while True:
+        t = routes.store.get(task_id)
+        data, offset = routes.store.read_frames(task_id, offset)
+        for frame in decode_frames(data):
+            yield f"data: {json.dumps(frame, ensure_ascii=False)}\n\n"
+        if t["status"] in ("completed", "failed"):
+            yield "data: {\"type\": \"done\"}\n\n"
+            break
+        await asyncio.sleep(0.3)
+
+
+async def _run(stream_factory, label: str):
+    task_id = f"bench-{label}"
+    routes.store.create(task_id, {"status": "processing", "files": {}, "figures": [], "error": ""})
+    latencies = []
+
+    async def _subscriber():
+        async for data in stream_factory(task_id):
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            for msg in decode_frames(data):
+                if msg.get("type") == "content":
+                    latencies.append(time.perf_counter() - msg["ts"])
+
+    subscribers = [asyncio.create_task(_subscriber()) for _ in range(SUBSCRIBERS)]
+    await asyncio.sleep(0.05)
+
+    # 空闲阶段：没有新事件时订阅者的开销（例如等待 LLM 首个 token、生成附图期间）
+    idle_start = time.process_time()
+    await asyncio.sleep(IDLE_SECONDS)
+    idle_cpu = time.process_time() - idle_start
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(EVENTS):
+        routes._push_chunk(task_id, "content", step="1", text="x", ts=time.perf_counter())
+        await asyncio.sleep(EVENT_INTERVAL)
+    routes._update_task(task_id, status="completed")
+    await asyncio.gather(*subscribers)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    routes.store.delete(task_id)
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<8} 延迟 p50={p50:7.2f}ms p99={p99:7.2f}ms  "
+          f"推送阶段 CPU={cpu:.2f}s / 墙钟 {wall:.2f}s  空闲 {IDLE_SECONDS:.0f}s CPU={idle_cpu:.3f}s")
+
+
+async def main():
+    print(f"订阅者 {SUBSCRIBERS} 个，事件 {EVENTS} 条，间隔 {EVENT_INTERVAL * 1000:.0f}ms")
+    await _run(_polling_stream, "polling")
+    await _run(routes._event_stream, "event")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
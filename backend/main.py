@@ -1,9 +1,49 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-app = FastAPI(title="Auto-Patent Architect API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 路由模块在下方导入，这里延迟引用
+    from api.routes import job_queue, store, SHUTDOWN_DRAIN_TIMEOUT
+    from services.llm_engine import aclose_clients
+    from services.pdf_extract import shutdown_pool
+    from services.figure_process import shutdown_figure_pool
+    from services.pdf_parser import HAS_MARKER
+    from services.ocr_worker import OCR_WARMUP, ocr_worker
+    from services.io_executor import shutdown_io
+    from services.loop_monitor import monitor as loop_monitor
+    loop_monitor.start()
+    await job_queue.start()
+    if OCR_WARMUP and HAS_MARKER:
+        # 后台加载 OCR 模型，不阻塞启动；进度见 /api/health
+        ocr_worker.warmup()
+    yield
+    # 不再接收新任务，等待执行中的管道完成
+    await job_queue.shutdown(timeout=SHUTDOWN_DRAIN_TIMEOUT)
+    # 提交任务存储中积攒的状态修改与事件
+    await asyncio.to_thread(store.flush)
+    await aclose_clients()
+    shutdown_pool()
+    await asyncio.to_thread(shutdown_figure_pool)
+    await asyncio.to_thread(ocr_worker.shutdown)
+    await asyncio.to_thread(shutdown_io)
+    await loop_monitor.stop()
+
+
+app = FastAPI(title="Auto-Patent Architect API", version="1.0.0", lifespan=lifespan)
+
+# 按 Content-Length 提前拒绝超大上传，避免整个请求体被接收并暂存后才检查大小；
+# 先于 CORS 添加，使 413 响应同样带有 CORS 头
+from services.uploads import MAX_TEMPLATE_REQUEST_BYTES, MAX_UPLOAD_REQUEST_BYTES, RequestSizeLimit
+app.add_middleware(
+    RequestSizeLimit,
+    limits={"/api/upload": MAX_UPLOAD_REQUEST_BYTES, "/api/templates": MAX_TEMPLATE_REQUEST_BYTES},
+)
 
 # CORS - must be added before routes
 app.add_middleware(
@@ -0,0 +1,55 @@
+"""
+Broadcaster - 按任务划分的事件通知
+生产者推送 SSE 事件后调用 publish() 立即唤醒该任务的全部订阅者，取代定时轮询。
+publish() 为同步调用，需在事件循环线程中执行。
+"""
+import asyncio
+from typing import Dict, Optional
+
+
+class Broadcaster:
+    """每个任务一个“代”事件：publish 时置位当前代并换新，订阅者等待当前代"""
+
+    def __init__(self):
+        self._events: Dict[str, asyncio.Event] = {}
+        self._subscribers: Dict[str, int] = {}
+
+    def subscribe(self, task_id: str):
+        self._subscribers[task_id] = self._subscribers.get(task_id, 0) + 1
+
+    def unsubscribe(self, task_id: str):
+        """最后一个订阅者离开时释放该任务的事件对象"""
+        count = self._subscribers.get(task_id, 0) - 1
+        if count > 0:
+            self._subscribers[task_id] = count
+        else:
+            self._subscribers.pop(task_id, None)
+            self._events.pop(task_id, None)
+
+    def subscriber_count(self, task_id: str) -> int:
+        return self._subscribers.get(task_id, 0)
+
+    def listen(self, task_id: str) -> asyncio.Event:
+        """
+        取得当前代事件。订阅者应先 listen() 再读取新消息，
+        这样读取期间发生的 publish 也会使随后的 wait() 立即返回。
+        """
+        event = self._events.get(task_id)
+        if event is None:
+            event = self._events[task_id] = asyncio.Event()
+        return event
+
+    def publish(self, task_id: str):
+        """唤醒正在等待该任务的全部订阅者"""
+        event = self._events.pop(task_id, None)
+        if event is not None:
+            event.set()
+
+    @staticmethod
+    async def wait(event: asyncio.Event, timeout: Optional[float]) -> bool:
+        """等待事件置位；超时返回 False"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
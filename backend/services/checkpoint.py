@@ -0,0 +1,34 @@
+"""
+Checkpoint Store - 管道步骤检查点
+每个步骤的输出以 JSON 文件保存在 output/<task_id>/checkpoints/ 下，
+任务失败后可从第一个缺失的步骤继续执行。
+"""
+import json
+import os
+from typing import Any
+
+
+class CheckpointStore:
+    """单个任务的步骤检查点读写"""
+
+    def __init__(self, task_dir: str):
+        self.directory = os.path.join(task_dir, "checkpoints")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def has(self, name: str) -> bool:
+        return os.path.exists(self._path(name))
+
+    def load(self, name: str) -> Any:
+        with open(self._path(name), "r", encoding="utf-8") as f:
+            return json.load(f)["value"]
+
+    def save(self, name: str, value: Any):
+        """原子写入：先写临时文件再替换，避免中断时留下半截检查点"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"value": value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
@@ -0,0 +1,55 @@
+"""
+Chunk Batcher - 合并连续的 content 增量为批量 SSE 帧
+同一任务同一步骤的 content 文本先缓冲，在达到字符上限或时间窗口到期时合并为一条消息发出；
+其他类型的事件（step / log / file_ready 等）发出前先冲刷该任务的缓冲，保证相对顺序不变。
+需在事件循环线程中调用。
+"""
+import asyncio
+import os
+from typing import Any, Callable, Dict, List, Tuple
+
+SSE_BATCH_WINDOW = float(os.getenv("SSE_BATCH_WINDOW_MS", "50")) / 1000
+SSE_BATCH_MAX_CHARS = int(os.getenv("SSE_BATCH_MAX_CHARS", "4096"))
+
+
+class ChunkBatcher:
+    """按 (任务, 步骤) 缓冲 content 文本"""
+
+    def __init__(
+        self,
+        emit: Callable[[str, Dict[str, Any]], None],
+        window: float = SSE_BATCH_WINDOW,
+        max_chars: int = SSE_BATCH_MAX_CHARS,
+    ):
+        self.emit = emit
+        self.window = window
+        self.max_chars = max_chars
+        # task_id -> {step: [文本片段, ...]}，dict 保持各步骤首次出现的顺序
+        self._pending: Dict[str, Dict[str, List[str]]] = {}
+        self._sizes: Dict[Tuple[str, str], int] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+    def add(self, task_id: str, step: str, text: str):
+        """缓冲一段 content 文本"""
+        steps = self._pending.setdefault(task_id, {})
+        steps.setdefault(step, []).append(text)
+        key = (task_id, step)
+        self._sizes[key] = self._sizes.get(key, 0) + len(text)
+
+        if self._sizes[key] >= self.max_chars or self.window <= 0:
+            self.flush(task_id)
+        elif task_id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[task_id] = loop.call_later(self.window, self.flush, task_id)
+
+    def flush(self, task_id: str):
+        """立即发出该任务全部缓冲的 content"""
+        timer = self._timers.pop(task_id, None)
+        if timer is not None:
+            timer.cancel()
+        steps = self._pending.pop(task_id, None)
+        if not steps:
+            return
+        for step, parts in steps.items():
+            self._sizes.pop((task_id, step), None)
+            self.emit(task_id, {"type": "content", "step": step, "text": "".join(parts)})
@@ -0,0 +1,99 @@
+"""
+Pipeline DAG - 按依赖关系调度的异步步骤执行器
+每个节点在其全部依赖完成后立即启动，互不依赖的节点并发执行。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+# 节点函数：接收已完成节点的结果字典，返回本节点结果
+NodeFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+# 节点完成回调：(节点名, 结果)
+DoneCallback = Callable[[str, Any], None]
+
+
+class PipelineDAG:
+    """有向无环图形式的管道执行器"""
+
+    def __init__(self):
+        self._nodes: Dict[str, NodeFunc] = {}
+        self._deps: Dict[str, List[str]] = {}
+
+    def add(self, name: str, func: NodeFunc, deps: Iterable[str] = ()) -> "PipelineDAG":
+        """注册节点；deps 中的节点必须先于本节点完成"""
+        if name in self._nodes:
+            raise ValueError(f"节点 {name} 重复注册")
+        self._nodes[name] = func
+        self._deps[name] = list(deps)
+        return self
+
+    def _check(self):
+        """校验依赖存在且无环"""
+        for name, deps in self._deps.items():
+            for dep in deps:
+                if dep not in self._nodes:
+                    raise ValueError(f"节点 {name} 依赖未注册的节点 {dep}")
+
+        visiting, visited = set(), set()
+
+        def _visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"管道存在循环依赖: {name}")
+            visiting.add(name)
+            for dep in self._deps[name]:
+                _visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self._nodes:
+            _visit(name)
+
+    async def run(
+        self,
+        initial: Optional[Dict[str, Any]] = None,
+        on_done: Optional[DoneCallback] = None,
+    ) -> Dict[str, Any]:
+        """
+        执行全部节点并返回结果字典。
+        每个节点完成时调用 on_done（并发节点按各自的完成顺序）；initial 中已给出结果的节点不回调。
+        任一节点失败时取消其余节点，并抛出最先发生的异常。
+        """
+        self._check()
+        results: Dict[str, Any] = dict(initial or {})
+        futures: Dict[str, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+
+        for name in self._nodes:
+            futures[name] = loop.create_future()
+            if name in results:
+                futures[name].set_result(results[name])
+
+        async def _run_node(name: str):
+            for dep in self._deps[name]:
+                await futures[dep]
+            value = await self._nodes[name](results)
+            results[name] = value
+            futures[name].set_result(value)
+            if on_done is not None:
+                on_done(name, value)
+
+        tasks = [
+            asyncio.create_task(_run_node(name), name=f"dag:{name}")
+            for name in self._nodes
+            if name not in results
+        ]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for fut in futures.values():
+                if not fut.done():
+                    fut.cancel()
+        return results
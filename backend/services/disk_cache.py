@@ -0,0 +1,134 @@
+"""
+Disk Cache - 基于文件的持久化 LRU 缓存
+每个条目存为一个文件：mtime 记录写入时间（用于 TTL），atime 记录最近访问时间（用于 LRU 淘汰）。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class DiskCache:
+    """容量受限的磁盘 LRU 缓存，可选 TTL"""
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        ttl: Optional[float] = None,
+        suffix: str = ".bin",
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: Optional["OrderedDict[str, int]"] = None  # key -> size，按访问时间排序
+        self._total = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _load_index(self):
+        """首次使用时扫描缓存目录，按最近访问时间重建 LRU 顺序"""
+        if self._index is not None:
+            return
+        entries = []
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if not name.endswith(self.suffix):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((st.st_atime, name[: -len(self.suffix)], st.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self._total = sum(self._index.values())
+
+    def _forget(self, key: str):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total -= size
+
+    def _remove(self, key: str):
+        self._forget(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取缓存条目；未命中或已过期返回 None"""
+        with self._lock:
+            self._load_index()
+            path = self._path(key)
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._forget(key)
+                self.misses += 1
+                return None
+
+            if self.ttl is not None and time.time() - st.st_mtime > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                self._forget(key)
+                self.misses += 1
+                return None
+
+            # 刷新访问时间，保留写入时间
+            try:
+                os.utime(path, (time.time(), st.st_mtime))
+            except OSError:
+                pass
+            if key not in self._index:
+                # 可能由其他进程写入
+                self._total += st.st_size
+            self._index[key] = st.st_size
+            self._index.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def set(self, key: str, value: bytes):
+        """写入缓存条目（原子替换），随后按容量淘汰最久未访问的条目"""
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._load_index()
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+
+            self._forget(key)
+            self._index[key] = len(value)
+            self._total += len(value)
+
+            while self._total > self.max_bytes and len(self._index) > 1:
+                oldest = next(iter(self._index))
+                self._remove(oldest)
+
+    def stats(self) -> Dict[str, int]:
+        """命中 / 未命中计数与当前占用"""
+        with self._lock:
+            self._load_index()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
@@ -1,10 +1,109 @@
+import io
 import os
 import re
+import copy
+import operator
+from typing import List, Optional, Tuple
+
 from docx import Document
 from docx.shared import Pt, Cm
 from docx.oxml.ns import qn, nsdecls
 from docx.oxml import parse_xml
 from docx.enum.text import WD_LINE_SPACING, WD_ALIGN_PARAGRAPH
+from docx.image.exceptions import InvalidImageStreamError, UnexpectedEndOfFileError, UnrecognizedImageError
+
+# 说明书附图中每张图的最大显示宽度与高度（按比例缩放，不超出版心）
+FIGURE_MAX_WIDTH = Cm(15)
+FIGURE_MAX_HEIGHT = Cm(20)
+_IMAGE_ERRORS = (InvalidImageStreamError, UnexpectedEndOfFileError, UnrecognizedImageError)
+
+# 段落描述：(文本, 是否加粗, 对齐方式)
+ParagraphSpec = Tuple[str, bool, Optional[WD_ALIGN_PARAGRAPH]]
+
+
+# ==================== Markdown 清洗 ====================
+# 各步替换在模块加载时预编译，按固定顺序执行（后一步作用于前一步的结果，顺序不可调换）；
+# 文本中不含某步的触发字符时直接跳过该步，不做整段扫描。
+# 注意：这里只省去了重复编译与无关步骤的扫描，各步仍是对文本的独立一遍替换，并未合并成更少的遍数。
+
+_FENCE_RE = re.compile(r'```[\s\S]*?```')
+_BOLD_ITALIC_RE = re.compile(r'\*\*\*(.*?)\*\*\*')   # ***bold italic***
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')                # **bold**
+_ITALIC_RE = re.compile(r'\*(.*?)\*')                    # *italic*
+_UNDERSCORE_BOLD_RE = re.compile(r'__(.*?)__')           # __bold__
+_UNDERSCORE_ITALIC_RE = re.compile(r'_(.*?)_')           # _italic_
+# 标题标记 # ## ### etc.，等价于 (?m)^#{1,6}\s+：以字面量 # 开头便于快速定位，后顾断言保证 # 位于行首
+_HEADING_RE = re.compile(r'#(?<![^\n]#)#{0,5}\s+')
+_BULLET_RE = re.compile(r'^[\-\*]\s+', re.MULTILINE)     # - item / * item
+_LINK_RE = re.compile(r'\[([^\]]+)\]\([^\)]+\)')         # [text](url) -> text
+_IMAGE_RE = re.compile(r'!\[([^\]]*)\]\([^\)]+\)')       # ![alt](url) -> （图片：alt）
+_RULE_RE = re.compile(r'^[\-\*\_]{3,}\s*$', re.MULTILINE)  # 水平分割线
+
+# 替换为第 1 组：等价于模板 r'\1'，但在 C 层取组，不必逐个匹配展开模板（各模式的第 1 组总会参与匹配）
+_group1 = operator.methodcaller('group', 1)
+
+
+def _strip_fences(text: str) -> str:
+    text = _FENCE_RE.sub(lambda m: m.group().replace('```', ''), text)
+    return text.replace('```', '')
+
+
+def _strip_emphasis(text: str) -> str:
+    text = _BOLD_ITALIC_RE.sub(_group1, text)
+    text = _BOLD_RE.sub(_group1, text)
+    return _ITALIC_RE.sub(_group1, text)
+
+
+def _strip_underscores(text: str) -> str:
+    text = _UNDERSCORE_BOLD_RE.sub(_group1, text)
+    return _UNDERSCORE_ITALIC_RE.sub(_group1, text)
+
+
+def _squeeze_blank_lines(text: str) -> str:
+    """连续 3 个及以上换行压缩为 2 个（等价于 re.sub(r'\\n{3,}', '\\n\\n')，用 str.replace 更快）"""
+    while '\n\n\n' in text:
+        text = text.replace('\n\n\n', '\n\n')
+    return text
+
+
+def _fences_closed(text: str) -> bool:
+    return text.count('```') % 2 == 0
+
+
+def _last_line_plain(text: str) -> bool:
+    """末尾非空白字符不是 #、-、*、_，行首类匹配（其 \\s 可跨行）不会越过文本末尾"""
+    stripped = text.rstrip()
+    return not stripped or stripped[-1] not in '#-*_'
+
+
+def _brackets_closed(text: str) -> bool:
+    """最后一个 [ 与 ( 之后都有对应的闭合符号，链接 / 图片匹配不会越过文本末尾"""
+    return text.rfind('[') <= text.rfind(']') and text.rfind('(') <= text.rfind(')')
+
+
+# (触发子串, 替换函数, 切分检查)：文本含任一触发子串时才执行替换；
+# 切分检查供 MarkdownCleaner 判断该步的匹配能否越过段落边界，None 表示匹配不跨行
+_MD_STAGES = [
+    (('```',), _strip_fences, _fences_closed),
+    (('*',), _strip_emphasis, None),
+    (('_',), _strip_underscores, None),
+    (('#',), lambda t: _HEADING_RE.sub('', t), _last_line_plain),
+    (('-', '*'), lambda t: _BULLET_RE.sub('', t), _last_line_plain),
+    (('](',), lambda t: _LINK_RE.sub(_group1, t), _brackets_closed),
+    (('](',), lambda t: _IMAGE_RE.sub(lambda m: f'（图片：{m.group(1)}）', t), _brackets_closed),
+    (('-', '*', '_'), lambda t: _RULE_RE.sub('', t), _last_line_plain),
+    (('\n\n\n',), _squeeze_blank_lines, None),
+]
+
+
+def _run_stages(text: str, check_cut: bool = False) -> Optional[str]:
+    """依次执行各步替换；check_cut 时任一步的匹配可能越过文本末尾则返回 None"""
+    for triggers, apply, cut_check in _MD_STAGES:
+        if check_cut and cut_check is not None and not cut_check(text):
+            return None
+        if any(t in text for t in triggers):
+            text = apply(text)
+    return text
 
 
 def clean_markdown(text: str) -> str:
@@ -16,39 +115,77 @@ def clean_markdown(text: str) -> str:
     - 去除代码块标记 ```
     - 去除多余空行
     """
-    # 去除代码块标记
-    text = re.sub(r'```[\s\S]*?```', lambda m: m.group().replace('```', ''), text)
-    text = text.replace('```', '')
-
-    # 去除加粗和斜体标记
-    text = re.sub(r'\*\*\*(.*?)\*\*\*', r'\1', text)  # ***bold italic***
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)        # **bold**
-    text = re.sub(r'\*(.*?)\*', r'\1', text)             # *italic*
-    text = re.sub(r'__(.*?)__', r'\1', text)             # __bold__
-    text = re.sub(r'_(.*?)_', r'\1', text)               # _italic_
-
-    # 去除标题标记 (# ## ### etc.)
-    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
-
-    # 去除无序列表标记 (- item / * item)
-    text = re.sub(r'^[\-\*]\s+', '', text, flags=re.MULTILINE)
+    return _run_stages(text).strip()
 
-    # 去除有序列表多余标记（保留数字编号）
-    # 例如 "1. " 保留为 "1. "
 
-    # 去除链接标记 [text](url) -> text
-    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+# 每次最多尝试的候选切分点数（未闭合的代码块等情况下等待更多输出）
+_MAX_CUT_ATTEMPTS = 4
+# 待清洗部分达到该长度才尝试切分，避免每个小 chunk 都扫描一遍
+_MIN_CUT_CHARS = 256
 
-    # 去除图片标记 ![alt](url) -> (图片: alt)
-    text = re.sub(r'!\[([^\]]*)\]\([^\)]+\)', r'（图片：\1）', text)
 
-    # 去除水平分割线
-    text = re.sub(r'^[\-\*\_]{3,}\s*$', '', text, flags=re.MULTILINE)
-
-    # 压缩多个连续空行为一个
-    text = re.sub(r'\n{3,}', '\n\n', text)
+class MarkdownCleaner:
+    """
+    流式 Markdown 清洗：边接收模型输出边清洗，结果与对完整文本调用 clean_markdown 完全一致。
+    只在空行处、且确认各步替换都不会跨过该处时切分，已切分部分清洗后即为最终结果；
+    各部分末尾的空白暂不输出，与下一部分拼接后再处理连续换行（整段清洗时它们属于同一段换行）。
+    """
 
-    return text.strip()
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """丢弃已接收的内容（上游重新生成时调用）"""
+        self._pending = ""
+        self._held = ""
+        self._parts: List[str] = []
+        self._started = False
+
+    def _emit(self, cleaned: str) -> str:
+        text = self._held + cleaned
+        if self._held:
+            text = _squeeze_blank_lines(text)
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        body = text.rstrip()
+        self._held = text[len(body):]
+        self._parts.append(body)
+        return body
+
+    def _find_cut(self) -> Optional[Tuple[int, str]]:
+        """从后往前找可以切分的空行，返回 (切分位置, 切分前部分的清洗结果)"""
+        pos = len(self._pending)
+        for _ in range(_MAX_CUT_ATTEMPTS):
+            pos = self._pending.rfind("\n\n", 0, pos)
+            if pos < 0:
+                return None
+            cut = pos + 2
+            if cut < len(self._pending):
+                # 空行后紧跟非空白字符，行首类匹配的 \\s 不会从切分前延伸过来
+                if not self._pending[cut].isspace():
+                    cleaned = _run_stages(self._pending[:cut], check_cut=True)
+                    if cleaned is not None:
+                        return cut, cleaned
+        return None
+
+    def feed(self, chunk: str) -> str:
+        """追加一段输出，返回新确定的清洗文本（可能为空）；已确定的部分同时累积，close() 时一并返回"""
+        self._pending += chunk
+        if "\n" not in chunk or len(self._pending) < _MIN_CUT_CHARS:
+            return ""
+        found = self._find_cut()
+        if found is None:
+            return ""
+        cut, cleaned = found
+        self._pending = self._pending[cut:]
+        return self._emit(cleaned)
+
+    def close(self) -> str:
+        """输出结束，清洗剩余部分，返回完整的清洗结果"""
+        self._emit(_run_stages(self._pending))
+        self._pending = self._held = ""
+        return "".join(self._parts)
 
 
 class PatentDocGenerator:
@@ -59,6 +196,8 @@ class PatentDocGenerator:
         self.font_name_fallback = "FangSong"
         self.font_size = Pt(12)   # 小四号
         self.line_spacing = Pt(28)  # 固定行距 28 磅
+        self._base_docx: Optional[bytes] = None  # 已设置样式的基础文档（序列化字节）
+        self._prototypes = {}  # (加粗, 对齐) -> 段落原型元素
 
     def _apply_font(self, run):
         """为单个 Run 设置中文字体"""
@@ -102,17 +241,59 @@ class PatentDocGenerator:
         self._apply_font(run)
         return p
 
-    def generate_specification(self, title: str, content: str, output_path: str) -> str:
-        """生成说明书 .docx"""
-        doc = Document()
-        self._set_style(doc)
+    def _new_document(self):
+        """
+        从预先设置好样式的基础文档克隆一份新文档。
+        基础文档只在首次使用时构建并序列化一次，之后每份输出只需从内存字节加载。
+        """
+        if self._base_docx is None:
+            doc = Document()
+            self._set_style(doc)
+            buf = io.BytesIO()
+            doc.save(buf)
+            self._base_docx = buf.getvalue()
+        return Document(io.BytesIO(self._base_docx))
+
+    def _prototype(self, bold: bool, alignment):
+        """
+        某种格式的段落原型（含段落属性与设置好字体的空 Run），按格式缓存。
+        原型由 _add_paragraph 生成，保证批量输出的 XML 与逐段添加完全一致。
+        """
+        key = (bold, alignment)
+        proto = self._prototypes.get(key)
+        if proto is None:
+            scratch = Document()
+            proto = self._add_paragraph(scratch, "", bold=bold, alignment=alignment)._p
+            self._prototypes[key] = proto
+        return proto
+
+    def _emit_paragraphs(self, doc, paragraphs: List[ParagraphSpec]):
+        """批量写入段落：复制原型元素并填入文本，直接插入正文（节属性之前）"""
+        sect_pr = doc.element.body.find(qn("w:sectPr"))
+        for text, bold, alignment in paragraphs:
+            p = copy.deepcopy(self._prototype(bold, alignment))
+            # CT_R.text 保留 rPr，按 python-docx 规则把 \t、\n 转为 w:tab、w:br
+            p.r_lst[-1].text = text
+            sect_pr.addprevious(p)
+
+    def _write(self, paragraphs: List[ParagraphSpec], output_path: str) -> str:
+        doc = self._new_document()
+        self._emit_paragraphs(doc, paragraphs)
+        doc.save(output_path)
+        return output_path
 
+    def specification_paragraphs(self, title: str, content: str, clean: bool = True) -> List[ParagraphSpec]:
+        """
+        说明书的段落列表：标题居中加粗，章节标题加粗不编号，其余段落加 [000x] 编号。
+        clean=False 表示标题与正文已由 MarkdownCleaner 流式清洗过。
+        """
         # 清洗 Markdown 标记
-        content = clean_markdown(content)
-        title = clean_markdown(title)
+        if clean:
+            content = clean_markdown(content)
+            title = clean_markdown(title)
 
         # 标题
-        self._add_paragraph(doc, title, bold=True, alignment=WD_ALIGN_PARAGRAPH.CENTER)
+        paragraphs: List[ParagraphSpec] = [(title, True, WD_ALIGN_PARAGRAPH.CENTER)]
 
         # 按段落拆分并添加 [000x] 编号
         counter = 1
@@ -131,44 +312,66 @@ class PatentDocGenerator:
             # 检测章节标题（不编号）
             is_section = any(kw in stripped for kw in section_keywords)
             if is_section:
-                self._add_paragraph(doc, stripped, bold=True)
+                paragraphs.append((stripped, True, None))
             else:
                 num_str = f"[{counter:04d}]"
-                self._add_paragraph(doc, f"{num_str} {stripped}")
+                paragraphs.append((f"{num_str} {stripped}", False, None))
                 counter += 1
 
-        doc.save(output_path)
-        return output_path
+        return paragraphs
 
-    def generate_claims(self, claims_text: str, output_path: str) -> str:
-        """生成权利要求书 .docx"""
-        doc = Document()
-        self._set_style(doc)
+    def generate_specification(self, title: str, content: str, output_path: str, clean: bool = True) -> str:
+        """生成说明书 .docx；clean=False 表示文本已由 MarkdownCleaner 流式清洗过"""
+        return self._write(self.specification_paragraphs(title, content, clean), output_path)
 
+    def generate_claims(self, claims_text: str, output_path: str, clean: bool = True) -> str:
+        """生成权利要求书 .docx；clean=False 表示文本已由 MarkdownCleaner 流式清洗过"""
         # 清洗 Markdown 标记
-        claims_text = clean_markdown(claims_text)
-
-        self._add_paragraph(doc, "权利要求书", bold=True, alignment=WD_ALIGN_PARAGRAPH.CENTER)
+        if clean:
+            claims_text = clean_markdown(claims_text)
 
+        paragraphs: List[ParagraphSpec] = [("权利要求书", True, WD_ALIGN_PARAGRAPH.CENTER)]
         for line in claims_text.split("\n"):
             stripped = line.strip()
             if stripped:
-                self._add_paragraph(doc, stripped)
-
-        doc.save(output_path)
-        return output_path
+                paragraphs.append((stripped, False, None))
 
-    def generate_abstract(self, abstract_text: str, output_path: str) -> str:
-        """生成说明书摘要 .docx"""
-        doc = Document()
-        self._set_style(doc)
+        return self._write(paragraphs, output_path)
 
+    def generate_abstract(self, abstract_text: str, output_path: str, clean: bool = True) -> str:
+        """生成说明书摘要 .docx；clean=False 表示文本已由 MarkdownCleaner 流式清洗过"""
         # 清洗 Markdown 标记
-        abstract_text = clean_markdown(abstract_text)
-
-        self._add_paragraph(doc, "说明书摘要", bold=True, alignment=WD_ALIGN_PARAGRAPH.CENTER)
-        self._add_paragraph(doc, abstract_text.strip())
-
+        if clean:
+            abstract_text = clean_markdown(abstract_text)
+
+        return self._write([
+            ("说明书摘要", True, WD_ALIGN_PARAGRAPH.CENTER),
+            (abstract_text.strip(), False, None),
+        ], output_path)
+
+    def generate_figures(self, figures: List[Tuple[str, str]], output_path: str) -> str:
+        """
+        生成说明书附图 .docx：标题后每张图单独居中成段，图下方居中标注图号。
+        figures 为 (图号, 图片路径) 列表，如 ("图1", "output/xxx/图1.png")。
+        """
+        doc = self._new_document()
+        self._emit_paragraphs(doc, [("说明书附图", True, WD_ALIGN_PARAGRAPH.CENTER)])
+        for caption, path in figures:
+            p = doc.add_paragraph()
+            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            # 正文为固定行距，图片段落改为单倍行距，否则图片会被裁成一行高
+            p.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
+            try:
+                shape = p.add_run().add_picture(path, width=FIGURE_MAX_WIDTH)
+            except _IMAGE_ERRORS as e:
+                # 模型返回的数据不是可识别的图片时跳过该图，不影响其余附图
+                p._p.getparent().remove(p._p)
+                print(f"[Doc Generator] {caption} 无法嵌入说明书附图: {type(e).__name__}")
+                continue
+            if shape.height > FIGURE_MAX_HEIGHT:
+                shape.width = int(shape.width * FIGURE_MAX_HEIGHT / shape.height)
+                shape.height = FIGURE_MAX_HEIGHT
+            self._emit_paragraphs(doc, [(caption, False, WD_ALIGN_PARAGRAPH.CENTER)])
         doc.save(output_path)
         return output_path
 
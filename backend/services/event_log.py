@@ -0,0 +1,120 @@
+"""
+Event Log - 预编码 SSE 帧的追加式日志
+每条事件编码一次为 "data: {...}\\n\\n" 帧，追加写入磁盘文件；订阅者以字节偏移量续读。
+写入进程在内存中只保留最近若干帧的环形缓冲，任务结束后关闭即释放，
+迟到的订阅者（包括其他 worker 进程）直接从文件偏移 0 回放。
+帧先攒在内存中，满 EVENT_FLUSH_FRAMES 帧或调用 flush() 时一次写盘；
+未写盘的帧数不超过环形缓冲容量，本进程的订阅者总能从内存读到它们。
+"""
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Tuple
+
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", os.path.join("temp", "events"))
+# 写入进程内存中保留的最近帧数
+EVENT_RING_SIZE = int(os.getenv("EVENT_RING_SIZE", "64"))
+# 攒够多少帧写一次盘（不超过 EVENT_RING_SIZE）
+EVENT_FLUSH_FRAMES = int(os.getenv("EVENT_FLUSH_FRAMES", "16"))
+# 单次从文件回放的最大字节数
+EVENT_READ_CHUNK = 256 * 1024
+
+FRAME_END = b"\n\n"
+
+
+def encode_frame(msg: Dict[str, Any]) -> bytes:
+    """编码为 SSE data 帧（JSON 中的换行均被转义，帧内不会出现空行）"""
+    return f"data: {json.dumps(msg, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def decode_frames(data: bytes) -> List[Dict[str, Any]]:
+    """将若干完整帧解码回事件字典"""
+    return [
+        json.loads(frame[len(b"data: "):])
+        for frame in data.split(FRAME_END)
+        if frame.startswith(b"data: ")
+    ]
+
+
+def event_log_path(task_id: str) -> str:
+    return os.path.join(EVENT_LOG_DIR, f"{task_id}.sse")
+
+
+class EventLog:
+    """单个任务的事件日志（写入端）"""
+
+    def __init__(self, path: str, ring_size: int = EVENT_RING_SIZE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 无缓冲追加写：攒下的帧一次 write，写完其他进程立即可读
+        self._file = open(path, "ab", buffering=0)
+        self._size = self._file.seek(0, os.SEEK_END)
+        self._ring: Deque[Tuple[int, bytes]] = deque(maxlen=ring_size)
+        self._pending: List[bytes] = []
+        self._flush_frames = max(1, min(EVENT_FLUSH_FRAMES, ring_size))
+        # 事件循环追加、存储的后台线程定时 flush
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def append(self, msg: Dict[str, Any]):
+        frame = encode_frame(msg)
+        with self._lock:
+            self._pending.append(frame)
+            self._ring.append((self._size, frame))
+            self._size += len(frame)
+            if len(self._pending) >= self._flush_frames:
+                self._write_pending()
+
+    def flush(self):
+        """把攒下的帧写盘"""
+        with self._lock:
+            if self._pending and not self._file.closed:
+                self._write_pending()
+
+    def _write_pending(self):
+        self._file.write(b"".join(self._pending))
+        self._pending.clear()
+
+    def read(self, offset: int) -> Tuple[bytes, int]:
+        """读取 offset 之后的帧；最近的帧直接取自内存，更早的从文件读取"""
+        with self._lock:
+            size = self._size
+            if offset >= size:
+                return b"", offset
+            if self._ring and offset >= self._ring[0][0]:
+                frames = [frame for start, frame in self._ring if start >= offset]
+                return b"".join(frames), size
+        # 早于环形缓冲的部分都已写盘
+        return read_log_file(self.path, offset)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._file.close()
+            self._ring.clear()
+
+
+def read_log_file(path: str, offset: int) -> Tuple[bytes, int]:
+    """从日志文件读取 offset 之后的完整帧（不含写入中途的半帧），返回数据与新偏移"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(EVENT_READ_CHUNK)
+            if len(data) == EVENT_READ_CHUNK and FRAME_END not in data:
+                # 单帧超过一次读取的上限
+                data += f.read()
+    except FileNotFoundError:
+        return b"", offset
+    end = data.rfind(FRAME_END)
+    if end < 0:
+        return b"", offset
+    data = data[:end + len(FRAME_END)]
+    return data, offset + len(data)
@@ -0,0 +1,121 @@
+"""
+Figure Process - 附图后处理
+图片模型返回的多为 4K 彩色/灰度 PNG，专利附图只需要黑白线条图：在进程池中把原图缩放到
+FIGURE_DPI 下的印刷宽度、按阈值二值化为 1 位黑白图并以优化压缩重新编码，同时生成图库用的小缩略图。
+模型返回的原图另存到 originals/ 下不做改动，图N.png 替换为处理后的版本（打包与 docx 使用的都是它）。
+依赖 Pillow；未安装或 FIGURE_POSTPROCESS=0 时跳过，图N.png 即原图。
+子进程以 spawn 方式启动，只导入本模块与 Pillow。
+"""
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+HAS_PIL = importlib.util.find_spec("PIL") is not None
+
+FIGURE_POSTPROCESS = os.getenv("FIGURE_POSTPROCESS", "1") == "1"
+FIGURE_DPI = int(os.getenv("FIGURE_DPI", "300"))
+# 印刷宽度（厘米），与说明书附图 docx 中的图宽一致
+FIGURE_PRINT_WIDTH_CM = float(os.getenv("FIGURE_PRINT_WIDTH_CM", "15"))
+FIGURE_MAX_WIDTH_PX = round(FIGURE_DPI * FIGURE_PRINT_WIDTH_CM / 2.54)
+# 灰度低于阈值的像素记为黑色
+FIGURE_THRESHOLD = int(os.getenv("FIGURE_THRESHOLD", "160"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))
+FIGURE_PROCESS_WORKERS = int(os.getenv("FIGURE_PROCESS_WORKERS", str(min(2, os.cpu_count() or 1))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def enabled() -> bool:
+    return FIGURE_POSTPROCESS and HAS_PIL
+
+
+def thumbnail_path(fig_path: str) -> str:
+    """缩略图放在任务目录的 thumbs/ 下，与附图同名（不参与 图N.png 的恢复与打包）"""
+    return os.path.join(os.path.dirname(fig_path), "thumbs", os.path.basename(fig_path))
+
+
+def original_path(fig_path: str) -> str:
+    """模型返回的原图保存在任务目录的 originals/ 下，与附图同名"""
+    return os.path.join(os.path.dirname(fig_path), "originals", os.path.basename(fig_path))
+
+
+def _keep_original(fig_path: str) -> str:
+    """首次处理前把原图复制到 originals/；已保存过时直接返回（重复处理总是从原图开始）"""
+    orig_path = original_path(fig_path)
+    if not os.path.exists(orig_path):
+        os.makedirs(os.path.dirname(orig_path), exist_ok=True)
+        shutil.copyfile(fig_path, orig_path + ".tmp")
+        os.replace(orig_path + ".tmp", orig_path)
+    return orig_path
+
+
+def process_figure(fig_path: str, thumb_path: str) -> Dict:
+    """
+    二值化并压缩单张附图替换 图N.png，原图保留在 originals/；同时写出缩略图（在子进程中执行）。
+    先写临时文件再替换，处理中途失败时 图N.png 仍是完整的图片。
+    """
+    from PIL import Image
+
+    orig_path = _keep_original(fig_path)
+    before = os.path.getsize(orig_path)
+    with Image.open(orig_path) as img:
+        gray = img.convert("L")
+    if gray.width > FIGURE_MAX_WIDTH_PX:
+        height = max(1, round(gray.height * FIGURE_MAX_WIDTH_PX / gray.width))
+        gray = gray.resize((FIGURE_MAX_WIDTH_PX, height), Image.LANCZOS)
+
+    line_art = gray.point(lambda v: 255 if v >= FIGURE_THRESHOLD else 0, mode="1")
+    tmp_path = fig_path + ".tmp"
+    line_art.save(tmp_path, format="PNG", optimize=True, dpi=(FIGURE_DPI, FIGURE_DPI))
+    os.replace(tmp_path, fig_path)
+
+    # 缩略图由黑白图转灰度后缩小，缩小时抗锯齿，细线条在小尺寸下不至于断开
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    thumb = line_art.convert("L")
+    thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+    tmp_path = thumb_path + ".tmp"
+    thumb.save(tmp_path, format="PNG", optimize=True)
+    os.replace(tmp_path, thumb_path)
+
+    return {
+        "before": before,
+        "after": os.path.getsize(fig_path),
+        "thumbnail": os.path.getsize(thumb_path),
+        "size": line_art.size,
+    }
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(FIGURE_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_figure_pool(wait: bool = True):
+    """关闭附图处理进程池（应用关闭时调用）"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+async def postprocess_figure(fig_path: str) -> Optional[Dict]:
+    """在进程池中处理附图；未启用或处理失败时返回 None，原图保持不变"""
+    if not enabled():
+        return None
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), process_figure, fig_path, thumbnail_path(fig_path))
+    except BrokenProcessPool:
+        print("[Figure Process] 处理进程异常退出，保留原图")
+        shutdown_figure_pool(wait=False)
+    except Exception as e:
+        # 模型返回的数据无法识别为图片等情况
+        print(f"[Figure Process] {os.path.basename(fig_path)} 处理失败，保留原图: {type(e).__name__}: {e}")
+    return None
@@ -0,0 +1,132 @@
+"""
+Image Payload - 从图片接口的原始响应体中增量提取 base64 图片
+响应体按网络分块边收边扫：找到 "base64," 前缀后，把其后的 base64 字符按 4 字节对齐逐块解码，
+直接追加到一个 bytearray 中，遇到字符串结束的引号（或其他非 base64 字符）即停止。
+不构造整份 JSON / model_dump 字典，也不对多兆字节的字符串做正则匹配与 replace，
+内存中基本只有解码后的图片字节一份。
+前缀之外的少量 JSON 正文照常保留，未找到 data URI 时据此兼容纯 base64 字符串的旧格式。
+"""
+import base64
+import binascii
+import json
+import re
+from typing import Optional
+
+_MARKER = b"base64,"
+# 除 base64 字母表与空白外的任意字节都视为数据结束（JSON 字符串的引号、Markdown 的右括号等）
+_STOP_RE = re.compile(rb"[^A-Za-z0-9+/=\s]")
+_WHITESPACE = b" \t\r\n"
+# 纯 base64 字符串（无 data URI 前缀）的最短长度，短于此的视为普通文本
+_RAW_BASE64_MIN_LEN = 500
+
+
+def _unescape(data: bytes) -> bytes:
+    """base64 段内可能出现的 JSON 转义：\\/ 还原为 /，\\n \\r \\t 为换行缩进，直接去掉"""
+    return data.replace(b"\\/", b"/").replace(b"\\n", b"").replace(b"\\r", b"").replace(b"\\t", b"")
+
+
+class ImagePayloadExtractor:
+    """
+    增量提取响应体中的第一张 base64 图片：依次 feed() 网络分块，最后 close() 取得图片字节。
+    找到的 "base64," 之后若没有有效数据（如正文里提到的示例前缀），继续向后查找下一个。
+    """
+
+    def __init__(self):
+        self._scan = bytearray()   # 尚未找到前缀时保留的响应正文
+        self._scan_from = 0
+        self._decoding = False
+        self._pending = b""        # 不足 4 字节的 base64 字符，或被分块截断的转义符
+        self._image: Optional[bytearray] = None
+        self._done = False
+
+    @property
+    def found(self) -> bool:
+        return self._done
+
+    def feed(self, chunk: bytes):
+        if self._done:
+            return  # 已取到图片，余下的响应体只读不存（读完连接才能回池）
+        if self._decoding:
+            self._decode(chunk)
+        else:
+            self._search(chunk)
+
+    def _search(self, chunk: bytes):
+        self._scan += chunk
+        pos = self._scan.find(_MARKER, self._scan_from)
+        if pos < 0:
+            # 前缀可能被分块截断，下次从末尾前几个字节开始找
+            self._scan_from = max(0, len(self._scan) - len(_MARKER) + 1)
+            return
+        start = pos + len(_MARKER)
+        payload = bytes(self._scan[start:])
+        del self._scan[start:]
+        self._scan_from = start
+        self._decoding = True
+        self._pending = b""
+        self._image = bytearray()
+        self._decode(payload)
+
+    def _decode(self, chunk: bytes):
+        data = self._pending + chunk
+        hold = b""
+        if data.endswith(b"\\"):
+            data, hold = data[:-1], b"\\"
+        if b"\\" in data:
+            data = _unescape(data)
+        m = _STOP_RE.search(data)
+        rest = None
+        if m:
+            data, rest = data[:m.start()], data[m.start():]
+            hold = b""
+        data = data.translate(None, _WHITESPACE)
+        aligned = len(data) // 4 * 4
+        if aligned:
+            self._image += binascii.a2b_base64(data[:aligned])
+        self._pending = data[aligned:] + hold
+        if rest is not None:
+            self._finish(rest)
+
+    def _finish(self, rest: bytes):
+        """base64 段结束：有数据则完成，否则回到查找状态处理剩余字节"""
+        self._decoding = False
+        if self._image:
+            if self._pending:
+                raise binascii.Error("base64 数据长度不完整")
+            self._done = True
+            self._scan = bytearray()
+            return
+        self._image = None
+        self._search(rest)
+
+    def close(self) -> Optional[bytearray]:
+        """响应体读完后调用，返回图片字节；未找到图片时返回 None"""
+        if self._decoding:
+            self._finish(b"")
+        if self._done:
+            return self._image
+        return self._raw_base64_fallback()
+
+    def _raw_base64_fallback(self) -> Optional[bytearray]:
+        """兼容 message.images 中直接给出纯 base64 字符串（无 data URI 前缀）的格式"""
+        try:
+            body = json.loads(bytes(self._scan))
+            images = body["choices"][0]["message"].get("images") or []
+        except (ValueError, LookupError, TypeError, AttributeError):
+            return None
+        for item in images:
+            if isinstance(item, str) and len(item) > _RAW_BASE64_MIN_LEN:
+                try:
+                    return bytearray(base64.b64decode(item))
+                except ValueError:
+                    pass
+        return None
+
+
+def extract_image(body: bytes, chunk_size: int = 64 * 1024) -> Optional[bytearray]:
+    """对已在内存中的响应体按块提取（测试与基准用）"""
+    extractor = ImagePayloadExtractor()
+    view = memoryview(body)
+    for i in range(0, len(view), chunk_size):
+        extractor.feed(bytes(view[i:i + chunk_size]))
+    return extractor.close()
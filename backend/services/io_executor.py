@@ -0,0 +1,45 @@
+"""
+IO Executor - 文档渲染与文件读写专用线程池
+DOCX 生成、附图写盘、检查点保存等阻塞操作统一提交到这里执行，事件循环只等待结果；
+线程数由 IO_WORKERS 限定，与 asyncio.to_thread 使用的默认线程池分开，互不挤占。
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+IO_WORKERS = int(os.getenv("IO_WORKERS", "4"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="io")
+    return _executor
+
+
+async def run_io(func: Callable, *args, **kwargs):
+    """在 IO 线程池中执行阻塞函数并等待结果"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def write_bytes(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def write_text(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def shutdown_io(wait: bool = True):
+    """等待已提交的写盘完成后关闭线程池（应用关闭时调用）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
@@ -0,0 +1,118 @@
+"""
+Job Queue - 有界任务队列与固定大小的工作协程池
+同时执行的管道数量受 max_concurrent 限制，排队数量受 max_queued 限制；
+关闭时不再接收新任务，等待正在执行的任务完成后退出。
+队列是进程内的：多 worker 部署时每个进程各有一份上限与排队顺序。
+"""
+import asyncio
+import traceback
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Set
+
+
+class QueueFullError(Exception):
+    """排队任务数已达上限"""
+
+
+class JobQueue:
+    """有界 FIFO 队列 + 工作协程池"""
+
+    def __init__(
+        self,
+        handler: Callable[[str], Awaitable[None]],
+        max_concurrent: int,
+        max_queued: int,
+        on_dropped: Optional[Callable[[str], None]] = None,
+    ):
+        self.handler = handler
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.on_dropped = on_dropped  # 关闭时仍在排队的任务回调
+        self._waiting: Deque[str] = deque()
+        self._running: Set[str] = set()
+        self._workers: List[asyncio.Task] = []
+        self._cond: Optional[asyncio.Condition] = None
+        self._closing = False
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._waiting) >= self.max_queued
+
+    async def start(self):
+        """启动工作协程（在应用 lifespan 中调用）"""
+        self._cond = asyncio.Condition()
+        self._closing = False
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(self.max_concurrent)
+        ]
+
+    async def submit(self, task_id: str) -> int:
+        """提交任务，返回排队位置（从 1 开始）；队列已满或正在关闭时抛出 QueueFullError"""
+        if self._cond is None:
+            raise QueueFullError("任务队列未运行")
+        # 在锁内检查：等待锁期间其他提交可能已占满队列或开始关闭
+        async with self._cond:
+            if self._closing:
+                raise QueueFullError("任务队列未运行")
+            if self.is_full:
+                raise QueueFullError("任务队列已满")
+            self._waiting.append(task_id)
+            self._cond.notify()
+            return len(self._waiting)
+
+    def position(self, task_id: str) -> Optional[int]:
+        """排队位置（从 1 开始）；不在队列中返回 None"""
+        for i, queued_id in enumerate(self._waiting):
+            if queued_id == task_id:
+                return i + 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+            "queued": len(self._waiting),
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+        }
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                while not self._waiting and not self._closing:
+                    await self._cond.wait()
+                if self._closing:
+                    return
+                task_id = self._waiting.popleft()
+
+            self._running.add(task_id)
+            try:
+                await self.handler(task_id)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._running.discard(task_id)
+
+    async def shutdown(self, timeout: Optional[float] = None):
+        """停止接收新任务，等待执行中的任务完成；超时后取消，未完成与未开始的任务交给 on_dropped"""
+        if self._cond is None:
+            return
+        self._closing = True
+        async with self._cond:
+            self._cond.notify_all()
+
+        dropped = []
+        if self._workers:
+            done, pending = await asyncio.wait(self._workers, timeout=timeout)
+            dropped.extend(self._running)
+            for worker in pending:
+                worker.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        dropped.extend(self._waiting)
+        self._waiting.clear()
+        if self.on_dropped:
+            for task_id in dropped:
+                self.on_dropped(task_id)
+        self._workers = []
+        self._cond = None
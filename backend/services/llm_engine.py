@@ -4,19 +4,62 @@ LLM Engine - OpenRouter API 封装
 """
 import os
 import re
-import base64
-from typing import AsyncGenerator, Dict, List, Optional, Tuple
-from openai import AsyncOpenAI
+import json
+import asyncio
+import hashlib
+import time
+from typing import AsyncGenerator, Dict, Iterator, List, Optional, Set, Tuple
+
+import httpx
+from openai import APIError, AsyncOpenAI
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+from services.disk_cache import DiskCache
+from services import rate_limiter
+from services.rate_limiter import estimate_message_tokens, estimate_tokens
+from services.resilience import STREAM_RESET, call_with_retry, stream_with_retry
+from services.image_payload import ImagePayloadExtractor
 
 # Default config from env
 DEFAULT_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 SITE_URL = os.getenv("SITE_URL", "http://localhost:3000")
 SITE_NAME = os.getenv("SITE_NAME", "Auto-Patent Architect")
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# 连接池：每个 API Key 共享一个客户端及其 keep-alive 连接
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "600"))
+# 客户端闲置超过该时长（秒）后关闭
+LLM_CLIENT_IDLE_TTL = float(os.getenv("LLM_CLIENT_IDLE_TTL", "1800"))
 
 # Model IDs
 MODEL_GEMINI_PRO = "google/gemini-3-pro-preview"
 MODEL_GPT = "openai/gpt-5.2"
 MODEL_IMAGE_GEN = "google/gemini-3-pro-image-preview"
+# 超长论文分块摘要所用模型
+MODEL_DIGEST = os.getenv("DIGEST_MODEL", MODEL_GEMINI_PRO)
+# 响应未带 usage 时，按每张生成图片计入的输出 token 数结算限流额度
+IMAGE_OUTPUT_TOKENS = int(os.getenv("IMAGE_OUTPUT_TOKENS", "1300"))
+# usage 位于响应体末尾；出图后只保留最后这么多字节用于解析
+_USAGE_TAIL_BYTES = 4096
+_USAGE_RE = re.compile(rb'"total_tokens"\s*:\s*(\d+)')
+
+# 响应缓存（默认关闭）：相同模型 + 相同消息的完整输出落盘复用，重跑失败任务或同一论文时免去重复调用
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "0") == "1"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join("cache", "llm"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600
+# 命中时按多少字符一段回放（0 表示整段一次性返回）
+LLM_CACHE_REPLAY_CHUNK = int(os.getenv("LLM_CACHE_REPLAY_CHUNK", "0"))
+
+_response_cache = DiskCache(LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL, suffix=".txt")
 
 # 全局输出格式约束（加在每个 prompt 末尾）
 OUTPUT_CONSTRAINT = """
@@ -28,19 +71,160 @@ OUTPUT_CONSTRAINT = """
 4. 输出内容应可直接粘贴到 Word 文档中使用。"""
 
 
-def get_client(api_key: Optional[str] = None) -> AsyncOpenAI:
-    """获取 OpenAI 客户端，支持运行时注入 API Key"""
-    key = api_key or DEFAULT_API_KEY
-    if not key:
-        raise ValueError("OpenRouter API Key 未配置。请在前端输入您的 API Key。")
+# api_key -> (客户端, 所属事件循环, 最近使用时间)
+_clients: Dict[str, Tuple[AsyncOpenAI, asyncio.AbstractEventLoop, float]] = {}
+# 正在后台关闭闲置客户端的任务；事件循环只持有任务的弱引用，这里保留强引用直至完成
+_closing_tasks: Set[asyncio.Task] = set()
+
+
+def _new_client(key: str) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        http2=HAS_HTTP2,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=15.0),
+    )
     return AsyncOpenAI(
-        base_url="https://openrouter.ai/api/v1",
+        base_url=OPENROUTER_BASE_URL,
         api_key=key,
         default_headers={
             "HTTP-Referer": SITE_URL,
             "X-Title": SITE_NAME,
         },
+        http_client=http_client,
+        # 重试统一由 services.resilience 负责，避免与 SDK 内置重试叠加
+        max_retries=0,
+    )
+
+
+def _evict_idle_clients(now: float, loop: Optional[asyncio.AbstractEventLoop]):
+    """关闭闲置过久的客户端；属于其他（已结束）事件循环的客户端直接丢弃"""
+    for key, (client, client_loop, last_used) in list(_clients.items()):
+        if client_loop is not loop:
+            del _clients[key]
+        elif now - last_used > LLM_CLIENT_IDLE_TTL:
+            del _clients[key]
+            task = loop.create_task(client.close())
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+
+
+def _resolve_key(api_key: Optional[str]) -> str:
+    key = api_key or DEFAULT_API_KEY
+    if not key:
+        raise ValueError("OpenRouter API Key 未配置。请在前端输入您的 API Key。")
+    return key
+
+
+def get_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """
+    获取 OpenAI 客户端，支持运行时注入 API Key。
+    同一 API Key 复用同一个客户端及其连接池，避免每次调用重新握手。
+    """
+    key = _resolve_key(api_key)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # 不在事件循环中（如脚本直接调用），不做池化
+        return _new_client(key)
+
+    now = time.monotonic()
+    _evict_idle_clients(now, loop)
+    entry = _clients.get(key)
+    client = entry[0] if entry else _new_client(key)
+    _clients[key] = (client, loop, now)
+    return client
+
+
+async def aclose_clients():
+    """关闭全部客户端（应用关闭时调用）"""
+    clients = [client for client, _, _ in _clients.values()]
+    _clients.clear()
+    loop = asyncio.get_running_loop()
+    closing = [task for task in _closing_tasks if task.get_loop() is loop]
+    await asyncio.gather(*(client.close() for client in clients), *closing, return_exceptions=True)
+
+
+def _normalize_content(content):
+    """统一换行符并去除首尾空白，避免无实质差异的 prompt 产生不同缓存键"""
+    if isinstance(content, str):
+        return content.replace("\r\n", "\n").replace("\r", "\n").strip()
+    if isinstance(content, list):
+        return [_normalize_content(part) for part in content]
+    if isinstance(content, dict):
+        return {k: _normalize_content(v) for k, v in content.items()}
+    return content
+
+
+def _response_cache_key(model: str, messages: List[Dict]) -> str:
+    """以 (模型, 规范化消息) 的哈希作为缓存键"""
+    payload = json.dumps(
+        {"model": model, "messages": _normalize_content(messages)},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
     )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _replay_chunks(text: str) -> Iterator[str]:
+    """将缓存的完整输出按 LLM_CACHE_REPLAY_CHUNK 切段"""
+    if LLM_CACHE_REPLAY_CHUNK <= 0 or len(text) <= LLM_CACHE_REPLAY_CHUNK:
+        yield text
+        return
+    for i in range(0, len(text), LLM_CACHE_REPLAY_CHUNK):
+        yield text[i:i + LLM_CACHE_REPLAY_CHUNK]
+
+
+def cache_stats() -> Dict:
+    """LLM 响应缓存的命中统计"""
+    return {"enabled": LLM_CACHE_ENABLED, **_response_cache.stats()}
+
+
+def _delta_text(line: str, request: httpx.Request) -> Optional[str]:
+    """解析一行 SSE，返回其中的增量文本；注释行、空行与 [DONE] 返回 None"""
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    chunk = json.loads(data)
+    error = chunk.get("error")
+    if error:
+        message = error.get("message") if isinstance(error, dict) else None
+        raise APIError(message or "An error occurred during streaming", request, body=error)
+    choices = chunk.get("choices") or []
+    if not choices:
+        return None
+    return (choices[0].get("delta") or {}).get("content")
+
+
+async def _stream_once(
+    client: AsyncOpenAI, api_key: str, model: str, messages: List[Dict]
+) -> AsyncGenerator[str, None]:
+    """发起一次流式请求并逐段返回文本（先经客户端限流排队）"""
+    input_tokens = estimate_message_tokens(messages)
+    reservation = await rate_limiter.acquire(api_key, model, input_tokens)
+    output_tokens = 0
+    try:
+        # SDK 的流对象读到 [DONE] 即关闭响应，HTTP/1.1 下剩余的结束标记未读，连接无法回池；
+        # 这里直接读取原始 SSE 行直到响应结束
+        async with client.chat.completions.with_streaming_response.create(
+            model=model,
+            messages=messages,
+            stream=True,
+        ) as response:
+            async for line in response.iter_lines():
+                piece = _delta_text(line, response.http_request)
+                if piece:
+                    output_tokens += estimate_tokens(piece)
+                    yield piece
+    finally:
+        reservation.settle(input_tokens + output_tokens)
 
 
 async def stream_completion(
@@ -48,16 +232,38 @@ async def stream_completion(
     messages: List[Dict],
     api_key: Optional[str] = None,
 ) -> AsyncGenerator[str, None]:
-    """流式调用 LLM 并逐 chunk 返回内容"""
+    """
+    流式调用 LLM 并逐 chunk 返回内容。
+    开启 LLM_CACHE_ENABLED 时先查响应缓存，命中则通过同一生成器接口回放；
+    仅在流完整结束后写入缓存，出错或被调用方提前关闭的流不会被缓存。
+    上游失败时按 services.resilience 的策略重试；已输出部分内容后的重试会先产出
+    STREAM_RESET，调用方应丢弃此前收到的文本。
+    """
+    cache_key = None
+    if LLM_CACHE_ENABLED:
+        cache_key = _response_cache_key(model, messages)
+        cached = await asyncio.to_thread(_response_cache.get, cache_key)
+        if cached is not None:
+            for piece in _replay_chunks(cached.decode("utf-8")):
+                yield piece
+                await asyncio.sleep(0)
+            return
+
     client = get_client(api_key)
-    stream = await client.chat.completions.create(
-        model=model,
-        messages=messages,
-        stream=True,
-    )
-    async for chunk in stream:
-        if chunk.choices and chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
+    key = _resolve_key(api_key)
+    parts = []
+    async for piece in stream_with_retry(
+        f"stream:{model}", lambda: _stream_once(client, key, model, messages)
+    ):
+        if piece is STREAM_RESET:
+            # 上游中途失败后重新生成：丢弃已收到的部分，并通知调用方同样丢弃
+            parts.clear()
+        else:
+            parts.append(piece)
+        yield piece
+
+    if cache_key is not None:
+        await asyncio.to_thread(_response_cache.set, cache_key, "".join(parts).encode("utf-8"))
 
 
 async def collect_completion(
@@ -68,12 +274,29 @@ async def collect_completion(
     """非流式调用，收集完整响应"""
     result = []
     async for chunk in stream_completion(model, messages, api_key):
-        result.append(chunk)
+        if chunk is STREAM_RESET:
+            result.clear()
+        else:
+            result.append(chunk)
     return "".join(result)
 
 
 # ==================== Step Functions ====================
 
+async def summarize_paper_chunk(
+    chunk: str, target_tokens: int, api_key: Optional[str] = None
+) -> str:
+    """超长论文预处理：提取单个论文片段中对撰写专利有用的要点"""
+    prompt = f"""以下是一篇学术论文的一个片段。请提取其中对撰写发明专利有用的关键信息：研究问题、技术方案与方法步骤、关键公式（保留公式并说明其中每个字母的含义）、实验设置与结果数据、创新点。
+
+要求：保留原文的术语和数值，按原文顺序组织，总长度不超过约 {target_tokens} 字。请直接输出要点，不要输出任何前言、分析或思考过程。
+
+【论文片段】
+{chunk}"""
+    messages = [{"role": "user", "content": prompt}]
+    return await collect_completion(MODEL_DIGEST, messages, api_key)
+
+
 async def step_1_basic_structure(
     paper_md: str, patent_sample: str, api_key: Optional[str] = None
 ) -> AsyncGenerator[str, None]:
@@ -173,13 +396,16 @@ def parse_figure_prompts(prompts_text: str) -> List[str]:
 
 async def step_6_generate_figure(
     prompt: str, figure_index: int, api_key: Optional[str] = None
-) -> Optional[bytes]:
+) -> Optional[bytearray]:
     """
     调用 gemini-3-pro-image-preview 生成单张附图。
     OpenRouter 返回的图片在 msg["images"] 字段中，格式为:
     [{"type": "image_url", "image_url": {"url": "data:image/png;base64,..."}}]
+    其他模型可能放在 content 的 data URI 中；由 ImagePayloadExtractor 在原始响应体中定位并解码。
+    返回的 bytearray 即图片数据的唯一副本，可直接写盘。
     """
     client = get_client(api_key)
+    key = _resolve_key(api_key)
 
     full_prompt = f"""请根据以下描述生成一张专利附图。
 要求：黑白流程图风格，简洁高级，中文标注，4K高清，16:9比例。
@@ -188,59 +414,40 @@ async def step_6_generate_figure(
 {prompt}"""
 
     try:
-        response = await client.chat.completions.create(
-            model=MODEL_IMAGE_GEN,
-            messages=[{"role": "user", "content": full_prompt}],
-            extra_body={
-                "modalities": ["image", "text"],
-            },
-        )
-
-        raw = response.model_dump()
-        msg_data = raw.get("choices", [{}])[0].get("message", {})
-
-        # 方式1: 从 images 字段提取（OpenRouter 主要格式）
-        images = msg_data.get("images", [])
-        if images:
-            for img_item in images:
-                if isinstance(img_item, dict):
-                    url = img_item.get("image_url", {}).get("url", "")
-                    if not url and isinstance(img_item.get("image_url"), str):
-                        url = img_item["image_url"]
-                    m = re.search(r'base64,([A-Za-z0-9+/=\s]+)', url, re.DOTALL)
-                    if m:
-                        raw_b64 = m.group(1).replace("\n", "").replace(" ", "").replace("\r", "")
-                        return base64.b64decode(raw_b64)
-                elif isinstance(img_item, str):
-                    # 可能是纯 base64 或 data URI
-                    m = re.search(r'base64,(.+)', img_item, re.DOTALL)
-                    if m:
-                        return base64.b64decode(m.group(1).strip())
-                    if len(img_item) > 500:
-                        try:
-                            return base64.b64decode(img_item)
-                        except Exception:
-                            pass
-
-        # 方式2: 从 content 提取（兼容其他模型）
-        content = msg_data.get("content", "")
-        if isinstance(content, str) and content:
-            b64_match = re.search(
-                r'data:image/(png|jpeg|webp);base64,([A-Za-z0-9+/=\s]+)',
-                content, re.DOTALL
-            )
-            if b64_match:
-                raw_b64 = b64_match.group(2).replace("\n", "").replace(" ", "")
-                return base64.b64decode(raw_b64)
-
-        # 方式3: content 为 list 形式
-        if isinstance(content, list):
-            for part in content:
-                if isinstance(part, dict) and part.get("type") == "image_url":
-                    url = part.get("image_url", {}).get("url", "")
-                    m = re.search(r'base64,(.+)', url, re.DOTALL)
-                    if m:
-                        return base64.b64decode(m.group(1).strip())
+        messages = [{"role": "user", "content": full_prompt}]
+
+        async def _request():
+            input_tokens = estimate_message_tokens(messages)
+            reservation = await rate_limiter.acquire(key, MODEL_IMAGE_GEN, input_tokens)
+            used = input_tokens
+            try:
+                # 读取原始响应体边收边解码，不经 SDK 解析成对象（data URI 常有数兆字节）
+                extractor = ImagePayloadExtractor()
+                tail = b""
+                async with client.chat.completions.with_streaming_response.create(
+                    model=MODEL_IMAGE_GEN,
+                    messages=messages,
+                    extra_body={
+                        "modalities": ["image", "text"],
+                    },
+                ) as response:
+                    async for chunk in response.iter_bytes():
+                        extractor.feed(chunk)
+                        tail = (tail + chunk)[-_USAGE_TAIL_BYTES:]
+                image = extractor.close()
+                # 优先按响应中的 usage 结算，缺失时按估算值
+                match = _USAGE_RE.search(tail)
+                if match:
+                    used = int(match.group(1))
+                elif image:
+                    used += IMAGE_OUTPUT_TOKENS
+                return image
+            finally:
+                reservation.settle(used)
+
+        image = await call_with_retry(f"image:{MODEL_IMAGE_GEN}", _request)
+        if image:
+            return image
 
         print(f"[Image Gen] 图{figure_index + 1}: 未能提取图片数据")
         return None
@@ -0,0 +1,94 @@
+"""
+Loop Monitor - 事件循环阻塞监测
+后台任务每隔 LOOP_LAG_INTERVAL 秒 sleep 一次，实际唤醒时间比预期晚出的部分即为事件循环被阻塞的时长。
+保留最近 LOOP_LAG_WINDOW 次采样计算分位数；超过 LOOP_LAG_WARN_MS 的记为一次卡顿并打印日志。
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.05"))
+LOOP_LAG_WINDOW = int(os.getenv("LOOP_LAG_WINDOW", "1200"))
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "100"))
+
+
+class LoopLagMonitor:
+    """采样事件循环延迟，提供全局统计与某段时间内（如单个任务执行期间）的统计"""
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL,
+        window: int = LOOP_LAG_WINDOW,
+        warn_ms: float = LOOP_LAG_WARN_MS,
+    ):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self._lags = deque(maxlen=window)  # 毫秒
+        self._seq = 0        # 累计采样次数
+        self._stalls = 0     # 累计卡顿次数
+        self._max_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def _record(self, lag_ms: float):
+        self._lags.append(lag_ms)
+        self._seq += 1
+        self._max_ms = max(self._max_ms, lag_ms)
+        if lag_ms > self.warn_ms:
+            self._stalls += 1
+            print(f"[Loop Monitor] 事件循环阻塞 {lag_ms:.0f}ms")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, (loop.time() - start - self.interval) * 1000))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def mark(self) -> Tuple[int, int]:
+        """记录当前位置，之后用 since() 取这段时间内的统计"""
+        return self._seq, self._stalls
+
+    def since(self, mark: Tuple[int, int]) -> Dict:
+        seq, stalls = mark
+        count = min(self._seq - seq, len(self._lags))
+        recent = list(self._lags)[len(self._lags) - count:] if count else []
+        return {
+            "samples": self._seq - seq,
+            "max_ms": round(max(recent, default=0.0), 2),
+            "stalls": self._stalls - stalls,
+        }
+
+    def stats(self) -> Dict:
+        lags = sorted(self._lags)
+
+        def _pct(p: float) -> float:
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))], 2) if lags else 0.0
+
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_ms": self.interval * 1000,
+            "samples": self._seq,
+            "p50_ms": _pct(0.5),
+            "p99_ms": _pct(0.99),
+            "window_max_ms": round(lags[-1], 2) if lags else 0.0,
+            "max_ms": round(self._max_ms, 2),
+            "stalls": self._stalls,
+            "warn_ms": self.warn_ms,
+        }
+
+
+monitor = LoopLagMonitor()
@@ -0,0 +1,204 @@
+"""
+OCR Worker - 独占 Marker 模型的常驻子进程
+模型只在该子进程中加载一次，所有 OCR 请求经管道排队发给它依次处理，
+避免多个线程重复加载模型、内存成倍增长。子进程异常退出时，未完成的请求失败，下一次请求自动重启。
+可在应用启动时预热（OCR_WARMUP=1），避免第一个扫描件请求等待模型加载。
+"""
+import atexit
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+OCR_WARMUP = os.getenv("OCR_WARMUP", "0") == "1"
+# 单次 OCR 请求的最长等待时间（秒，含排队）
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "1800"))
+
+# 返回 OCR 函数（pdf 路径 -> 文本）的加载器，在子进程中调用一次
+Loader = Callable[[], Callable[[str], str]]
+
+
+def load_marker() -> Callable[[str], str]:
+    """加载 Marker 模型（仅在 OCR 子进程中执行）"""
+    from marker.converters.pdf import PdfConverter
+    from marker.models import create_model_dict
+    from marker.output import text_from_rendered
+
+    print("[OCR Worker] 正在加载 Marker OCR 模型...")
+    # 分页输出，便于把批量 OCR 的结果拆回各页
+    converter = PdfConverter(
+        artifact_dict=create_model_dict(),
+        config={"paginate_output": True},
+    )
+    print("[OCR Worker] Marker 模型加载完毕")
+
+    def _convert(pdf_path: str) -> str:
+        text, _, images = text_from_rendered(converter(pdf_path))
+        return text
+
+    return _convert
+
+
+def _worker_main(conn, loader: Loader):
+    """子进程主循环：首个请求（或预热请求）时加载模型，之后依次处理"""
+    convert = None
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        kind = message[0]
+        if kind == "stop":
+            return
+        request_id = message[1]
+        try:
+            if convert is None:
+                convert = loader()
+            payload = convert(message[2]) if kind == "convert" else None
+            conn.send((request_id, True, payload))
+        except Exception as e:
+            conn.send((request_id, False, f"{type(e).__name__}: {e}"))
+
+
+class OcrWorker:
+    """父进程侧的句柄：线程安全地启动子进程、提交请求并分发结果"""
+
+    def __init__(self, loader: Loader = load_marker):
+        self.loader = loader
+        self._start_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._process = None
+        self._conn = None
+        self._pending: Dict[int, Tuple[str, Future]] = {}
+        self._ids = itertools.count(1)
+        self.warm = False
+        self.loading = False
+        self.served = 0
+        self.restarts = 0
+        self.last_error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._started_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._conn is not None and self._process is not None and self._process.is_alive()
+
+    def _ensure_started(self):
+        """启动子进程；加锁保证并发的首批请求只启动一个进程、只加载一次模型"""
+        with self._start_lock:
+            if self.running:
+                return
+            if self._process is not None:
+                # 回收已退出（或管道已断开）的旧进程
+                self._process.join(5)
+                if self._process.is_alive():
+                    self._process.terminate()
+                self.restarts += 1
+            ctx = multiprocessing.get_context("spawn")
+            parent_conn, child_conn = ctx.Pipe()
+            self._process = ctx.Process(
+                target=_worker_main, args=(child_conn, self.loader), name="ocr-worker"
+            )
+            self._process.start()
+            child_conn.close()
+            self._conn = parent_conn
+            self._pending = {}
+            self.warm = False
+            self._started_at = time.monotonic()
+            threading.Thread(
+                target=self._read_loop, args=(parent_conn, self._pending),
+                name="ocr-worker-reader", daemon=True,
+            ).start()
+
+    def _submit(self, kind: str, *args) -> Future:
+        future: Future = Future()
+        self._ensure_started()
+        with self._send_lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = (kind, future)
+            try:
+                self._conn.send((kind, request_id, *args))
+            except (OSError, ValueError) as e:
+                self._pending.pop(request_id, None)
+                raise RuntimeError("OCR 进程不可用") from e
+        if not self.warm:
+            self.loading = True
+        return future
+
+    def convert(self, pdf_path: str) -> Future:
+        """提交一个 PDF 的 OCR 请求，返回 concurrent.futures.Future（结果为 Markdown 文本）"""
+        return self._submit("convert", os.path.abspath(pdf_path))
+
+    def warmup(self) -> Future:
+        """启动子进程并加载模型，不处理任何文档"""
+        return self._submit("warmup")
+
+    def _read_loop(self, conn, pending: Dict[int, Tuple[str, Future]]):
+        while True:
+            try:
+                request_id, ok, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind, future = pending.pop(request_id)
+            if ok:
+                if not self.warm:
+                    self.load_seconds = round(time.monotonic() - self._started_at, 2)
+                self.warm = True
+                self.loading = False
+                if kind == "convert":
+                    self.served += 1
+                future.set_result(payload)
+            else:
+                self.last_error = payload
+                self.loading = False
+                future.set_exception(RuntimeError(f"OCR 失败: {payload}"))
+
+        # 子进程退出：丢弃其管道（下一次请求重启进程），该进程上未完成的请求全部失败
+        with self._start_lock:
+            if conn is self._conn:
+                self._conn = None
+                self.warm = False
+                self.loading = False
+        for request_id in list(pending):
+            kind, future = pending.pop(request_id)
+            self.last_error = "OCR 进程异常退出"
+            future.set_exception(RuntimeError("OCR 进程异常退出"))
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "warm": self.warm,
+            "loading": self.loading,
+            "pid": self._process.pid if self.running else None,
+            "served": self.served,
+            "restarts": self.restarts,
+            "load_seconds": self.load_seconds,
+            "last_error": self.last_error,
+        }
+
+    def shutdown(self, timeout: float = 10.0):
+        """通知子进程退出，超时则强制结束"""
+        with self._start_lock:
+            process, conn = self._process, self._conn
+            self._process = self._conn = None
+        if process is None:
+            return
+        try:
+            with self._send_lock:
+                conn.send(("stop",))
+        except (AttributeError, OSError, ValueError):
+            pass
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        if conn is not None:
+            conn.close()
+        self.warm = False
+
+
+ocr_worker = OcrWorker()
+atexit.register(ocr_worker.shutdown)
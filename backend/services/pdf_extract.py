@@ -0,0 +1,89 @@
+"""
+PDF Extract - PyMuPDF 按页范围提取文本
+页数达到 PDF_PARALLEL_MIN_PAGES 时把页码切成连续区间，由进程池中的多个子进程各自打开文档提取，
+再按页序拼回；页数较少时在线程中串行提取，省去进程启动与传输开销。
+子进程以 spawn 方式启动，只导入本模块与 PyMuPDF。
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 每个子进程至少分到的页数，页数不多时少开分片
+PDF_MIN_PAGES_PER_WORKER = 16
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def page_count(file_path: str) -> int:
+    with fitz.open(file_path) as doc:
+        return len(doc)
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """提取 [start, end) 页的文本（在子进程中执行时自行打开文档）"""
+    with fitz.open(file_path) as doc:
+        return [doc[i].get_text("text") for i in range(start, end)]
+
+
+def page_ranges(count: int, shards: int) -> List[Tuple[int, int]]:
+    """把 count 页均分为 shards 个连续区间"""
+    size, extra = divmod(count, shards)
+    ranges, start = [], 0
+    for i in range(shards):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers < workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool(wait: bool = True):
+    """关闭提取进程池（应用关闭时调用）"""
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+        _pool_workers = 0
+
+
+async def extract_pages(file_path: str, workers: Optional[int] = None) -> List[str]:
+    """按页序返回每页文本；大文档分片并行提取"""
+    count = await asyncio.to_thread(page_count, file_path)
+    workers = workers or PDF_EXTRACT_WORKERS
+    shards = min(workers, count // PDF_MIN_PAGES_PER_WORKER)
+    if count < PDF_PARALLEL_MIN_PAGES or shards <= 1:
+        return await asyncio.to_thread(extract_page_range, file_path, 0, count)
+
+    loop = asyncio.get_running_loop()
+    pool = _get_pool(workers)
+    try:
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(pool, extract_page_range, file_path, start, end)
+            for start, end in page_ranges(count, shards)
+        ))
+    except BrokenProcessPool:
+        print("[PDF Extract] 提取进程异常退出，改为串行提取")
+        shutdown_pool(wait=False)
+        return await asyncio.to_thread(extract_page_range, file_path, 0, count)
+    print(f"[PDF Extract] {count} 页分 {shards} 片并行提取")
+    return [text for part in parts for text in part]
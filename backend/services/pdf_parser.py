@@ -1,9 +1,20 @@
 """
 PDF Parser - 使用 PyMuPDF (fitz) 进行快速文本提取
 学术论文通常是电子版 PDF（非扫描件），不需要 OCR，PyMuPDF 速度极快（秒级）。
+混合文档中文本过少的扫描页单独交给 Marker OCR，OCR 开销与扫描页数成正比。
 """
 import os
+import re
 import asyncio
+import hashlib
+import tempfile
+import importlib.util
+from importlib import metadata
+from typing import Dict, List, Optional
+
+from services.disk_cache import DiskCache
+from services.pdf_extract import extract_page_range, extract_pages, page_count
+from services.ocr_worker import OCR_TIMEOUT, ocr_worker
 
 try:
     import fitz  # PyMuPDF
@@ -11,74 +22,192 @@ try:
 except ImportError:
     HAS_PYMUPDF = False
 
-# marker 作为 OCR 回退（扫描件 PDF）
-try:
-    from marker.converters.pdf import PdfConverter
-    from marker.models import create_model_dict
-    from marker.output import text_from_rendered
-    HAS_MARKER = True
-except ImportError:
-    HAS_MARKER = False
+# marker 作为 OCR 回退（扫描件 PDF）；模型只在 OCR 子进程中导入和加载，这里仅检测是否安装
+HAS_MARKER = importlib.util.find_spec("marker") is not None
 
-# 全局缓存 marker converter
-_converter = None
+# 解析结果缓存：以 PDF 内容的 SHA-256 + 解析器后端及版本为键
+# 本模块提取逻辑变化时递增 PARSE_VERSION，使旧缓存自然失效
+PARSE_VERSION = 2
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join("cache", "pdf"))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_MB", "512")) * 1024 * 1024
+_parse_cache = DiskCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES, suffix=".txt")
 
+HASH_CHUNK_SIZE = 1024 * 1024
 
-def _get_marker_converter():
-    global _converter
-    if _converter is None:
-        print("[PDF Parser] 正在加载 Marker OCR 模型...")
-        _converter = PdfConverter(artifact_dict=create_model_dict())
-        print("[PDF Parser] Marker 模型加载完毕")
-    return _converter
+# 单页提取文本少于该字符数且含图片时视为扫描页，交给 OCR
+OCR_PAGE_MIN_CHARS = int(os.getenv("OCR_PAGE_MIN_CHARS", "50"))
+# 每批 OCR 的页数（扫描页抽取为一个子 PDF 一次转换）
+OCR_BATCH_PAGES = int(os.getenv("OCR_BATCH_PAGES", "8"))
+# 整份文档文本少于该字符数时，所有低文本页都尝试 OCR（不要求含图片）
+MIN_DOCUMENT_CHARS = 200
 
+# Marker 分页输出的页分隔符，如 "{3}------------------------------------------------"
+_MARKER_PAGE_SEP_RE = re.compile(r"\n*\{\d+\}-{48}\n*")
 
-def _parse_with_pymupdf(file_path: str) -> str:
-    """使用 PyMuPDF 快速提取文本（适用于电子版 PDF）"""
-    doc = fitz.open(file_path)
-    pages = []
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        text = page.get_text("text")
-        if text.strip():
-            pages.append(text)
-    doc.close()
-
-    full_text = "\n\n".join(pages)
+
+def hash_file(file_path: str) -> str:
+    """计算文件内容的 SHA-256"""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _package_version(name: str) -> str:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _parser_signature() -> str:
+    """当前可用解析后端及其版本，任一变化都会产生不同的缓存键"""
+    parts = [f"v{PARSE_VERSION}"]
+    if HAS_PYMUPDF:
+        parts.append(f"pymupdf-{_package_version('pymupdf')}")
+    if HAS_MARKER:
+        parts.append(f"marker-{_package_version('marker-pdf')}")
+    return "+".join(parts)
+
+
+def _cache_key(file_hash: str) -> str:
+    signature = hashlib.sha256(_parser_signature().encode("utf-8")).hexdigest()[:16]
+    return f"{file_hash}-{signature}"
+
+
+def cache_stats() -> Dict[str, int]:
+    """PDF 解析缓存的命中统计"""
+    return _parse_cache.stats()
+
+
+def _join_pages(pages: List[str]) -> str:
+    return "\n\n".join(text for text in pages if text.strip())
+
+
+def _pages_to_text(pages: List[str]) -> str:
+    """拼接各页文本；文本过少时返回空串"""
+    full_text = _join_pages(pages)
 
     # 判断是否提取到了有意义的文本
     # 如果文本太少（可能是扫描件），回退到 marker
-    if len(full_text.strip()) < 200:
+    if len(full_text.strip()) < MIN_DOCUMENT_CHARS:
         return ""  # 信号：需要 OCR 回退
     return full_text
 
 
+def _parse_with_pymupdf(file_path: str) -> str:
+    """使用 PyMuPDF 快速提取文本（适用于电子版 PDF），串行逐页"""
+    return _pages_to_text(extract_page_range(file_path, 0, page_count(file_path)))
+
+
+def _find_scanned_pages(file_path: str, pages: List[str]) -> List[int]:
+    """
+    按页检测文本密度：文本少于 OCR_PAGE_MIN_CHARS 且含图片的页视为扫描页。
+    整份文档几乎没有文本时（如全扫描件、文字被转为曲线），所有低文本页都纳入 OCR。
+    """
+    low = [i for i, text in enumerate(pages) if len(text.strip()) < OCR_PAGE_MIN_CHARS]
+    if not low:
+        return []
+    if len(_join_pages(pages).strip()) < MIN_DOCUMENT_CHARS:
+        return low
+    with fitz.open(file_path) as doc:
+        return [i for i in low if doc[i].get_images()]
+
+
+def _split_marker_pages(text: str, count: int) -> List[str]:
+    """按 Marker 的分页分隔符拆回各页；页数对不上时整批文本归入第一页"""
+    parts = _MARKER_PAGE_SEP_RE.split(text)
+    if parts and not parts[0].strip():
+        parts = parts[1:]
+    if len(parts) != count:
+        return [text] + [""] * (count - 1)
+    return parts
+
+
+def _run_marker(file_path: str) -> str:
+    """交给常驻 OCR 子进程转换，阻塞等待结果（在工作线程中调用）"""
+    return ocr_worker.convert(file_path).result(timeout=OCR_TIMEOUT)
+
+
+def _ocr_batch(file_path: str, page_numbers: List[int]) -> List[str]:
+    """把指定页抽取为子 PDF，一次 OCR 后按页拆分"""
+    fd, batch_path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        with fitz.open(file_path) as src, fitz.open() as batch:
+            for n in page_numbers:
+                batch.insert_pdf(src, from_page=n, to_page=n)
+            batch.save(batch_path)
+        return _split_marker_pages(_run_marker(batch_path), len(page_numbers))
+    finally:
+        os.remove(batch_path)
+
+
+async def _ocr_pages(file_path: str, page_numbers: List[int]) -> Dict[int, str]:
+    """分批 OCR 扫描页，返回 页码 -> 文本"""
+    results: Dict[int, str] = {}
+    for i in range(0, len(page_numbers), OCR_BATCH_PAGES):
+        batch = page_numbers[i:i + OCR_BATCH_PAGES]
+        texts = await asyncio.to_thread(_ocr_batch, file_path, batch)
+        results.update(zip(batch, texts))
+    return results
+
+
 def _parse_with_marker(file_path: str) -> str:
     """使用 Marker 进行 OCR 级解析（适用于扫描件）"""
-    converter = _get_marker_converter()
-    rendered = converter(file_path)
-    text, _, images = text_from_rendered(rendered)
-    return text
+    parts = _MARKER_PAGE_SEP_RE.split(_run_marker(file_path))
+    return "\n\n".join(p for p in parts if p.strip())
 
 
-async def parse_pdf(file_path: str) -> str:
+async def parse_pdf(file_path: str, file_hash: Optional[str] = None) -> str:
     """
     将 PDF 文件转换为文本。
-    优先使用 PyMuPDF（秒级速度），若提取文本不足则回退到 Marker（OCR）。
+    先按内容哈希查询解析缓存，命中则直接返回；
+    否则优先使用 PyMuPDF（秒级速度），若提取文本不足则回退到 Marker（OCR）。
+    file_hash 可由上传时边写盘边计算的 SHA-256 传入，省去再次读取文件。
     """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"PDF 文件未找到: {file_path}")
 
+    if file_hash is None:
+        file_hash = await asyncio.to_thread(hash_file, file_path)
+    key = _cache_key(file_hash)
+    cached = await asyncio.to_thread(_parse_cache.get, key)
+    if cached is not None:
+        text = cached.decode("utf-8")
+        print(f"[PDF Parser] 命中解析缓存 {file_hash[:12]}，{len(text)} 字符")
+        return text
+
+    text = await _parse_uncached(file_path)
+    await asyncio.to_thread(_parse_cache.set, key, text.encode("utf-8"))
+    return text
+
+
+async def _parse_uncached(file_path: str) -> str:
+    """按解析器优先级实际解析 PDF"""
     # 方案1: PyMuPDF 快速提取（99% 学术论文适用）
     if HAS_PYMUPDF:
         print(f"[PDF Parser] 使用 PyMuPDF 快速提取: {file_path}")
-        text = await asyncio.to_thread(_parse_with_pymupdf, file_path)
+        # 大文档按页范围分片，在多个进程中并行提取
+        pages = await extract_pages(file_path)
+        scanned = await asyncio.to_thread(_find_scanned_pages, file_path, pages)
+        if scanned and HAS_MARKER:
+            # 仅对扫描页 OCR，结果按页序合并回原文
+            print(f"[PDF Parser] {len(scanned)}/{len(pages)} 页文本过少，对这些页进行 Marker OCR")
+            ocr_texts = await _ocr_pages(file_path, scanned)
+            pages = [ocr_texts.get(i, text) for i, text in enumerate(pages)]
+            text = _join_pages(pages)
+            print(f"[PDF Parser] PyMuPDF + 逐页 OCR 完成，{len(text)} 字符")
+            return text
+
+        text = _pages_to_text(pages)
         if text:
             print(f"[PDF Parser] PyMuPDF 提取成功，{len(text)} 字符")
             return text
         print("[PDF Parser] PyMuPDF 提取文本不足，尝试 Marker OCR 回退...")
 
-    # 方案2: Marker OCR 回退（扫描件）
+    # 方案2: Marker 整份 OCR（未安装 PyMuPDF，或逐页检测未找到扫描页时）
     if HAS_MARKER:
         print(f"[PDF Parser] 使用 Marker OCR 解析: {file_path}")
         text = await asyncio.to_thread(_parse_with_marker, file_path)
@@ -0,0 +1,215 @@
+"""
+Rate Limiter - 按 API Key 与模型划分的客户端限流
+每个 (API Key, 模型) 一组令牌桶：每分钟请求数（RPM）与每分钟估算 token 数（TPM）。
+调用前按估算的输入 + 预期输出 token 预占额度，完成后按实际输出结算；
+额度不足时按到达顺序排队等待而不是报错。等待时间按任务归集，供 /status 展示。
+令牌桶保存在进程内：多 worker 部署时每个进程各自限流，总速率为配置值乘以进程数。
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# 0 表示不限制
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "60"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "1000000"))
+# 预占额度时对输出 token 数的估计
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "2000"))
+
+# 当前调用所属的任务（由管道入口设置，DAG 与附图并发创建的子任务自动继承）
+current_task: ContextVar[Optional[str]] = ContextVar("llm_current_task", default=None)
+
+_CJK_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_message_tokens(messages: List[Dict]) -> int:
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict) and isinstance(part.get("text"), str):
+                    total += estimate_tokens(part["text"])
+    return total
+
+
+class TokenBucket:
+    """容量为每分钟额度、按秒匀速补充的令牌桶；额度为 0 时不限制"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: int, now: float) -> float:
+        """取出 amount 还需等待的秒数（超过容量的请求按容量计，避免永远等不到）"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: int):
+        if not self.unlimited:
+            self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: int):
+        """结算：delta 为正表示退还，为负表示补扣（可扣成负数，后续调用相应多等）"""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + delta)
+
+    def available(self) -> Optional[int]:
+        if self.unlimited:
+            return None
+        self._refill(time.monotonic())
+        return int(self.level)
+
+
+class _Limiter:
+    """单个 (API Key, 模型) 的 RPM + TPM 限流；asyncio.Lock 按 FIFO 唤醒，保证排队公平"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.requests = TokenBucket(LLM_RPM_LIMIT)
+        self.tokens = TokenBucket(LLM_TPM_LIMIT)
+        self.lock = asyncio.Lock()
+        self.queued = 0
+
+    async def acquire(self, tokens: int) -> float:
+        """等待额度并扣除，返回等待秒数"""
+        start = time.monotonic()
+        self.queued += 1
+        try:
+            async with self.lock:
+                while True:
+                    now = time.monotonic()
+                    delay = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+        finally:
+            self.queued -= 1
+        return time.monotonic() - start
+
+    def state(self) -> Dict:
+        return {
+            "rpm_limit": self.requests.capacity,
+            "tpm_limit": self.tokens.capacity,
+            "requests_available": self.requests.available(),
+            "tokens_available": self.tokens.available(),
+            "queued": self.queued,
+        }
+
+
+class Reservation:
+    """一次调用预占的额度"""
+
+    def __init__(self, limiter: _Limiter, tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+
+    def settle(self, actual_tokens: int):
+        """按实际 token 数结算"""
+        self.limiter.tokens.adjust(self.tokens - actual_tokens)
+        self.tokens = actual_tokens
+
+
+# (key_id, model) -> 限流器
+_limiters: Dict[Tuple[str, str], _Limiter] = {}
+# task_id -> 等待统计
+_task_waits: Dict[str, Dict] = {}
+
+
+def _key_id(api_key: str) -> str:
+    """限流状态中只保存 API Key 的摘要"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+async def acquire(
+    api_key: str,
+    model: str,
+    input_tokens: int,
+    expected_output: int = LLM_EXPECTED_OUTPUT_TOKENS,
+) -> Reservation:
+    """排队获取一次调用的 RPM / TPM 额度"""
+    loop = asyncio.get_running_loop()
+    key = (_key_id(api_key), model)
+    limiter = _limiters.get(key)
+    if limiter is None or limiter.loop is not loop:
+        limiter = _limiters[key] = _Limiter(loop)
+
+    task_id = current_task.get()
+    info = None
+    if task_id is not None:
+        info = _task_waits.setdefault(
+            task_id, {"key_id": key[0], "waits": 0, "wait_seconds": 0.0, "max_wait": 0.0, "waiting": 0}
+        )
+        info["waiting"] += 1
+
+    reserved = input_tokens + expected_output
+    try:
+        waited = await limiter.acquire(reserved)
+    finally:
+        if info is not None:
+            info["waiting"] -= 1
+
+    if waited > 0.001:
+        if info is not None:
+            info["waits"] += 1
+            info["wait_seconds"] += waited
+            info["max_wait"] = max(info["max_wait"], waited)
+        if waited >= 1:
+            print(f"[Rate Limit] {model} 排队 {waited:.1f}s" + (f"（任务 {task_id}）" if task_id else ""))
+    return Reservation(limiter, reserved)
+
+
+def _round(info: Dict) -> Dict:
+    return {
+        "waits": info["waits"],
+        "wait_seconds": round(info["wait_seconds"], 3),
+        "max_wait": round(info["max_wait"], 3),
+    }
+
+
+def task_stats(task_id: str) -> Optional[Dict]:
+    """任务的限流等待统计，以及该任务 API Key 下各模型限流器的当前状态"""
+    info = _task_waits.get(task_id)
+    if info is None:
+        return None
+    return {
+        **_round(info),
+        "waiting": info["waiting"],
+        "limiters": {
+            model: limiter.state()
+            for (key_id, model), limiter in _limiters.items()
+            if key_id == info["key_id"]
+        },
+    }
+
+
+def forget_task(task_id: str) -> Optional[Dict]:
+    """任务结束时移除其统计，返回最终的等待汇总"""
+    info = _task_waits.pop(task_id, None)
+    return _round(info) if info is not None else None
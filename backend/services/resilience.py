@@ -0,0 +1,326 @@
+"""
+Resilience - 模型调用的重试、截止时间与对冲请求
+按异常类型区分可重试错误（429 / 5xx / 连接中断）与不可重试错误（鉴权、参数错误等）；
+重试间隔为指数退避加随机抖动，服务端给出 Retry-After 时以其为下限；
+非流式调用有总截止时间；流式调用的截止时间只覆盖建连与首个片段，
+之后不设总时长上限，改为限制相邻片段之间的空闲时间；
+可选对冲：等待超过历史延迟的指定分位数仍未返回时，再发一个相同请求，取先返回者。
+"""
+import asyncio
+import email.utils
+import os
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar, Union
+
+import httpx
+from openai import APIConnectionError, APIError, APIStatusError
+
+LLM_RETRY_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "5"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+# 单次模型调用（含全部重试）的截止时间（秒）；流式调用只计到收到首个片段为止
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "900"))
+# 流式输出中相邻两个片段之间的最长等待（秒），超过视为上游卡住并重试
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "120"))
+# 对冲触发的延迟分位数（如 95），0 表示关闭
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+# 样本数不足时不对冲
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+T = TypeVar("T")
+
+
+class StreamReset:
+    """流式输出中途失败并重试时插入的标记：调用方应丢弃此前收到的该次输出"""
+
+    def __repr__(self):
+        return "STREAM_RESET"
+
+
+STREAM_RESET = StreamReset()
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """调用超出截止时间"""
+
+
+class StreamIdleTimeout(asyncio.TimeoutError):
+    """流式输出超过 LLM_STREAM_IDLE_TIMEOUT 没有新片段"""
+
+
+class LatencyTracker:
+    """按操作名记录最近若干次成功调用的延迟"""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, op: str, seconds: float):
+        self._samples.setdefault(op, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, op: str, p: float) -> Optional[float]:
+        """样本不足 LLM_HEDGE_MIN_SAMPLES 时返回 None"""
+        samples = self._samples.get(op)
+        if not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+
+latency = LatencyTracker()
+_stats = {"calls": 0, "retries": 0, "resets": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+
+
+def stats() -> Dict:
+    return dict(_stats)
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    if isinstance(exc, APIStatusError):
+        return exc.status_code
+    if isinstance(exc, APIError) and isinstance(exc.body, dict):
+        # 流中返回的错误对象，如 {"code": 502, "message": "..."}
+        code = exc.body.get("code")
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429、5xx、超时、流空闲与连接中断可重试；鉴权、参数等客户端错误不重试"""
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, StreamIdleTimeout):
+        return True
+    if isinstance(exc, (APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(exc, APIError):
+        status = _status_code(exc)
+        if status is None:
+            # 流中错误未带状态码，多为上游供应商中断
+            return not isinstance(exc, APIStatusError)
+        return status in RETRYABLE_STATUS or status >= 500
+    return False
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """解析 Retry-After / retry-after-ms 响应头（秒或 HTTP 日期）"""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, server_delay: Optional[float] = None) -> float:
+    """第 attempt 次重试（从 0 开始）前的等待：指数退避 + 全抖动，Retry-After 作为下限"""
+    ceiling = min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt))
+    delay = random.uniform(0, ceiling)
+    if server_delay is not None:
+        delay = server_delay + random.uniform(0, LLM_RETRY_BASE_DELAY)
+    return delay
+
+
+class _Deadline:
+    def __init__(self, seconds: float):
+        self.end = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.end - time.monotonic()
+
+    async def run(self, aw: Awaitable[T]) -> T:
+        remaining = self.remaining()
+        if remaining <= 0:
+            if asyncio.iscoroutine(aw):
+                aw.close()
+            raise DeadlineExceeded("模型调用超出截止时间")
+        try:
+            return await asyncio.wait_for(aw, remaining)
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceeded("模型调用超出截止时间") from e
+
+
+async def _pause_before_retry(op: str, attempt: int, exc: BaseException, deadline: _Deadline):
+    """判断能否重试，能则等待退避时间；否则重新抛出异常"""
+    if not is_retryable(exc) or attempt + 1 >= LLM_RETRY_MAX_ATTEMPTS:
+        _stats["failures"] += 1
+        raise exc
+    delay = backoff_delay(attempt, retry_after(exc))
+    if delay >= deadline.remaining():
+        _stats["failures"] += 1
+        raise exc
+    _stats["retries"] += 1
+    print(f"[Resilience] {op} 第 {attempt + 1} 次调用失败（{type(exc).__name__}: {exc}），{delay:.1f}s 后重试")
+    await asyncio.sleep(delay)
+
+
+async def _race(
+    op: str,
+    start: Callable[[], Awaitable[T]],
+    deadline: _Deadline,
+    cleanup: Optional[Callable[[T], Awaitable[None]]] = None,
+) -> T:
+    """
+    执行一次调用；开启对冲且等待超过延迟分位数时再发起一次，取先成功者。
+    落败一方被取消，若已返回结果则交给 cleanup 释放。
+    """
+    threshold = latency.percentile(op, LLM_HEDGE_PERCENTILE) if LLM_HEDGE_PERCENTILE > 0 else None
+    started = time.monotonic()
+    if threshold is None:
+        result = await deadline.run(start())
+        latency.record(op, time.monotonic() - started)
+        return result
+
+    primary = asyncio.ensure_future(start())
+    hedge = None
+    winner = None
+    pending = {primary}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            timeout = deadline.remaining()
+            if hedge is None:
+                timeout = min(timeout, started + threshold - time.monotonic())
+            elif timeout <= 0:
+                raise DeadlineExceeded("模型调用超出截止时间")
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, timeout), return_when=asyncio.FIRST_COMPLETED
+            )
+            for fut in done:
+                if fut.exception() is None:
+                    winner = fut
+                    break
+                error = fut.exception()
+            if winner is not None:
+                if winner is hedge:
+                    _stats["hedge_wins"] += 1
+                latency.record(op, time.monotonic() - started)
+                return winner.result()
+            if not done and hedge is None:
+                if deadline.remaining() <= 0:
+                    raise DeadlineExceeded("模型调用超出截止时间")
+                _stats["hedges"] += 1
+                hedge = asyncio.ensure_future(start())
+                pending.add(hedge)
+        raise error
+    finally:
+        losers = [f for f in (primary, hedge) if f is not None and f is not winner]
+        for fut in losers:
+            fut.cancel()
+        results = await asyncio.gather(*losers, return_exceptions=True)
+        if cleanup is not None:
+            for result in results:
+                if not isinstance(result, BaseException):
+                    await cleanup(result)
+
+
+async def call_with_retry(
+    op: str,
+    func: Callable[[], Awaitable[T]],
+    deadline_seconds: Optional[float] = None,
+) -> T:
+    """带重试、截止时间与可选对冲地执行一次非流式调用；func 每次调用都应发起一个新请求"""
+    deadline = _Deadline(deadline_seconds or LLM_CALL_DEADLINE)
+    _stats["calls"] += 1
+    attempt = 0
+    while True:
+        try:
+            return await _race(op, func, deadline)
+        except Exception as e:
+            await _pause_before_retry(op, attempt, e, deadline)
+            attempt += 1
+
+
+async def _first_piece(stream: AsyncIterator[str]) -> Tuple[AsyncIterator[str], Optional[str]]:
+    """取流的第一个片段；空流返回 None"""
+    try:
+        return stream, await stream.__anext__()
+    except StopAsyncIteration:
+        return stream, None
+
+
+async def _next_piece(stream: AsyncIterator[str]) -> Optional[str]:
+    """取流的下一个片段，最多等待 LLM_STREAM_IDLE_TIMEOUT；流结束返回 None"""
+    try:
+        return await asyncio.wait_for(stream.__anext__(), LLM_STREAM_IDLE_TIMEOUT)
+    except StopAsyncIteration:
+        return None
+    except asyncio.TimeoutError as e:
+        raise StreamIdleTimeout(f"{LLM_STREAM_IDLE_TIMEOUT:.0f}s 内没有收到新的输出") from e
+
+
+async def _aclose(stream: AsyncIterator[str]):
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+async def stream_with_retry(
+    op: str,
+    open_stream: Callable[[], AsyncIterator[str]],
+    deadline_seconds: Optional[float] = None,
+) -> AsyncIterator[Union[str, StreamReset]]:
+    """
+    带重试的流式调用。首个片段之前的失败直接重试（可对冲首字延迟）；
+    已输出部分内容后失败，则先产出 STREAM_RESET 再从头重新生成，调用方据此丢弃已收到的内容，
+    不会把两次生成的文本拼接在一起。
+    截止时间只约束建连到首个片段（含其间的重试）；开始输出后长文本可以持续生成，
+    只要相邻片段间隔不超过 LLM_STREAM_IDLE_TIMEOUT。中途失败重新生成时截止时间重新计算。
+    """
+    seconds = deadline_seconds or LLM_CALL_DEADLINE
+    deadline = _Deadline(seconds)
+    _stats["calls"] += 1
+    attempt = 0
+    while True:
+        stream = None
+        emitted = False
+        try:
+            stream, piece = await _race(
+                op, lambda: _first_piece(open_stream()), deadline,
+                cleanup=lambda result: _aclose(result[0]),
+            )
+            while piece is not None:
+                emitted = True
+                yield piece
+                piece = await _next_piece(stream)
+            return
+        except Exception as e:
+            if stream is not None:
+                await _aclose(stream)
+                stream = None
+            if emitted:
+                deadline = _Deadline(seconds)
+            await _pause_before_retry(op, attempt, e, deadline)
+            attempt += 1
+            if emitted:
+                _stats["resets"] += 1
+                yield STREAM_RESET
+        finally:
+            if stream is not None:
+                await _aclose(stream)
@@ -0,0 +1,134 @@
+"""
+Paper Digest - 超长论文的分块 map-reduce 摘要
+论文估算 token 数不超过 PAPER_TOKEN_BUDGET 时不做处理；否则按章节（过长的章节再按段落、字符）
+切成不超过 DIGEST_CHUNK_TOKENS 的块，在 DIGEST_CONCURRENCY 的并发上限内分别提取要点，
+按原文顺序拼接。拼接结果仍超出预算时对要点再做一轮合并，最后按预算截断，保证摘要大小有上限。
+token 数由 rate_limiter.estimate_tokens 离线估算，不依赖分词器。
+"""
+import asyncio
+import os
+import re
+from typing import Awaitable, Callable, List, Optional
+
+from services.rate_limiter import estimate_tokens
+
+PAPER_TOKEN_BUDGET = int(os.getenv("PAPER_TOKEN_BUDGET", "60000"))
+DIGEST_CHUNK_TOKENS = int(os.getenv("DIGEST_CHUNK_TOKENS", "12000"))
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "4"))
+DIGEST_MAX_ROUNDS = 3
+# 每块摘要的最小目标长度（token）
+DIGEST_MIN_TARGET = 200
+
+# (文本块, 目标 token 数) -> 要点
+Summarize = Callable[[str, int], Awaitable[str]]
+
+# 章节标题行：Markdown 标题、"2.1 Method" / "三、实验" 这类编号标题、常见的无编号章节名
+_HEADING_RE = re.compile(
+    r"^(?:#{1,6}\s+\S.*"
+    r"|(?:\d+(?:\.\d+){0,2}\.?|[一二三四五六七八九十]+、)\s*[A-Za-z\u4e00-\u9fff].{0,60}"
+    r"|(?:Abstract|Introduction|Conclusions?|References|Appendix|摘要|引言|结论|参考文献|附录)\s*)$",
+    re.MULTILINE | re.IGNORECASE,
+)
+
+
+def split_sections(text: str) -> List[str]:
+    """按章节标题切分，标题归入其后的章节"""
+    starts = [m.start() for m in _HEADING_RE.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    bounds = starts + [len(text)]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:]) if text[a:b].strip()]
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """单个章节超过上限时先按段落、再按字符切分"""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    paragraphs = re.split(r"(?<=\n)\s*\n", text)
+    if len(paragraphs) > 1:
+        return _pack(paragraphs, max_tokens)
+    # 按估算比例换算出每段的字符数
+    step = max(1, len(text) * max_tokens // estimate_tokens(text))
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+def _pack(pieces: List[str], max_tokens: int) -> List[str]:
+    """按顺序把相邻片段合并为不超过 max_tokens 的块"""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if tokens > max_tokens:
+            if current:
+                chunks.append("".join(current))
+                current, size = [], 0
+            chunks.extend(_split_oversized(piece, max_tokens))
+            continue
+        if current and size + tokens > max_tokens:
+            chunks.append("".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def chunk_text(text: str, max_tokens: int = DIGEST_CHUNK_TOKENS) -> List[str]:
+    """切分为不超过 max_tokens 的块，尽量保持章节完整"""
+    return _pack(split_sections(text), max_tokens)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断到不超过 max_tokens，尽量在换行处截断"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text.rfind("\n", 0, lo)
+    return text[:cut if cut > lo // 2 else lo]
+
+
+async def build_digest(
+    paper: str,
+    summarize: Summarize,
+    budget: Optional[int] = None,
+    chunk_tokens: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """
+    生成不超过 budget 的论文摘要；论文本身不超过预算时原样返回。
+    summarize 为每块的摘要函数（生产中调用模型，测试中可替换为桩函数）。
+    """
+    budget = budget or PAPER_TOKEN_BUDGET
+    chunk_tokens = chunk_tokens or DIGEST_CHUNK_TOKENS
+    semaphore = asyncio.Semaphore(concurrency or DIGEST_CONCURRENCY)
+
+    text = paper
+    for _ in range(DIGEST_MAX_ROUNDS):
+        if estimate_tokens(text) <= budget:
+            return text
+        chunks = chunk_text(text, chunk_tokens)
+        target = max(DIGEST_MIN_TARGET, budget // len(chunks))
+        done = 0
+
+        async def _one(chunk: str) -> str:
+            nonlocal done
+            async with semaphore:
+                summary = await summarize(chunk, target)
+            done += 1
+            if on_progress:
+                on_progress(done, len(chunks))
+            return summary.strip()
+
+        summaries = await asyncio.gather(*(_one(chunk) for chunk in chunks))
+        text = "\n\n".join(s for s in summaries if s)
+
+    return truncate_to_tokens(text, budget)
@@ -0,0 +1,448 @@
+"""
+Task Store - 任务状态存储
+提供统一接口，后端可选：
+  - memory: 进程内字典（默认，单 worker）
+  - sqlite: SQLite WAL 模式，多个 uvicorn worker 进程共享同一数据库文件
+任务状态由后端保存；SSE 事件统一写入磁盘上的 EventLog（两种后端共用）。
+已结束的任务按保留时长淘汰。
+
+sqlite 后端只共享任务状态与事件。JobQueue 的并发与排队上限、queue_position、
+各任务的 API Key（routes._task_api_keys）以及模型速率限制仍是每个进程各自的状态：
+N 个 worker 时总并发与排队上限为单进程配置的 N 倍，queue_position 只反映接收上传的那个进程。
+"""
+import copy
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.event_log import EventLog, decode_frames, event_log_path, read_log_file
+
+TASK_STORE_BACKEND = os.getenv("TASK_STORE", "memory")
+TASK_DB_PATH = os.getenv("TASK_DB_PATH", os.path.join("temp", "tasks.db"))
+# 已完成 / 失败任务的保留时长（秒）
+TASK_RETENTION_SECONDS = float(os.getenv("TASK_RETENTION_HOURS", "24")) * 3600
+# 两次淘汰扫描之间的最小间隔（秒）
+EVICT_INTERVAL = 60.0
+# SQLite 写入线程攒批的间隔（秒），同时也是事件日志定时写盘的间隔
+TASK_DB_FLUSH_INTERVAL = float(os.getenv("TASK_DB_FLUSH_INTERVAL", "0.05"))
+# SQLite 锁等待上限（毫秒）；写入线程拿不到锁时稍后重试，不长时间占住线程
+TASK_DB_BUSY_TIMEOUT_MS = int(os.getenv("TASK_DB_BUSY_TIMEOUT_MS", "2000"))
+# 各进程登记心跳的间隔（秒）；超过 TASK_OWNER_TIMEOUT 未更新心跳的进程视为已退出
+TASK_HEARTBEAT_INTERVAL = float(os.getenv("TASK_HEARTBEAT_INTERVAL", "10"))
+TASK_OWNER_TIMEOUT = float(os.getenv("TASK_OWNER_TIMEOUT", "60"))
+
+ACTIVE_STATUSES = ("queued", "processing")
+ORPHAN_ERROR = "服务异常退出，任务未完成，可重新提交恢复"
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class TaskStore:
+    """任务存储接口"""
+
+    # 是否跨进程共享：共享存储的订阅者还需定期轮询，才能看到其他进程写入的事件
+    shared = False
+
+    def __init__(self, retention: float = TASK_RETENTION_SECONDS):
+        self.retention = retention
+        self._last_evict = 0.0
+        # 本进程正在写入的事件日志
+        self._logs: Dict[str, EventLog] = {}
+
+    def create(self, task_id: str, task: Dict[str, Any]):
+        raise NotImplementedError
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """返回任务状态快照；修改需通过 update()"""
+        raise NotImplementedError
+
+    def update(self, task_id: str, **fields):
+        raise NotImplementedError
+
+    def delete(self, task_id: str):
+        self.close_events(task_id)
+        try:
+            os.remove(event_log_path(task_id))
+        except OSError:
+            pass
+
+    def append_event(self, task_id: str, event: Dict[str, Any]):
+        """追加一条事件（编码为 SSE 帧写入事件日志）"""
+        log = self._logs.get(task_id)
+        if log is None:
+            log = self._logs[task_id] = EventLog(event_log_path(task_id))
+        log.append(event)
+
+    def read_frames(self, task_id: str, offset: int = 0) -> Tuple[bytes, int]:
+        """读取字节偏移 offset 之后的已编码帧，返回 (数据, 新偏移)"""
+        log = self._logs.get(task_id)
+        if log is not None:
+            return log.read(offset)
+        return read_log_file(event_log_path(task_id), offset)
+
+    def read_events(self, task_id: str) -> List[Dict[str, Any]]:
+        """解码全部事件（调试与测试用）"""
+        events, offset = [], 0
+        while True:
+            data, offset = self.read_frames(task_id, offset)
+            if not data:
+                return events
+            events.extend(decode_frames(data))
+
+    def flush_events(self):
+        """把各事件日志攒下的帧写盘"""
+        for log in list(self._logs.values()):
+            if log.has_pending:
+                log.flush()
+
+    def flush(self):
+        """把尚未落盘的修改写出（关闭前调用）"""
+        self.flush_events()
+
+    def close_events(self, task_id: str):
+        """任务结束后关闭事件日志，释放内存中的缓冲；之后的读取直接走文件"""
+        log = self._logs.pop(task_id, None)
+        if log is not None:
+            log.close()
+
+    def expired_ids(self, before: float) -> List[str]:
+        """updated_at 早于 before 的已结束任务"""
+        raise NotImplementedError
+
+    def get_status(self, task_id: str) -> Optional[str]:
+        """仅读取状态字段（SSE 订阅者每次唤醒都会调用）"""
+        t = self.get(task_id)
+        return t["status"] if t is not None else None
+
+    def exists(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    def evict_expired(self, force: bool = False) -> int:
+        """按保留策略删除已结束的任务，返回删除数量"""
+        now = time.time()
+        if not force and now - self._last_evict < EVICT_INTERVAL:
+            return 0
+        self._last_evict = now
+        expired = self.expired_ids(now - self.retention)
+        for task_id in expired:
+            self.delete(task_id)
+        return len(expired)
+
+    def close(self):
+        for task_id in list(self._logs):
+            self.close_events(task_id)
+
+
+class MemoryTaskStore(TaskStore):
+    """进程内存储，仅适用于单 worker"""
+
+    def __init__(self, retention: float = TASK_RETENTION_SECONDS):
+        super().__init__(retention)
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, task_id, task):
+        self._tasks[task_id] = {**task, "updated_at": time.time()}
+
+    def get(self, task_id):
+        t = self._tasks.get(task_id)
+        return copy.deepcopy(t) if t is not None else None
+
+    def get_status(self, task_id):
+        t = self._tasks.get(task_id)
+        return t["status"] if t is not None else None
+
+    def update(self, task_id, **fields):
+        t = self._tasks.get(task_id)
+        if t is not None:
+            t.update(fields)
+            t["updated_at"] = time.time()
+
+    def delete(self, task_id):
+        super().delete(task_id)
+        self._tasks.pop(task_id, None)
+
+    def expired_ids(self, before):
+        return [
+            task_id for task_id, t in self._tasks.items()
+            if t.get("status") in FINISHED_STATUSES and t["updated_at"] < before
+        ]
+
+
+# 待写入条目中表示“删除该任务”的标记
+_DELETED = object()
+
+
+def _merge_pending(older: Tuple[Any, Dict], newer: Tuple[Any, Dict]) -> Tuple[Any, Dict]:
+    """合并同一任务先后两次待写入的修改：(完整任务 | _DELETED | None, 增量字段)"""
+    if newer[0] is not None or older[0] is _DELETED:
+        return newer if newer[0] is not None else older
+    return older[0], {**older[1], **newer[1]}
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    SQLite（WAL 模式）存储，多进程共享。
+    create / update / delete 只登记到内存中的待写入表后立即返回，由后台写入线程
+    每 TASK_DB_FLUSH_INTERVAL 秒把积攒的修改合并成一个事务提交，事件循环不等待写锁；
+    本进程读取时把待写入的修改叠加在数据库结果上，其他进程在提交后可见。
+    每行记录最后写入它的进程（owner，即执行该任务的进程），各进程定期在 workers 表登记心跳；
+    启动时及每次心跳时，把心跳已过期（进程崩溃 / 被 kill）的进程遗留的排队中、执行中任务
+    标记为失败，之后可通过 /resume 从检查点继续。
+    """
+
+    shared = True
+
+    def __init__(self, path: str = TASK_DB_PATH, retention: float = TASK_RETENTION_SECONDS):
+        super().__init__(retention)
+        self.path = path
+        self._local = threading.local()
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_status_updated ON tasks (status, updated_at);
+            CREATE TABLE IF NOT EXISTS workers (
+                owner TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE tasks ADD COLUMN owner TEXT")
+        # 主机名 + pid + 随机后缀：pid 复用后也不会把新进程当成旧进程
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # task_id -> (完整任务 | _DELETED | None, 增量字段)；_inflight 为正在提交的一批
+        self._pending: Dict[str, Tuple[Any, Dict]] = {}
+        self._inflight: Dict[str, Tuple[Any, Dict]] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closing = False
+        self.heartbeat()
+        self.recover_orphans()
+        self._writer = threading.Thread(target=self._writer_loop, name="task-store-writer", daemon=True)
+        self._writer.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=TASK_DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={TASK_DB_BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    # ---------- 写入：登记后由写入线程提交 ----------
+
+    def _enqueue(self, task_id: str, entry: Tuple[Any, Dict]):
+        with self._lock:
+            older = self._pending.get(task_id)
+            self._pending[task_id] = entry if older is None else _merge_pending(older, entry)
+        self._wake.set()
+
+    def create(self, task_id, task):
+        self._enqueue(task_id, (copy.deepcopy(task), {}))
+
+    def update(self, task_id, **fields):
+        self._enqueue(task_id, (None, copy.deepcopy(fields)))
+
+    def delete(self, task_id):
+        super().delete(task_id)
+        self._enqueue(task_id, (_DELETED, {}))
+
+    def append_event(self, task_id, event):
+        super().append_event(task_id, event)
+        self._wake.set()
+
+    def _writer_loop(self):
+        next_beat = time.monotonic() + TASK_HEARTBEAT_INTERVAL
+        while True:
+            woken = self._wake.wait(max(0.0, next_beat - time.monotonic()))
+            if self._closing:
+                break
+            if woken:
+                # 稍等片刻，把这段时间内的修改与事件攒成一批
+                time.sleep(TASK_DB_FLUSH_INTERVAL)
+                self._wake.clear()
+                if self._closing:
+                    break  # close() 在调用线程中提交剩余修改
+            try:
+                self.flush()
+                if time.monotonic() >= next_beat:
+                    next_beat = time.monotonic() + TASK_HEARTBEAT_INTERVAL
+                    self.heartbeat()
+                    self.recover_orphans()
+            except sqlite3.OperationalError as e:
+                print(f"[TaskStore] 写入任务状态失败（{e}），稍后重试")
+                self._wake.set()
+            except Exception as e:
+                print(f"[TaskStore] 写入线程异常: {type(e).__name__}: {e}")
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+
+    def flush(self):
+        """立即提交所有待写入的修改并写盘事件日志（写入线程、关闭与测试调用）"""
+        with self._write_lock:
+            self.flush_events()
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return
+            try:
+                self._commit(batch)
+            except BaseException:
+                # 放回待写入表，期间的新修改覆盖旧值
+                with self._lock:
+                    for task_id, entry in batch.items():
+                        newer = self._pending.get(task_id)
+                        self._pending[task_id] = entry if newer is None else _merge_pending(entry, newer)
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+
+    def _commit(self, batch: Dict[str, Tuple[Any, Dict]]):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for task_id, (base, fields) in batch.items():
+                if base is _DELETED:
+                    conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+                    continue
+                if base is None:
+                    row = conn.execute(
+                        "SELECT data FROM tasks WHERE task_id = ?", (task_id,)
+                    ).fetchone()
+                    if not row:
+                        continue
+                    base = json.loads(row[0])
+                t = {**base, **fields}
+                conn.execute(
+                    "INSERT OR REPLACE INTO tasks (task_id, status, data, updated_at, owner)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (task_id, t.get("status", ""), json.dumps(t, ensure_ascii=False), now, self.owner),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---------- 进程心跳与崩溃恢复 ----------
+
+    def heartbeat(self):
+        """登记本进程仍在运行"""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO workers (owner, heartbeat) VALUES (?, ?)", (self.owner, time.time())
+        )
+
+    def recover_orphans(self) -> List[str]:
+        """把心跳过期的进程遗留的排队中 / 执行中任务标记为失败，返回这些任务 ID"""
+        conn = self._conn()
+        now = time.time()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - TASK_OWNER_TIMEOUT,))
+                rows = conn.execute(
+                    "SELECT task_id, data FROM tasks WHERE status IN (?, ?)"
+                    " AND (owner IS NULL OR owner NOT IN (SELECT owner FROM workers))",
+                    ACTIVE_STATUSES,
+                ).fetchall()
+                for task_id, data in rows:
+                    t = json.loads(data)
+                    t.update(status="failed", error=ORPHAN_ERROR)
+                    conn.execute(
+                        "UPDATE tasks SET status = ?, data = ?, updated_at = ? WHERE task_id = ?",
+                        ("failed", json.dumps(t, ensure_ascii=False), now, task_id),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        orphans = [row[0] for row in rows]
+        if orphans:
+            print(f"[TaskStore] {len(orphans)} 个任务所属进程已退出，已标记为失败: {', '.join(orphans)}")
+        return orphans
+
+    # ---------- 读取：数据库结果叠加本进程未提交的修改 ----------
+
+    def _overlays(self, task_id: str) -> List[Tuple[Any, Dict]]:
+        with self._lock:
+            return [e for e in (self._inflight.get(task_id), self._pending.get(task_id)) if e is not None]
+
+    def get(self, task_id):
+        overlays = self._overlays(task_id)
+        t = None
+        if not any(base is not None for base, _ in overlays):
+            row = self._conn().execute(
+                "SELECT data FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            t = json.loads(row[0]) if row else None
+        for base, fields in overlays:
+            if base is _DELETED:
+                t = None
+            elif base is not None:
+                t = copy.deepcopy(base)
+            if t is not None:
+                t.update(copy.deepcopy(fields))
+        return t
+
+    def get_status(self, task_id):
+        overlays = self._overlays(task_id)
+        if not overlays:
+            row = self._conn().execute(
+                "SELECT status FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            return row[0] if row else None
+        t = self.get(task_id)
+        return t.get("status", "") if t is not None else None
+
+    def expired_ids(self, before):
+        rows = self._conn().execute(
+            "SELECT task_id FROM tasks WHERE status IN (?, ?) AND updated_at < ?",
+            (*FINISHED_STATUSES, before),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        for task_id in list(self._logs):
+            self.close_events(task_id)
+        if not self._closing:
+            self._closing = True
+            self._wake.set()
+            self._writer.join()
+            self.flush()
+            # 正常退出：注销心跳（未完成的任务已由 job_queue 关闭时标记为失败）
+            self._conn().execute("DELETE FROM workers WHERE owner = ?", (self.owner,))
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_task_store(backend: str = TASK_STORE_BACKEND) -> TaskStore:
+    """按配置创建任务存储"""
+    if backend == "memory":
+        return MemoryTaskStore()
+    if backend == "sqlite":
+        return SQLiteTaskStore()
+    raise ValueError(f"未知的任务存储后端: {backend}")
@@ -0,0 +1,162 @@
+"""
+Template Library - 范本库
+范本（说明书 / 权利要求书 / 摘要）上传一次即解析为规范化文本存盘，返回范本 ID，
+之后的任务按 ID 引用。ID 取自原始文件内容的 SHA-256，重复上传同一文件得到同一 ID、不再解析；
+文本读取经过以 ID 为键的内存 LRU，任务处理范本时只是一次字典查找。
+"""
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", "templates")
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "64"))
+TEMPLATE_KINDS = ("spec", "claims", "abstract")
+
+# 范本 ID：内容 SHA-256 的前 16 位十六进制
+_ID_RE = re.compile(r"^[0-9a-f]{16}$")
+_TEXT_ENCODINGS = ["utf-8", "gbk", "gb2312", "latin-1"]
+
+
+def template_id_for(sha256: str) -> str:
+    return sha256[:16]
+
+
+def is_template_id(value: str) -> bool:
+    return bool(_ID_RE.match(value or ""))
+
+
+def normalize_text(text: str) -> str:
+    """统一换行、去掉 BOM 与行尾空白，合并多余空行"""
+    text = text.lstrip("﻿").replace("\r\n", "\n").replace("\r", "\n")
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def parse_template_file(path: str) -> str:
+    """读取范本文件，支持 .docx 和纯文本（依次尝试常见编码）"""
+    if path.endswith((".docx", ".doc")):
+        from docx import Document as DocxDocument
+        doc = DocxDocument(path)
+        return normalize_text("\n".join(p.text for p in doc.paragraphs if p.text.strip()))
+    with open(path, "rb") as f:
+        raw = f.read()
+    for enc in _TEXT_ENCODINGS:
+        try:
+            return normalize_text(raw.decode(enc))
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return normalize_text(raw.decode("utf-8", errors="ignore"))
+
+
+class TemplateLibrary:
+    """范本的磁盘存储（{id}.txt 文本 + {id}.json 元信息）与文本 LRU"""
+
+    def __init__(self, directory: str, cache_size: int = TEMPLATE_CACHE_SIZE):
+        self.directory = directory
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.parses = 0
+        self._lock = threading.Lock()
+        self._texts: "OrderedDict[str, str]" = OrderedDict()
+        self._meta: Optional[Dict[str, dict]] = None
+
+    def _path(self, template_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, template_id + suffix)
+
+    def _load_meta(self) -> Dict[str, dict]:
+        if self._meta is None:
+            self._meta = {}
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    if not name.endswith(".json"):
+                        continue
+                    try:
+                        with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                            meta = json.load(f)
+                    except (OSError, ValueError):
+                        continue
+                    self._meta[meta["template_id"]] = meta
+        return self._meta
+
+    def _write(self, path: str, data: str):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remember(self, template_id: str, text: str):
+        self._texts[template_id] = text
+        self._texts.move_to_end(template_id)
+        while len(self._texts) > self.cache_size:
+            self._texts.popitem(last=False)
+
+    def add(self, path: str, sha256: str, filename: str = "", kind: Optional[str] = None) -> dict:
+        """登记范本文件并返回元信息；同内容的范本已存在时直接返回，不再解析"""
+        template_id = template_id_for(sha256)
+        with self._lock:
+            existing = self._load_meta().get(template_id)
+            if existing is not None:
+                return existing
+
+        text = parse_template_file(path)
+        meta = {
+            "template_id": template_id,
+            "kind": kind,
+            "filename": filename or os.path.basename(path),
+            "sha256": sha256,
+            "chars": len(text),
+        }
+        with self._lock:
+            self.parses += 1
+            os.makedirs(self.directory, exist_ok=True)
+            self._write(self._path(template_id, ".txt"), text)
+            self._write(self._path(template_id, ".json"), json.dumps(meta, ensure_ascii=False))
+            self._load_meta()[template_id] = meta
+            self._remember(template_id, text)
+        return meta
+
+    def get(self, template_id: str) -> Optional[dict]:
+        if not is_template_id(template_id):
+            return None
+        with self._lock:
+            return self._load_meta().get(template_id)
+
+    def text(self, template_id: str) -> str:
+        """范本的规范化文本；不存在时抛出 KeyError"""
+        with self._lock:
+            text = self._texts.get(template_id)
+            if text is not None:
+                self._texts.move_to_end(template_id)
+                self.hits += 1
+                return text
+            if not is_template_id(template_id):
+                raise KeyError(template_id)
+            try:
+                with open(self._path(template_id, ".txt"), "r", encoding="utf-8") as f:
+                    text = f.read()
+            except FileNotFoundError:
+                raise KeyError(template_id) from None
+            self.misses += 1
+            self._remember(template_id, text)
+            return text
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return sorted(self._load_meta().values(), key=lambda m: (m["kind"] or "", m["filename"]))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "templates": len(self._load_meta()),
+                "cached": len(self._texts),
+                "hits": self.hits,
+                "misses": self.misses,
+                "parses": self.parses,
+            }
+
+
+library = TemplateLibrary(TEMPLATE_DIR)
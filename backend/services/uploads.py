@@ -0,0 +1,100 @@
+"""
+Uploads - 上传文件流式落盘
+按固定大小分块把 UploadFile 写入磁盘，同一遍计算 SHA-256（供解析缓存使用），
+整个复制过程在工作线程中执行，不阻塞事件循环；每个字段单独限制大小，超限时删除已写入的部分。
+
+注意：路由拿到 UploadFile 时，Starlette 已经接收完整个 multipart 请求体并暂存到临时文件，
+字段级的大小检查只能拒绝、不能阻止超大请求体被接收。为此 RequestSizeLimit 中间件在读取请求体之前
+按 Content-Length 拒绝明显超限的请求（413）；未声明 Content-Length 的分块传输请求不在此列，
+仍会先被完整接收，再由字段级检查拒绝。
+"""
+import asyncio
+import hashlib
+import os
+from typing import Dict, Tuple
+
+from fastapi import UploadFile
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_PDF_BYTES = int(os.getenv("MAX_PDF_UPLOAD_MB", "256")) * 1024 * 1024
+MAX_SAMPLE_BYTES = int(os.getenv("MAX_SAMPLE_UPLOAD_MB", "10")) * 1024 * 1024
+# multipart 边界、字段头与表单字段（范本 ID、API Key 等）的余量
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+# 整个请求体的上限：/upload 为论文 PDF 加三个范本文件，/templates 为单个范本文件
+MAX_UPLOAD_REQUEST_BYTES = MAX_PDF_BYTES + 3 * MAX_SAMPLE_BYTES + MULTIPART_OVERHEAD_BYTES
+MAX_TEMPLATE_REQUEST_BYTES = MAX_SAMPLE_BYTES + MULTIPART_OVERHEAD_BYTES
+
+
+class UploadTooLarge(Exception):
+    """单个上传字段超过大小限制"""
+
+    def __init__(self, field: str, limit: int):
+        self.field = field
+        self.limit = limit
+        super().__init__(f"{field} 超过大小限制 {limit // (1024 * 1024)} MB")
+
+
+def _copy_with_hash(src, dest_path: str, field: str, max_bytes: int) -> Tuple[str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest_path, "wb") as f:
+            for chunk in iter(lambda: src.read(UPLOAD_CHUNK_SIZE), b""):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(field, max_bytes)
+                hasher.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return hasher.hexdigest(), size
+
+
+async def save_upload(upload: UploadFile, dest_path: str, field: str, max_bytes: int) -> Tuple[str, int]:
+    """
+    把上传文件分块写入 dest_path，返回 (SHA-256, 字节数)。
+    已知大小（multipart 解析后 UploadFile.size）超限时直接拒绝，不再复制。
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(field, max_bytes)
+    return await asyncio.to_thread(_copy_with_hash, upload.file, dest_path, field, max_bytes)
+
+
+class RequestSizeLimit:
+    """
+    ASGI 中间件：按路径限制请求体大小。
+    Content-Length 超过上限时直接返回 413，不读取请求体，也不进入路由的 multipart 解析。
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["method"] == "POST":
+            limit = self.limits.get(scope["path"])
+            if limit is not None:
+                length = _content_length(scope)
+                if length is not None and length > limit:
+                    response = JSONResponse(
+                        {"detail": f"请求体超过大小限制 {limit // (1024 * 1024)} MB"},
+                        status_code=413,
+                        headers={"Connection": "close"},
+                    )
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+def _content_length(scope: Scope):
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
@@ -0,0 +1,149 @@
+"""
+本地 OpenRouter 桩服务 - 供测试使用
+最小化实现 /chat/completions（流式文本与图片两种响应），支持 HTTP/1.1 keep-alive，
+统计 TCP 连接数，并可按请求注入故障（错误状态码、延迟、流中断开）。
+"""
+import asyncio
+import base64
+import json
+from typing import Callable, Dict, List, Optional, Set
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"stub-image" * 8
+# 图片响应末尾附带的用量
+IMAGE_USAGE = {"prompt_tokens": 40, "completion_tokens": 1290, "total_tokens": 1330}
+
+
+class Fault:
+    """单次请求的故障描述"""
+
+    def __init__(
+        self,
+        status: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        delay: float = 0.0,
+        drop_after: Optional[int] = None,
+    ):
+        self.status = status
+        self.headers = headers or {}
+        self.delay = delay
+        self.drop_after = drop_after  # 流式响应发送若干个 chunk 后直接断开连接
+
+
+class StubOpenRouter:
+    def __init__(self, text: str = "桩模型输出。", chunk_size: int = 4, latency: float = 0.0):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.latency = latency
+        self.faults: List[Fault] = []  # 按请求顺序依次取用
+        # faults 为空时调用，用于随机注入故障（如基准测试中的不稳定上游）
+        self.fault_source: Optional[Callable[[], Fault]] = None
+        self.connections = 0
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+        self.port = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        for task in list(self._handlers):
+            task.cancel()
+        await asyncio.gather(*list(self._handlers), return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                self.requests += 1
+                if not await self._respond(json.loads(body or b"{}"), writer):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def _respond(self, payload: dict, writer: asyncio.StreamWriter) -> bool:
+        """写出一个响应；返回 False 表示已断开连接"""
+        if self.faults:
+            fault = self.faults.pop(0)
+        elif self.fault_source is not None:
+            fault = self.fault_source()
+        else:
+            fault = Fault()
+        await asyncio.sleep(self.latency + fault.delay)
+
+        if fault.status != 200:
+            body = json.dumps({"error": {"message": f"stub error {fault.status}", "code": fault.status}})
+            self._write(writer, fault.status, "application/json", body.encode(), fault.headers)
+            await writer.drain()
+            return True
+
+        if payload.get("stream"):
+            chunks = [self.text[i:i + self.chunk_size] for i in range(0, len(self.text), self.chunk_size)]
+            frames = []
+            for i, piece in enumerate(chunks):
+                if fault.drop_after is not None and i >= fault.drop_after:
+                    break
+                frames.append(self._sse({"choices": [{"index": 0, "delta": {"content": piece}}]}))
+            if fault.drop_after is not None:
+                # 声明完整长度但提前断开，模拟上游流中断
+                data = b"".join(frames)
+                self._write(writer, 200, "text/event-stream", data, fault.headers, length=len(data) + 1024)
+                await writer.drain()
+                return False
+            frames.append(self._sse({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+            frames.append(b"data: [DONE]\n\n")
+            self._write(writer, 200, "text/event-stream", b"".join(frames), fault.headers)
+        else:
+            url = "data:image/png;base64," + base64.b64encode(PNG_BYTES).decode()
+            body = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": 0, "model": payload.get("model"),
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant", "content": "",
+                        "images": [{"type": "image_url", "image_url": {"url": url}}],
+                    },
+                }],
+                "usage": IMAGE_USAGE,
+            })
+            self._write(writer, 200, "application/json", body.encode(), fault.headers)
+        await writer.drain()
+        return True
+
+    @staticmethod
+    def _sse(obj: dict) -> bytes:
+        obj = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub", **obj}
+        return f"data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    @staticmethod
+    def _write(writer, status: int, content_type: str, body: bytes,
+               headers: Dict[str, str], length: Optional[int] = None):
+        lines = [
+            f"HTTP/1.1 {status} STUB",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body) if length is None else length}",
+            "Connection: keep-alive",
+            *(f"{k}: {v}" for k, v in headers.items()),
+        ]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
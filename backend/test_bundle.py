@@ -0,0 +1,125 @@
+"""说明书附图与打包下载测试 - 附图嵌入 docx 并标注图号、ZIP 分块流式产出、/bundle 端点"""
+import io
+import os
+import struct
+import zipfile
+import zlib
+
+from services.bundle import iter_zip
+from services.doc_generator import FIGURE_MAX_HEIGHT, FIGURE_MAX_WIDTH, PatentDocGenerator
+
+
+def _png(path, width: int, height: int):
+    """写一张灰度 PNG（不依赖图像库）"""
+    def _chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    raw = b"".join(b"\x00" + bytes((x * 7 + y) % 256 for x in range(width)) for y in range(height))
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)))
+        f.write(_chunk(b"IDAT", zlib.compress(raw)))
+        f.write(_chunk(b"IEND", b""))
+    return str(path)
+
+
+def test_figures_doc_embeds_images_with_captions(tmp_path):
+    from docx import Document
+    from docx.enum.text import WD_LINE_SPACING
+
+    wide = _png(tmp_path / "图1.png", 400, 200)
+    tall = _png(tmp_path / "图3.png", 100, 600)
+    out = str(tmp_path / "说明书附图.docx")
+    PatentDocGenerator().generate_figures([("图1", wide), ("图3", tall)], out)
+
+    doc = Document(out)
+    texts = [p.text for p in doc.paragraphs if p.text]
+    assert texts == ["说明书附图", "图1", "图3"]
+    shapes = doc.inline_shapes
+    assert len(shapes) == 2
+    assert shapes[0].width == FIGURE_MAX_WIDTH and shapes[0].height == FIGURE_MAX_WIDTH // 2
+    # 竖长图按高度上限等比缩小
+    assert shapes[1].height == FIGURE_MAX_HEIGHT and shapes[1].width < FIGURE_MAX_WIDTH
+    # 图片段落不能沿用正文的固定行距，否则只显示一行高
+    picture_paragraphs = [p for p in doc.paragraphs if p._p.xpath(".//pic:pic")]
+    assert all(p.paragraph_format.line_spacing_rule == WD_LINE_SPACING.SINGLE for p in picture_paragraphs)
+
+
+def test_figures_doc_skips_unreadable_image(tmp_path):
+    from docx import Document
+
+    good = _png(tmp_path / "图1.png", 40, 20)
+    bad = tmp_path / "图2.png"
+    bad.write_bytes(b"not an image")
+    out = str(tmp_path / "说明书附图.docx")
+    PatentDocGenerator().generate_figures([("图1", good), ("图2", str(bad))], out)
+
+    doc = Document(out)
+    assert len(doc.inline_shapes) == 1
+    assert [p.text for p in doc.paragraphs] == ["说明书附图", "", "图1"]
+
+
+def test_zip_streamed_in_chunks(tmp_path):
+    big = tmp_path / "图1.png"
+    big.write_bytes(os.urandom(3 * 1024 * 1024))
+    text = tmp_path / "附图提示词.txt"
+    text.write_text("图1：系统结构示意图\n" * 2000, encoding="utf-8")
+
+    chunks = list(iter_zip([("图1.png", str(big)), ("附图提示词.txt", str(text))], chunk_size=64 * 1024))
+    data = b"".join(chunks)
+    # 边读边发：没有哪一块接近整个包的大小
+    assert len(chunks) > 40
+    assert max(len(c) for c in chunks) <= 128 * 1024
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["图1.png", "附图提示词.txt"]
+        assert zf.read("图1.png") == big.read_bytes()
+        assert zf.getinfo("图1.png").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("附图提示词.txt").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_bundle_endpoint(tmp_path):
+    from fastapi.testclient import TestClient
+
+    import main
+    from api import routes
+
+    spec = tmp_path / "说明书.docx"
+    spec.write_bytes(b"spec")
+    fig = _png(tmp_path / "图2.png", 20, 10)
+    task_id = "bundle-test-0001"
+    routes.store.create(task_id, {
+        "status": "completed", "error": "",
+        "files": {"specification": str(spec), "claims": str(tmp_path / "缺失.docx")},
+        "figures": [fig],
+    })
+    routes.store.create("bundle-empty", {"status": "processing", "error": "", "files": {}, "figures": []})
+    try:
+        with TestClient(main.app) as client:
+            resp = client.get(f"/api/bundle/{task_id}")
+            empty = client.get("/api/bundle/bundle-empty")
+    finally:
+        routes.store.delete(task_id)
+        routes.store.delete("bundle-empty")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/zip"
+    assert "content-length" not in resp.headers
+    assert "filename*=utf-8''" in resp.headers["content-disposition"]
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+        # 不存在的文件跳过，文档在前、附图在后
+        assert zf.namelist() == ["说明书.docx", "图2.png"]
+        assert zf.read("说明书.docx") == b"spec"
+    assert empty.status_code == 404
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    for test in (test_figures_doc_embeds_images_with_captions, test_figures_doc_skips_unreadable_image,
+                 test_zip_streamed_in_chunks, test_bundle_endpoint):
+        with tempfile.TemporaryDirectory() as d:
+            test(Path(d))
+    print("OK")
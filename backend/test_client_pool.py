@@ -0,0 +1,91 @@
+"""LLM 客户端连接池测试 - 针对本地桩服务跑完一个任务的全部模型调用，验证 keep-alive 连接被复用；
+闲置客户端在后台关闭，关闭任务保留引用直至完成"""
+import asyncio
+import time
+
+import services.llm_engine as llm_engine
+from stub_openrouter import PNG_BYTES, StubOpenRouter
+
+
+async def _run_job_steps(api_key: str):
+    """按管道顺序依次调用步骤 1-6（步骤 2 与 3/4 之间无并发，单连接即可完成）"""
+    async def drain(gen):
+        return "".join([piece async for piece in gen])
+
+    part_1 = await drain(llm_engine.step_1_basic_structure("论文", "范本", api_key))
+    part_2 = await drain(llm_engine.step_2_embodiments(part_1, "", "范本", api_key))
+    spec = part_1 + part_2
+    claims = await drain(llm_engine.step_3_claims(spec, "范本", api_key))
+    abstract = await drain(llm_engine.step_4_abstract(spec, "范本", api_key))
+    prompts = await drain(llm_engine.step_5_visual_prompts(spec, 2, api_key))
+    images = [await llm_engine.step_6_generate_figure("流程图", i, api_key) for i in range(2)]
+    return [part_1, part_2, claims, abstract, prompts], images
+
+
+def test_connection_reuse_across_job():
+    saved = (llm_engine.OPENROUTER_BASE_URL, llm_engine.LLM_CACHE_ENABLED)
+
+    async def _main():
+        stub = StubOpenRouter(text="桩模型输出，用于连接复用测试。")
+        await stub.start()
+        llm_engine.OPENROUTER_BASE_URL = stub.base_url
+        llm_engine.LLM_CACHE_ENABLED = False
+        try:
+            texts, images = await _run_job_steps("pool-test-key")
+            # 同一 key 取到的是同一个客户端
+            assert llm_engine.get_client("pool-test-key") is llm_engine.get_client("pool-test-key")
+            await llm_engine.aclose_clients()
+        finally:
+            await stub.stop()
+        return stub, texts, images
+
+    try:
+        stub, texts, images = asyncio.run(_main())
+    finally:
+        llm_engine.OPENROUTER_BASE_URL, llm_engine.LLM_CACHE_ENABLED = saved
+
+    assert all(text == stub.text for text in texts)
+    assert images == [PNG_BYTES, PNG_BYTES]
+    assert stub.requests == 7
+    # 7 次调用共用一条 keep-alive 连接（未池化时每次调用各建一条）
+    assert stub.connections == 1, f"expected 1 connection, got {stub.connections}"
+    assert not llm_engine._clients
+    print(f"requests={stub.requests} connections={stub.connections}")
+
+
+def test_separate_keys_get_separate_clients():
+    async def _main():
+        a = llm_engine.get_client("key-a")
+        b = llm_engine.get_client("key-b")
+        assert a is not b
+        assert llm_engine.get_client("key-a") is a
+        await llm_engine.aclose_clients()
+        assert not llm_engine._clients
+
+    asyncio.run(_main())
+
+
+def test_idle_client_closed_in_background():
+    async def _main():
+        idle = llm_engine.get_client("idle-key")
+        client, loop, _ = llm_engine._clients["idle-key"]
+        llm_engine._clients["idle-key"] = (client, loop, time.monotonic() - llm_engine.LLM_CLIENT_IDLE_TTL - 1)
+
+        llm_engine.get_client("active-key")
+        assert "idle-key" not in llm_engine._clients
+        tasks = set(llm_engine._closing_tasks)
+        assert len(tasks) == 1
+        await asyncio.gather(*tasks)
+        assert idle.is_closed()
+        # 完成后不再持有任务引用
+        assert not llm_engine._closing_tasks
+        await llm_engine.aclose_clients()
+
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    test_connection_reuse_across_job()
+    test_separate_keys_get_separate_clients()
+    test_idle_client_closed_in_background()
+    print("OK")
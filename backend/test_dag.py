@@ -0,0 +1,111 @@
+"""管道 DAG 测试 - 依赖顺序、无依赖节点并发执行、节点完成回调、失败时取消其余节点、依赖校验"""
+import asyncio
+
+import pytest
+
+from services.dag import PipelineDAG
+
+
+def test_dependency_order_and_results():
+    order = []
+
+    def _node(name, value):
+        async def _run(r):
+            order.append(name)
+            await asyncio.sleep(0)
+            return value(r)
+        return _run
+
+    dag = PipelineDAG()
+    dag.add("a", _node("a", lambda r: 1))
+    dag.add("b", _node("b", lambda r: r["a"] + 1), deps=["a"])
+    dag.add("c", _node("c", lambda r: r["a"] * 10), deps=["a"])
+    dag.add("d", _node("d", lambda r: r["b"] + r["c"]), deps=["b", "c"])
+
+    done = []
+    results = asyncio.run(dag.run(on_done=lambda name, value: done.append((name, value))))
+    assert results == {"a": 1, "b": 2, "c": 10, "d": 12}
+    assert order[0] == "a" and order[-1] == "d"
+    assert done[0] == ("a", 1) and done[-1] == ("d", 12)
+    assert sorted(done) == sorted(results.items())
+
+
+def test_independent_nodes_run_concurrently():
+    started = {"x": asyncio.Event(), "y": asyncio.Event()}
+
+    def _node(me, other):
+        async def _run(r):
+            started[me].set()
+            # 串行执行时对方永远不会启动，这里会超时
+            await asyncio.wait_for(started[other].wait(), 1)
+            return me
+        return _run
+
+    dag = PipelineDAG()
+    dag.add("x", _node("x", "y"))
+    dag.add("y", _node("y", "x"))
+    assert asyncio.run(dag.run()) == {"x": "x", "y": "y"}
+
+
+def test_initial_results_skip_nodes():
+    calls = []
+
+    async def _a(r):
+        calls.append("a")
+        return 1
+
+    async def _b(r):
+        calls.append("b")
+        return r["a"] + 1
+
+    done = []
+    dag = PipelineDAG().add("a", _a).add("b", _b, deps=["a"])
+    results = asyncio.run(dag.run(initial={"a": 5}, on_done=lambda name, value: done.append(name)))
+    assert results == {"a": 5, "b": 6}
+    assert calls == ["b"] and done == ["b"]
+
+
+def test_failure_cancels_other_nodes():
+    cancelled = []
+    skipped = []
+
+    async def _slow(r):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    async def _fail(r):
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    async def _after(r):
+        skipped.append("after")
+
+    dag = PipelineDAG()
+    dag.add("slow", _slow)
+    dag.add("fail", _fail)
+    dag.add("after", _after, deps=["fail"])
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(asyncio.wait_for(dag.run(), 2))
+    assert cancelled == ["slow"]
+    assert skipped == []
+
+
+def test_invalid_graphs_rejected():
+    async def _noop(r):
+        return None
+
+    with pytest.raises(ValueError):
+        PipelineDAG().add("a", _noop).add("a", _noop)
+    with pytest.raises(ValueError):
+        asyncio.run(PipelineDAG().add("a", _noop, deps=["missing"]).run())
+    with pytest.raises(ValueError):
+        asyncio.run(PipelineDAG().add("a", _noop, deps=["b"]).add("b", _noop, deps=["a"]).run())
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(pytest.main([__file__, "-q"]))
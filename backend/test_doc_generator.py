@@ -0,0 +1,80 @@
+"""DOCX 生成测试 - 基础文档克隆 + 批量写入的输出与逐段写入完全一致，各份输出互不影响"""
+import zipfile
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from services.doc_generator import PatentDocGenerator
+
+
+def _parts(path) -> dict:
+    with zipfile.ZipFile(path) as z:
+        return {name: z.read(name) for name in ("word/document.xml", "word/styles.xml")}
+
+
+def _legacy(gen: PatentDocGenerator, paragraphs, path):
+    """逐段 add_paragraph、逐 Run 设置字体的原写法"""
+    doc = Document()
+    gen._set_style(doc)
+    for text, bold, alignment in paragraphs:
+        gen._add_paragraph(doc, text, bold=bold, alignment=alignment)
+    doc.save(str(path))
+
+
+def test_specification_matches_per_paragraph_output(tmp_path):
+    gen = PatentDocGenerator()
+    content = "## 技术领域\n本发明涉及**交通**预测。\n\n背景\t技术之外的段落\n\n# 一种方法\n最后一段"
+    paragraphs = gen.specification_paragraphs("# 一种方法", content)
+    assert paragraphs[0] == ("一种方法", True, WD_ALIGN_PARAGRAPH.CENTER)
+    assert paragraphs[1] == ("技术领域", True, None)
+    assert paragraphs[2] == ("[0001] 本发明涉及交通预测。", False, None)
+    assert paragraphs[-1] == ("[0003] 最后一段", False, None)
+
+    _legacy(gen, paragraphs, tmp_path / "legacy.docx")
+    gen.generate_specification("# 一种方法", content, str(tmp_path / "fast.docx"))
+    assert _parts(tmp_path / "legacy.docx") == _parts(tmp_path / "fast.docx")
+
+
+def test_claims_and_abstract_match(tmp_path):
+    gen = PatentDocGenerator()
+    claims = "1. 一种方法，其特征在于：\n  2. 根据权利要求1所述的方法。\n"
+    gen.generate_claims(claims, str(tmp_path / "claims.docx"))
+    _legacy(gen, [
+        ("权利要求书", True, WD_ALIGN_PARAGRAPH.CENTER),
+        ("1. 一种方法，其特征在于：", False, None),
+        ("2. 根据权利要求1所述的方法。", False, None),
+    ], tmp_path / "claims_legacy.docx")
+    assert _parts(tmp_path / "claims.docx") == _parts(tmp_path / "claims_legacy.docx")
+
+    gen.generate_abstract("  本发明公开了一种方法。 ", str(tmp_path / "abstract.docx"))
+    _legacy(gen, [
+        ("说明书摘要", True, WD_ALIGN_PARAGRAPH.CENTER),
+        ("本发明公开了一种方法。", False, None),
+    ], tmp_path / "abstract_legacy.docx")
+    assert _parts(tmp_path / "abstract.docx") == _parts(tmp_path / "abstract_legacy.docx")
+
+
+def test_base_template_reused_and_outputs_independent(tmp_path):
+    gen = PatentDocGenerator()
+    gen.generate_abstract("第一份", str(tmp_path / "a.docx"))
+    base = gen._base_docx
+    gen.generate_abstract("第二份", str(tmp_path / "b.docx"))
+    assert gen._base_docx is base
+    assert len(gen._prototypes) == 2
+
+    texts = [p.text for p in Document(str(tmp_path / "b.docx")).paragraphs]
+    assert texts == ["说明书摘要", "第二份"]
+    normal = Document(str(tmp_path / "b.docx")).styles["Normal"]
+    assert normal.font.name == gen.font_name
+    assert normal.paragraph_format.line_spacing == gen.line_spacing
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as d:
+        test_specification_matches_per_paragraph_output(Path(d))
+        test_claims_and_abstract_match(Path(d))
+        test_base_template_reused_and_outputs_independent(Path(d))
+    print("OK")
@@ -0,0 +1,61 @@
+"""事件日志内存测试 - 50 个模拟任务结束后进程内残留内存应接近于零，迟到订阅者仍可从磁盘完整回放"""
+import asyncio
+import gc
+import tempfile
+import tracemalloc
+
+import api.routes as routes
+import services.event_log as event_log
+
+JOBS = 50
+DELTAS_PER_JOB = 3000
+# 每个已结束任务允许的残留（任务状态记录本身约数百字节）
+MAX_RETAINED_PER_JOB = 4 * 1024
+
+
+async def _simulate_job(task_id: str):
+    routes.store.create(task_id, {"status": "processing", "files": {}, "figures": [], "error": ""})
+    for step in ("1", "2", "3"):
+        routes._update_step(task_id, step, f"步骤 {step}")
+        for i in range(DELTAS_PER_JOB // 3):
+            routes._push_chunk(task_id, "content", step=step, text=f"第{i}段专利说明书文本。")
+        routes._push_log(task_id, f"Step {step} 完成")
+    routes._push_chunk(task_id, "file_ready", doc_type="specification")
+    routes._update_task(task_id, status="completed", step_label="全部完成")
+
+
+def test_finished_jobs_release_event_memory():
+    saved_dir = event_log.EVENT_LOG_DIR
+    event_log.EVENT_LOG_DIR = tempfile.mkdtemp()
+    task_ids = [f"mem-{i}" for i in range(JOBS)]
+    try:
+        asyncio.run(_simulate_job("warmup"))
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+        async def _all():
+            for task_id in task_ids:
+                await _simulate_job(task_id)
+
+        asyncio.run(_all())
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        print(f"{JOBS} 个任务结束后残留 {retained / 1024:.1f} KB（每任务 {retained / JOBS:.0f} B）")
+        assert retained < JOBS * MAX_RETAINED_PER_JOB
+
+        # 迟到的订阅者从偏移 0 回放完整事件
+        events = routes.store.read_events(task_ids[-1])
+        text = "".join(e["text"] for e in events if e["type"] == "content" and e["step"] == "2")
+        assert text == "".join(f"第{i}段专利说明书文本。" for i in range(DELTAS_PER_JOB // 3))
+        assert events[-1] == {"type": "file_ready", "doc_type": "specification"}
+    finally:
+        for task_id in ["warmup", *task_ids]:
+            routes.store.delete(task_id)
+        event_log.EVENT_LOG_DIR = saved_dir
+
+
+if __name__ == "__main__":
+    test_finished_jobs_release_event_memory()
+    print("测试通过")
@@ -0,0 +1,105 @@
+"""附图并发生成测试 - 使用桩图片客户端验证耗时由 N×延迟 降至约 ceil(N/k)×延迟"""
+import asyncio
+import base64
+import contextlib
+import json
+import math
+import os
+import time
+
+import services.llm_engine as llm_engine
+import api.routes as routes
+from services import event_log, figure_process
+
+LATENCY = 0.2
+PNG_B64 = base64.b64encode(b"\x89PNG\r\n\x1a\nstub").decode()
+
+
+class _StubResponse:
+    """with_streaming_response 返回的原始响应：按小块产出 JSON 响应体"""
+
+    async def iter_bytes(self):
+        url = f"data:image/png;base64,{PNG_B64}"
+        body = json.dumps({"choices": [{"message": {"images": [{"image_url": {"url": url}}]}}]}).encode()
+        for i in range(0, len(body), 16):
+            yield body[i:i + 16]
+
+
+class _StubCompletions:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.with_streaming_response = self
+
+    @contextlib.asynccontextmanager
+    async def create(self, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(LATENCY)
+            yield _StubResponse()
+        finally:
+            self.active -= 1
+
+
+class _StubClient:
+    def __init__(self):
+        self.completions = _StubCompletions()
+        self.chat = self
+
+
+def _run(tmp_path, monkeypatch, num_figures: int, concurrency: int):
+    stub = _StubClient()
+    monkeypatch.setattr(llm_engine, "get_client", lambda api_key=None: stub)
+    monkeypatch.setattr(routes, "FIGURE_CONCURRENCY", concurrency)
+    monkeypatch.setattr(routes, "_figure_global_semaphore", asyncio.Semaphore(64))
+    monkeypatch.setattr(event_log, "EVENT_LOG_DIR", str(tmp_path / "events"))
+    # 桩图片不是有效 PNG，只测生成并发，不做后处理
+    monkeypatch.setattr(figure_process, "FIGURE_POSTPROCESS", False)
+
+    task_dir = str(tmp_path / "task")
+    os.makedirs(task_dir)
+    task_id = "figure-test"
+    routes.store.create(task_id, {"task_dir": task_dir, "figures": []})
+
+    async def _main():
+        start = time.perf_counter()
+        await routes._generate_figures(task_id, [f"prompt {i}" for i in range(num_figures)], "key")
+        return time.perf_counter() - start
+
+    try:
+        elapsed = asyncio.run(_main())
+        t = routes.store.get(task_id)
+        t["events"] = routes.store.read_events(task_id)
+    finally:
+        routes.store.delete(task_id)
+    return elapsed, t, stub.completions.peak
+
+
+def test_wall_time_bounded_by_concurrency(tmp_path, monkeypatch):
+    n, k = 6, 2
+    elapsed, t, peak = _run(tmp_path, monkeypatch, n, k)
+    expected = math.ceil(n / k) * LATENCY
+    print(f"N={n} k={k}: {elapsed:.2f}s (串行约 {n * LATENCY:.2f}s，预期约 {expected:.2f}s)")
+    assert peak == k
+    assert expected * 0.9 <= elapsed < expected + LATENCY * 0.8
+
+
+def test_figures_numbered_by_original_index(tmp_path, monkeypatch):
+    elapsed, t, _ = _run(tmp_path, monkeypatch, 5, 5)
+    assert [os.path.basename(p) for p in t["figures"]] == [f"图{i + 1}.png" for i in range(5)]
+    ready = [c for c in t["events"] if c["type"] == "figure_ready"]
+    assert sorted(c["index"] for c in ready) == list(range(5))
+    assert [c["count"] for c in ready] == [1, 2, 3, 4, 5]
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    import pytest
+
+    for test in (test_wall_time_bounded_by_concurrency, test_figures_numbered_by_original_index):
+        with tempfile.TemporaryDirectory() as d, pytest.MonkeyPatch.context() as mp:
+            test(Path(d), mp)
+    print("测试通过")
@@ -0,0 +1,147 @@
+"""附图后处理测试 - 二值化、按 DPI 缩放、优化压缩与缩略图；处理失败保留原图；缩略图端点的缓存头"""
+import asyncio
+import os
+
+import pytest
+
+from services import figure_process
+from services.figure_process import (
+    FIGURE_DPI,
+    FIGURE_MAX_WIDTH_PX,
+    THUMBNAIL_SIZE,
+    original_path,
+    postprocess_figure,
+    process_figure,
+    thumbnail_path,
+)
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+
+def _sample_figure(path, width: int = 3840, height: int = 2160) -> str:
+    """模拟图片模型输出：浅灰底色带噪点的 RGB 流程图"""
+    img = Image.effect_noise((width, height), 12).convert("RGB")
+    img = Image.blend(Image.new("RGB", (width, height), (235, 235, 230)), img, 0.15)
+    draw = ImageDraw.Draw(img)
+    for i in range(6):
+        x = 200 + i * 600
+        draw.rectangle([x, 800, x + 400, 1300], outline=(20, 20, 20), width=8)
+        draw.line([x + 400, 1050, x + 600, 1050], fill=(40, 40, 40), width=8)
+    img.save(path, format="PNG")
+    return str(path)
+
+
+def test_process_figure_binarizes_and_shrinks(tmp_path):
+    fig = _sample_figure(tmp_path / "图1.png")
+    original = open(fig, "rb").read()
+    thumb = thumbnail_path(fig)
+    result = process_figure(fig, thumb)
+    print(f"原图 {result['before'] // 1024} KB -> {result['after'] // 1024} KB，缩略图 {result['thumbnail'] // 1024} KB")
+
+    with Image.open(fig) as img:
+        assert img.mode == "1"
+        assert img.width == FIGURE_MAX_WIDTH_PX
+        assert img.height == round(2160 * FIGURE_MAX_WIDTH_PX / 3840)
+        assert round(img.info["dpi"][0]) == FIGURE_DPI
+        # 线条保留为黑色，底色（含噪点）变为白色
+        assert img.getpixel((0, 0)) == 255
+        assert img.getpixel((round(200 * FIGURE_MAX_WIDTH_PX / 3840), round(1050 * FIGURE_MAX_WIDTH_PX / 3840))) == 0
+    assert result["after"] * 10 < result["before"]
+
+    assert thumb == str(tmp_path / "thumbs" / "图1.png")
+    with Image.open(thumb) as img:
+        assert max(img.size) == THUMBNAIL_SIZE
+    assert result["thumbnail"] * 100 < result["before"]
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+    # 模型原图原样保留
+    assert open(original_path(fig), "rb").read() == original
+
+
+def test_reprocess_starts_from_original(tmp_path, monkeypatch):
+    fig = _sample_figure(tmp_path / "图1.png", 1600, 900)
+    original = open(fig, "rb").read()
+    process_figure(fig, thumbnail_path(fig))
+    # 换一个阈值重新处理：读的是原图而不是已二值化的结果
+    monkeypatch.setattr(figure_process, "FIGURE_THRESHOLD", 250)
+    result = process_figure(fig, thumbnail_path(fig))
+    assert result["before"] == len(original)
+    with Image.open(fig) as img:
+        assert img.getpixel((0, 0)) == 0  # 浅灰底色在阈值 250 下变黑
+    assert open(original_path(fig), "rb").read() == original
+
+
+def test_small_figure_not_upscaled(tmp_path):
+    fig = _sample_figure(tmp_path / "图2.png", 800, 450)
+    process_figure(fig, thumbnail_path(fig))
+    with Image.open(fig) as img:
+        assert img.size == (800, 450)
+
+
+def test_postprocess_in_pool_and_failures_keep_original(tmp_path):
+    fig = _sample_figure(tmp_path / "图1.png", 1600, 900)
+    bad = tmp_path / "图2.png"
+    bad.write_bytes(b"not an image")
+
+    async def _main():
+        try:
+            return await asyncio.gather(postprocess_figure(fig), postprocess_figure(str(bad)))
+        finally:
+            figure_process.shutdown_figure_pool()
+
+    ok, failed = asyncio.run(_main())
+    assert ok["size"] == (1600, 900) and os.path.exists(thumbnail_path(fig))
+    assert failed is None
+    assert bad.read_bytes() == b"not an image"
+    assert open(original_path(str(bad)), "rb").read() == b"not an image"
+    assert not os.path.exists(thumbnail_path(str(bad)))
+
+
+def test_postprocess_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(figure_process, "FIGURE_POSTPROCESS", False)
+    fig = _sample_figure(tmp_path / "图1.png", 400, 300)
+    before = open(fig, "rb").read()
+    assert asyncio.run(postprocess_figure(fig)) is None
+    assert open(fig, "rb").read() == before
+
+
+def test_thumbnail_endpoint_cache_headers(tmp_path):
+    from fastapi.testclient import TestClient
+
+    import main
+    from api import routes
+
+    fig = _sample_figure(tmp_path / "图1.png", 1200, 675)
+    raw = _sample_figure(tmp_path / "图2.png", 600, 300)
+    process_figure(fig, thumbnail_path(fig))
+    task_id = "thumbnail-test-0001"
+    routes.store.create(task_id, {"status": "completed", "error": "", "files": {}, "figures": [fig, raw]})
+    try:
+        with TestClient(main.app) as client:
+            first = client.get(f"/api/thumbnail/{task_id}/0")
+            again = client.get(f"/api/thumbnail/{task_id}/0", headers={"If-None-Match": first.headers["etag"]})
+            fallback = client.get(f"/api/thumbnail/{task_id}/1")
+            missing = client.get(f"/api/thumbnail/{task_id}/2")
+    finally:
+        routes.store.delete(task_id)
+
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/png"
+    assert "immutable" in first.headers["cache-control"]
+    assert first.content == open(thumbnail_path(fig), "rb").read()
+    assert again.status_code == 304 and not again.content
+    # 没有缩略图时退回原图，不允许长期缓存
+    assert fallback.status_code == 200 and fallback.headers["cache-control"] == "no-cache"
+    assert fallback.content == open(raw, "rb").read()
+    assert missing.status_code == 404
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    for test in (test_process_figure_binarizes_and_shrinks, test_small_figure_not_upscaled,
+                 test_postprocess_in_pool_and_failures_keep_original, test_thumbnail_endpoint_cache_headers):
+        with tempfile.TemporaryDirectory() as d:
+            test(Path(d))
+    print("OK")
@@ -0,0 +1,111 @@
+"""图片响应增量提取测试 - 各种返回格式与任意分块边界下结果与一次性解码一致；大图内存峰值约为一份图片"""
+import base64
+import binascii
+import json
+import os
+import random
+import tracemalloc
+
+import pytest
+
+from services.image_payload import ImagePayloadExtractor, extract_image
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 40
+
+
+def _body(message: dict) -> bytes:
+    return json.dumps({"choices": [{"index": 0, "message": message}]}, ensure_ascii=False).encode()
+
+
+def _data_uri(image: bytes = IMAGE, wrap: int = 0) -> str:
+    b64 = base64.b64encode(image).decode()
+    if wrap:
+        b64 = "\r\n".join(b64[i:i + wrap] for i in range(0, len(b64), wrap))
+    return f"data:image/png;base64,{b64}"
+
+
+def _feed_random(body: bytes, rng: random.Random):
+    extractor = ImagePayloadExtractor()
+    pos = 0
+    while pos < len(body):
+        step = rng.randint(1, 50)
+        extractor.feed(body[pos:pos + step])
+        pos += step
+    return extractor.close()
+
+
+BODIES = {
+    "images 字段": _body({"images": [{"type": "image_url", "image_url": {"url": _data_uri()}}]}),
+    "按行折断": _body({"images": [{"type": "image_url", "image_url": {"url": _data_uri(wrap=76)}}]}),
+    "image_url 为字符串": _body({"images": [{"image_url": _data_uri()}]}),
+    "content 中的 Markdown 图片": _body({"content": f"附图如下：![图1]({_data_uri()}) 完毕"}),
+    "content 列表": _body({"content": [{"type": "text", "text": "附图"},
+                                      {"type": "image_url", "image_url": {"url": _data_uri()}}]}),
+    "正文先提到前缀": _body({"content": "返回格式为 data:image/png;base64, 开头",
+                         "images": [{"image_url": {"url": _data_uri()}}]}),
+    "纯 base64 字符串": _body({"images": [base64.b64encode(IMAGE).decode()]}),
+}
+
+
+@pytest.mark.parametrize("name", list(BODIES))
+def test_formats_and_chunk_boundaries(name):
+    body = BODIES[name]
+    rng = random.Random(name)
+    assert extract_image(body) == IMAGE
+    for _ in range(20):
+        assert _feed_random(body, rng) == IMAGE
+
+
+def test_escaped_slashes():
+    # 部分 JSON 编码器把 / 转义为 \/
+    body = _body({"images": [{"image_url": {"url": _data_uri()}}]}).replace(b"/", b"\\/")
+    rng = random.Random(1)
+    for _ in range(20):
+        assert _feed_random(body, rng) == IMAGE
+
+
+def test_no_image():
+    assert extract_image(_body({"content": "抱歉，无法生成图片。"})) is None
+    assert extract_image(b"") is None
+
+
+def test_truncated_payload_raises():
+    uri = _data_uri()
+    body = _body({"images": [{"image_url": {"url": uri[:-1]}}]})
+    with pytest.raises(binascii.Error):
+        extract_image(body)
+
+
+def test_remaining_body_not_retained():
+    body = _body({"images": [{"image_url": {"url": _data_uri()}}], "content": "x" * 100000})
+    extractor = ImagePayloadExtractor()
+    for i in range(0, len(body), 4096):
+        extractor.feed(body[i:i + 4096])
+        if extractor.found:
+            assert not extractor._scan
+    assert extractor.close() == IMAGE
+
+
+def test_memory_peak_about_one_copy():
+    image = os.urandom(8 * 1024 * 1024)
+    body = _body({"images": [{"image_url": {"url": _data_uri(image)}}]})
+    tracemalloc.start()
+    try:
+        result = extract_image(body)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert result == image
+    # 解码结果一份 + bytearray 扩容余量 + 当前分块；原实现约为 5 份
+    assert peak < len(image) * 1.3
+
+
+if __name__ == "__main__":
+    for name in BODIES:
+        test_formats_and_chunk_boundaries(name)
+    test_escaped_slashes()
+    test_no_image()
+    test_truncated_payload_raises()
+    test_remaining_body_not_retained()
+    test_memory_peak_about_one_copy()
+    print("OK")
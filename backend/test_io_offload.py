@@ -0,0 +1,109 @@
+"""文档渲染与写盘移出事件循环的测试 - 事件循环延迟监测、IO 线程池并发上限、/stats 指标"""
+import asyncio
+import threading
+import time
+
+from services import io_executor
+from services.doc_generator import PatentDocGenerator
+from services.io_executor import run_io
+from services.loop_monitor import LoopLagMonitor
+
+
+def _long_spec(paragraphs: int = 2000) -> str:
+    return "\n\n".join(f"本实施例的第{i}段，通过**时空注意力**建模路网节点间的依赖关系。" for i in range(paragraphs))
+
+
+async def _with_monitor(work):
+    monitor = LoopLagMonitor(interval=0.005, window=10000, warn_ms=50)
+    monitor.start()
+    await asyncio.sleep(0.02)
+    mark = monitor.mark()
+    await work()
+    await asyncio.sleep(0.02)
+    result = monitor.since(mark)
+    await monitor.stop()
+    return result
+
+
+def test_docx_rendering_offloaded_keeps_loop_responsive(tmp_path):
+    gen = PatentDocGenerator()
+    spec = _long_spec()
+    gen.generate_specification("标题", spec, str(tmp_path / "warm.docx"))
+
+    async def _inline():
+        gen.generate_specification("标题", spec, str(tmp_path / "inline.docx"))
+
+    async def _offloaded():
+        await run_io(gen.generate_specification, "标题", spec, str(tmp_path / "offloaded.docx"))
+
+    inline = asyncio.run(_with_monitor(_inline))
+    offloaded = asyncio.run(_with_monitor(_offloaded))
+    print(f"事件循环内渲染：最大阻塞 {inline['max_ms']}ms；IO 线程池渲染：最大阻塞 {offloaded['max_ms']}ms")
+    assert inline["stalls"] >= 1 and inline["max_ms"] > 50
+    assert offloaded["stalls"] == 0 and offloaded["max_ms"] < 50
+    assert (tmp_path / "offloaded.docx").stat().st_size > 0
+
+
+def test_io_executor_bounded():
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def _write():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+
+    async def _main():
+        await asyncio.gather(*(run_io(_write) for _ in range(io_executor.IO_WORKERS * 3)))
+
+    asyncio.run(_main())
+    assert peak == io_executor.IO_WORKERS
+
+
+def test_monitor_stats_and_window():
+    async def _main():
+        monitor = LoopLagMonitor(interval=0.005, window=50, warn_ms=50)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        mark = monitor.mark()
+        time.sleep(0.15)  # 阻塞事件循环
+        await asyncio.sleep(0.02)
+        during = monitor.since(mark)
+        stats = monitor.stats()
+        await monitor.stop()
+        return during, stats, monitor.stats()
+
+    during, stats, stopped = asyncio.run(_main())
+    assert during["stalls"] == 1 and during["max_ms"] >= 100
+    assert stats["running"] and stats["stalls"] == 1 and stats["max_ms"] >= 100
+    assert stats["samples"] > 5 and stats["p50_ms"] < 50
+    assert not stopped["running"]
+
+
+def test_stats_expose_event_loop_lag():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        time.sleep(0.2)
+        body = client.get("/api/stats").json()
+    assert body["event_loop"]["running"]
+    assert body["event_loop"]["samples"] > 0
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as d:
+        test_docx_rendering_offloaded_keeps_loop_responsive(Path(d))
+    test_io_executor_bounded()
+    test_monitor_stats_and_window()
+    test_stats_expose_event_loop_lag()
+    print("OK")
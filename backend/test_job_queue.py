@@ -0,0 +1,159 @@
+"""任务队列测试 - 并发上限、队列满时拒绝（接口返回 429，并发提交同样不超限）、关闭时等待执行中的任务并交回未执行的任务"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import api.routes as routes
+from services import event_log
+from services.job_queue import JobQueue, QueueFullError
+
+
+class _Handler:
+    """记录执行情况；release 之前每个任务都停在执行中"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = []
+        self.finished = []
+        self.peak = 0
+        self._running = 0
+
+    async def __call__(self, task_id):
+        self.started.append(task_id)
+        self._running += 1
+        self.peak = max(self.peak, self._running)
+        try:
+            await self.release.wait()
+            self.finished.append(task_id)
+        finally:
+            self._running -= 1
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrency_limit_and_queue_full():
+    async def _main():
+        handler = _Handler()
+        queue = JobQueue(handler, max_concurrent=2, max_queued=2)
+        await queue.start()
+        for i in range(2):
+            await queue.submit(f"run-{i}")
+        await _settle()
+        assert await queue.submit("wait-0") == 1
+        assert await queue.submit("wait-1") == 2
+        assert queue.position("wait-1") == 2
+        with pytest.raises(QueueFullError):
+            await queue.submit("rejected")
+        assert queue.stats()["running"] == 2 and queue.stats()["queued"] == 2
+
+        handler.release.set()
+        while len(handler.finished) < 4:
+            await asyncio.sleep(0.01)
+        await queue.shutdown(timeout=1)
+        return handler
+
+    handler = asyncio.run(_main())
+    assert handler.peak == 2
+    # 按提交顺序启动，被拒绝的任务不执行
+    assert handler.started == ["run-0", "run-1", "wait-0", "wait-1"]
+    assert sorted(handler.finished) == sorted(handler.started)
+
+
+def test_shutdown_drains_running_and_drops_waiting():
+    async def _main():
+        handler = _Handler()
+        dropped = []
+        queue = JobQueue(handler, max_concurrent=1, max_queued=5, on_dropped=dropped.append)
+        await queue.start()
+        for task_id in ("a", "b", "c"):
+            await queue.submit(task_id)
+        await _settle()
+
+        # 关闭期间执行中的任务继续完成，排队的任务不再启动
+        shutdown = asyncio.create_task(queue.shutdown(timeout=1))
+        await _settle()
+        with pytest.raises(QueueFullError):
+            await queue.submit("late")
+        handler.release.set()
+        await shutdown
+        return handler, dropped
+
+    handler, dropped = asyncio.run(_main())
+    assert handler.finished == ["a"]
+    assert dropped == ["b", "c"]
+
+
+def test_shutdown_timeout_cancels_running():
+    async def _main():
+        handler = _Handler()
+        dropped = []
+        queue = JobQueue(handler, max_concurrent=1, max_queued=5, on_dropped=dropped.append)
+        await queue.start()
+        await queue.submit("stuck")
+        await queue.submit("queued")
+        await _settle()
+        await queue.shutdown(timeout=0.05)
+        return handler, dropped
+
+    handler, dropped = asyncio.run(_main())
+    assert handler.finished == []
+    assert dropped == ["stuck", "queued"]
+
+
+def test_concurrent_submits_respect_queue_limit():
+    async def _main():
+        handler = _Handler()
+        queue = JobQueue(handler, max_concurrent=1, max_queued=2)
+        await queue.start()
+        await queue.submit("run")
+        await _settle()
+        # 持有队列锁期间到达的提交都在等锁，释放后逐个检查队列是否已满
+        async with queue._cond:
+            submits = [asyncio.create_task(queue.submit(f"wait-{i}")) for i in range(5)]
+            await _settle()
+        results = await asyncio.gather(*submits, return_exceptions=True)
+        assert queue.stats()["queued"] == 2
+        handler.release.set()
+        await queue.shutdown(timeout=1)
+        return results
+
+    results = asyncio.run(_main())
+    assert results[:2] == [1, 2]
+    assert all(isinstance(r, QueueFullError) for r in results[2:])
+
+
+def test_enqueue_returns_429_when_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(event_log, "EVENT_LOG_DIR", str(tmp_path / "events"))
+    task_id = "queue-full-0001"
+    routes.store.create(task_id, {"status": "queued", "files": {}, "figures": [], "error": ""})
+
+    async def _main():
+        handler = _Handler()
+        queue = JobQueue(handler, max_concurrent=1, max_queued=0)
+        await queue.start()
+        monkeypatch.setattr(routes, "job_queue", queue)
+        try:
+            with pytest.raises(HTTPException) as exc:
+                await routes._enqueue(task_id)
+        finally:
+            handler.release.set()
+            await queue.shutdown(timeout=1)
+        return exc.value
+
+    try:
+        error = asyncio.run(_main())
+        assert error.status_code == 429
+        t = routes.store.get(task_id)
+        assert t["status"] == "failed" and t["error"] == "任务队列已满"
+    finally:
+        routes.store.delete(task_id)
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,143 @@
+"""LLM 响应缓存测试 - 命中时经同一生成器分段回放、TTL 过期与按容量淘汰、
+出错 / 被提前关闭的流与 STREAM_RESET 之前的部分输出不写入缓存"""
+import asyncio
+import os
+import time
+
+import pytest
+
+import services.llm_engine as llm_engine
+from services.disk_cache import DiskCache
+from services.resilience import STREAM_RESET
+
+MESSAGES = [{"role": "user", "content": "测试"}]
+
+
+class _Upstream:
+    """替代 stream_with_retry：按脚本产出文本片段，遇到异常实例则抛出"""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    def __call__(self, name, factory):
+        self.calls += 1
+        return self._stream()
+
+    async def _stream(self):
+        for piece in self.script:
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+            await asyncio.sleep(0)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "llm"), 1024 * 1024, ttl=3600, suffix=".txt")
+    monkeypatch.setattr(llm_engine, "_response_cache", cache)
+    monkeypatch.setattr(llm_engine, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_engine, "LLM_CACHE_REPLAY_CHUNK", 0)
+    monkeypatch.setattr(llm_engine, "get_client", lambda api_key: None)
+    monkeypatch.setattr(llm_engine, "_resolve_key", lambda api_key: "key")
+    return cache
+
+
+def _use_upstream(monkeypatch, *script) -> _Upstream:
+    upstream = _Upstream(*script)
+    monkeypatch.setattr(llm_engine, "stream_with_retry", upstream)
+    return upstream
+
+
+def _collect_pieces(limit=None):
+    """逐段读取 stream_completion；limit 给定时读到第 limit 段后提前关闭生成器"""
+    async def _main():
+        pieces = []
+        gen = llm_engine.stream_completion("m", MESSAGES, "key")
+        try:
+            async for piece in gen:
+                pieces.append(piece)
+                if limit is not None and len(pieces) >= limit:
+                    break
+        finally:
+            await gen.aclose()
+        return pieces
+
+    return asyncio.run(_main())
+
+
+def _cached(cache):
+    return cache.get(llm_engine._response_cache_key("m", MESSAGES))
+
+
+def test_hit_replays_through_generator_in_chunks(cache, monkeypatch):
+    upstream = _use_upstream(monkeypatch, "第一段说明", "书正文。", "第二段。")
+    assert _collect_pieces() == ["第一段说明", "书正文。", "第二段。"]
+    assert upstream.calls == 1
+
+    monkeypatch.setattr(llm_engine, "LLM_CACHE_REPLAY_CHUNK", 4)
+    pieces = _collect_pieces()
+    # 命中缓存不再请求上游，完整文本按 4 个字符一段回放
+    assert upstream.calls == 1
+    assert pieces == ["第一段说", "明书正文", "。第二段", "。"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_errored_stream_not_cached(cache, monkeypatch):
+    _use_upstream(monkeypatch, "部分输出", RuntimeError("上游断开"))
+    with pytest.raises(RuntimeError):
+        _collect_pieces()
+    assert _cached(cache) is None
+
+
+def test_aborted_stream_not_cached(cache, monkeypatch):
+    _use_upstream(monkeypatch, "第一段", "第二段", "第三段")
+    assert _collect_pieces(limit=1) == ["第一段"]
+    assert _cached(cache) is None
+
+
+def test_output_before_stream_reset_not_cached(cache, monkeypatch):
+    upstream = _use_upstream(monkeypatch, "作废的", STREAM_RESET, "重新生成的", "全文")
+    pieces = _collect_pieces()
+    assert pieces == ["作废的", STREAM_RESET, "重新生成的", "全文"]
+    assert _cached(cache) == "重新生成的全文".encode("utf-8")
+
+    # 回放只包含重置之后的文本，也不再产出 STREAM_RESET
+    assert _collect_pieces() == ["重新生成的全文"]
+    assert upstream.calls == 1
+
+
+def test_ttl_expiry(tmp_path):
+    cache = DiskCache(str(tmp_path), 1024, ttl=60, suffix=".txt")
+    cache.set("k", b"value")
+    assert cache.get("k") == b"value"
+
+    path = cache._path("k")
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert cache.get("k") is None
+    assert not os.path.exists(path)
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["entries"] == 0
+
+
+def test_size_based_eviction_keeps_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), 10, suffix=".txt")
+    cache.set("a", b"aaaa")
+    cache.set("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.set("c", b"cccc")
+    # 超出容量时淘汰最久未访问的 b
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa" and cache.get("c") == b"cccc"
+    assert cache.stats()["bytes"] == 8
+
+    # 超过总容量的条目不写入
+    cache.set("huge", b"x" * 11)
+    assert cache.get("huge") is None
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,235 @@
+"""模型调用容错测试 - 针对注入故障的本地桩服务验证重试、Retry-After、截止时间、对冲与流式重试不重复输出"""
+import asyncio
+import tempfile
+import time
+from contextlib import contextmanager
+
+import openai
+
+import api.routes as routes
+import services.llm_engine as llm_engine
+import services.resilience as resilience
+from stub_openrouter import IMAGE_USAGE, PNG_BYTES, Fault, StubOpenRouter
+
+TEXT = "第一段说明书正文。第二段说明书正文。第三段说明书正文。"
+MESSAGES = [{"role": "user", "content": "测试"}]
+
+
+@contextmanager
+def _patched(**overrides):
+    """临时覆盖 resilience 模块配置，并使用独立的延迟统计"""
+    overrides.setdefault("LLM_RETRY_BASE_DELAY", 0.01)
+    overrides.setdefault("latency", resilience.LatencyTracker())
+    saved = {name: getattr(resilience, name) for name in overrides}
+    saved_engine = (llm_engine.OPENROUTER_BASE_URL, llm_engine.LLM_CACHE_ENABLED)
+    for name, value in overrides.items():
+        setattr(resilience, name, value)
+    llm_engine.LLM_CACHE_ENABLED = False
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(resilience, name, value)
+        llm_engine.OPENROUTER_BASE_URL, llm_engine.LLM_CACHE_ENABLED = saved_engine
+
+
+def _with_stub(faults, body, **stub_kwargs):
+    """启动桩服务并注入故障，执行 body(stub)"""
+    async def _main():
+        stub = StubOpenRouter(text=TEXT, **stub_kwargs)
+        stub.faults = list(faults)
+        await stub.start()
+        llm_engine.OPENROUTER_BASE_URL = stub.base_url
+        try:
+            return stub, await body(stub)
+        finally:
+            await llm_engine.aclose_clients()
+            await stub.stop()
+
+    return asyncio.run(_main())
+
+
+def test_retry_after_then_success():
+    with _patched():
+        faults = [Fault(429, headers={"Retry-After": "0.3"}), Fault(503)]
+        start = time.perf_counter()
+        stub, text = _with_stub(
+            faults, lambda stub: llm_engine.collect_completion("m", MESSAGES, "key"),
+        )
+        elapsed = time.perf_counter() - start
+    assert text == TEXT
+    assert stub.requests == 3
+    assert elapsed >= 0.3, f"Retry-After 未被遵守: {elapsed:.2f}s"
+
+
+def test_client_error_not_retried():
+    with _patched():
+        try:
+            _with_stub([Fault(400)], lambda stub: llm_engine.collect_completion("m", MESSAGES, "key"))
+        except openai.BadRequestError:
+            pass
+        else:
+            raise AssertionError("400 应直接抛出")
+
+
+def test_midstream_drop_no_duplicate_text():
+    """流中断开后重新生成：最终文本与前端按事件重建的内容都不含重复片段"""
+    task_id = "resilience-reset"
+    routes.store.create(task_id, {"task_dir": tempfile.mkdtemp(), "figures": []})
+
+    async def body(stub):
+        gen = llm_engine.step_1_basic_structure("论文", "范本", "key")
+        text = await routes._collect_stream(task_id, gen, "1")
+        routes.batcher.flush(task_id)
+        return text
+
+    try:
+        with _patched():
+            stub, text = _with_stub([Fault(drop_after=3)], body)
+        events = routes.store.read_events(task_id)
+    finally:
+        routes.store.delete(task_id)
+
+    assert stub.requests == 2
+    assert text == TEXT
+    # 按前端逻辑重放事件
+    shown = ""
+    for event in events:
+        if event["type"] == "reset":
+            shown = ""
+        elif event["type"] == "content":
+            shown += event["text"]
+    assert shown == TEXT
+    assert sum(event["type"] == "reset" for event in events) == 1
+
+
+def test_deadline_bounds_total_time():
+    with _patched(LLM_CALL_DEADLINE=0.5, LLM_RETRY_BASE_DELAY=0.1, LLM_RETRY_MAX_ATTEMPTS=100):
+        start = time.perf_counter()
+        try:
+            _with_stub(
+                [Fault(503)] * 100,
+                lambda stub: llm_engine.collect_completion("m", MESSAGES, "key"),
+            )
+        except (openai.InternalServerError, resilience.DeadlineExceeded):
+            # 截止时间落在退避等待前抛出最后一次 503，落在请求进行中则为 DeadlineExceeded
+            pass
+        else:
+            raise AssertionError("持续 503 应在截止时间内失败")
+        elapsed = time.perf_counter() - start
+    assert elapsed < 1.0, f"截止时间未生效: {elapsed:.2f}s"
+
+
+def _paced_stream(pieces, gap: float, stall_after: int = None):
+    """按固定间隔输出片段；stall_after 个片段后卡住不再输出"""
+    async def _gen():
+        for i, piece in enumerate(pieces):
+            if stall_after is not None and i >= stall_after:
+                await asyncio.sleep(3600)
+            await asyncio.sleep(gap)
+            yield piece
+    return _gen()
+
+
+def _collect(op, streams):
+    async def _main():
+        return [piece async for piece in resilience.stream_with_retry(op, lambda: next(streams))]
+    return asyncio.run(_main())
+
+
+def test_stream_not_capped_by_deadline():
+    """截止时间只约束首个片段：持续输出的长流超过截止时间也能完整结束"""
+    pieces = [f"第{i}段。" for i in range(10)]
+    with _patched(LLM_CALL_DEADLINE=0.2, LLM_STREAM_IDLE_TIMEOUT=0.5):
+        start = time.perf_counter()
+        result = _collect("stream:long", iter([_paced_stream(pieces, 0.05)]))
+        elapsed = time.perf_counter() - start
+    assert result == pieces
+    assert elapsed > 0.2
+
+
+def test_stream_idle_timeout_retries():
+    """流中途卡住超过空闲超时：重置后重新生成，而不是等到截止时间"""
+    pieces = ["甲", "乙", "丙"]
+    streams = iter([_paced_stream(pieces, 0.01, stall_after=1), _paced_stream(pieces, 0.01)])
+    with _patched(LLM_CALL_DEADLINE=60, LLM_STREAM_IDLE_TIMEOUT=0.2):
+        start = time.perf_counter()
+        result = _collect("stream:stall", streams)
+        elapsed = time.perf_counter() - start
+    assert result == ["甲", resilience.STREAM_RESET, "甲", "乙", "丙"]
+    assert elapsed < 1.0, f"空闲超时未生效: {elapsed:.2f}s"
+
+
+def test_figure_retries_then_succeeds():
+    with _patched():
+        stub, image = _with_stub(
+            [Fault(502), Fault(500)],
+            lambda stub: llm_engine.step_6_generate_figure("流程图", 0, "key"),
+        )
+    assert image == PNG_BYTES
+    assert stub.requests == 3
+
+
+def test_figure_settles_rate_limit_reservation(monkeypatch):
+    settled = []
+    acquire = llm_engine.rate_limiter.acquire
+
+    async def _acquire(*args, **kwargs):
+        reservation = await acquire(*args, **kwargs)
+        settle = reservation.settle
+
+        def _settle(tokens):
+            settled.append(tokens)
+            settle(tokens)
+
+        reservation.settle = _settle
+        return reservation
+
+    monkeypatch.setattr(llm_engine.rate_limiter, "acquire", _acquire)
+    with _patched():
+        stub, image = _with_stub(
+            [Fault(502)],
+            lambda stub: llm_engine.step_6_generate_figure("流程图", 0, "key"),
+        )
+    assert image == PNG_BYTES
+    # 每次尝试都结算：失败的一次只计输入，成功的一次按响应中的 usage
+    assert len(settled) == 2
+    assert 0 < settled[0] < IMAGE_USAGE["total_tokens"]
+    assert settled[1] == IMAGE_USAGE["total_tokens"]
+
+
+def test_hedge_cuts_tail_latency():
+    tracker = resilience.LatencyTracker()
+    for _ in range(resilience.LLM_HEDGE_MIN_SAMPLES):
+        tracker.record(f"image:{llm_engine.MODEL_IMAGE_GEN}", 0.05)
+
+    before = resilience.stats()
+    with _patched(LLM_HEDGE_PERCENTILE=95, latency=tracker):
+        start = time.perf_counter()
+        stub, image = _with_stub(
+            [Fault(delay=3.0)],
+            lambda stub: llm_engine.step_6_generate_figure("流程图", 0, "key"),
+        )
+        elapsed = time.perf_counter() - start
+    after = resilience.stats()
+
+    assert image == PNG_BYTES
+    assert elapsed < 1.0, f"对冲未生效: {elapsed:.2f}s"
+    assert after["hedges"] - before["hedges"] == 1
+    assert after["hedge_wins"] - before["hedge_wins"] == 1
+
+
+if __name__ == "__main__":
+    test_retry_after_then_success()
+    test_client_error_not_retried()
+    test_midstream_drop_no_duplicate_text()
+    test_deadline_bounds_total_time()
+    test_stream_not_capped_by_deadline()
+    test_stream_idle_timeout_retries()
+    test_figure_retries_then_succeeds()
+    import pytest
+
+    with pytest.MonkeyPatch.context() as mp:
+        test_figure_settles_rate_limit_reservation(mp)
+    test_hedge_cuts_tail_latency()
+    print("OK")
@@ -0,0 +1,115 @@
+"""Markdown 清洗测试 - 预编译版本与原逐条 re.sub 实现逐字节一致（随机构造输入），流式清洗与整段清洗一致"""
+import random
+import re
+
+from services import doc_generator
+from services.doc_generator import MarkdownCleaner, clean_markdown
+
+SEED = 20261016
+CASES = 4000
+
+
+def _reference_clean_markdown(text: str) -> str:
+    """改造前的 clean_markdown，原样保留作为对照"""
+    text = re.sub(r'```[\s\S]*?```', lambda m: m.group().replace('```', ''), text)
+    text = text.replace('```', '')
+    text = re.sub(r'\*\*\*(.*?)\*\*\*', r'\1', text)
+    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
+    text = re.sub(r'\*(.*?)\*', r'\1', text)
+    text = re.sub(r'__(.*?)__', r'\1', text)
+    text = re.sub(r'_(.*?)_', r'\1', text)
+    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'^[\-\*]\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+    text = re.sub(r'!\[([^\]]*)\]\([^\)]+\)', r'（图片：\1）', text)
+    text = re.sub(r'^[\-\*\_]{3,}\s*$', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+# 偏向 Markdown 标记与换行的片段，便于构造各步替换相互影响、跨行匹配的输入
+_TOKENS = [
+    "*", "**", "***", "_", "__", "#", "# ", "## ", "####### ", "-", "- ", "* ", "---", "***\n", "___",
+    "```", "`", "``", "[", "]", "(", ")", "![", "](", "](http://x.cn)", "[链接](u)", "![图](a.png)",
+    "\n", "\n", "\n", "\n\n", "\n\n\n", " ", "  ", "\t", "\r\n",
+    "a", "b", "技术", "领域", "。", "1. ", "[0001]", "一种方法",
+]
+
+
+def _random_markdown(rng: random.Random) -> str:
+    return "".join(rng.choice(_TOKENS) for _ in range(rng.randint(0, 120)))
+
+
+def _random_chunks(rng: random.Random, text: str):
+    pos = 0
+    while pos < len(text):
+        step = rng.randint(1, 40)
+        yield text[pos:pos + step]
+        pos += step
+
+
+def _stream(chunks) -> str:
+    cleaner = MarkdownCleaner()
+    emitted = "".join(cleaner.feed(c) for c in chunks)
+    full = cleaner.close()
+    assert full.startswith(emitted.rstrip()) or not emitted.strip()
+    return full
+
+
+def test_matches_reference_on_random_markdown():
+    rng = random.Random(SEED)
+    for _ in range(CASES):
+        text = _random_markdown(rng)
+        assert clean_markdown(text) == _reference_clean_markdown(text), repr(text)
+
+
+def test_matches_reference_on_llm_like_text():
+    text = (
+        "# 一种基于图神经网络的交通流预测方法\n\n## 技术领域\n\n本发明涉及**智能交通**领域，"
+        "具体涉及一种 *时空* 预测方法。\n\n---\n\n- 步骤一：采集数据\n- 步骤二：构建 __路网图__\n\n"
+        "```python\nx = model(g)\n```\n\n参见[论文](https://example.com)与![](fig.png)。\n\n\n\n"
+        "具体实施方式\n\n[0001] 实施例一\n"
+    )
+    assert clean_markdown(text) == _reference_clean_markdown(text)
+
+
+def _check_streaming(cases: int):
+    rng = random.Random(SEED + 1)
+    for _ in range(cases):
+        text = _random_markdown(rng)
+        assert _stream(_random_chunks(rng, text)) == _reference_clean_markdown(text), repr(text)
+
+
+def test_streaming_matches_whole_text(monkeypatch):
+    # 每个含换行的 chunk 都尝试切分，尽量多地覆盖切分点
+    monkeypatch.setattr(doc_generator, "_MIN_CUT_CHARS", 0)
+    _check_streaming(CASES // 2)
+
+
+def test_streaming_emits_before_close():
+    paragraphs = [f"## 第{i}节\n\n**要点{i}**：正文内容，" + "说明。" * 40 + "\n\n" for i in range(50)]
+    cleaner = MarkdownCleaner()
+    emitted = "".join(cleaner.feed(p) for p in paragraphs)
+    # 大部分段落在输出结束前就已清洗完毕
+    assert emitted.count("正文内容") >= 45
+    assert cleaner.close() == clean_markdown("".join(paragraphs))
+
+
+def test_unclosed_fence_waits_for_more_output():
+    opening = "开头段落" + "。" * 300
+    code = "```\n代码\n\n继续" + "。" * 300 + "\n\n"
+    cleaner = MarkdownCleaner()
+    # 代码块未闭合时，只能输出代码块之前的部分
+    assert cleaner.feed(opening + "\n\n" + code) == opening
+    assert "继续" in cleaner.feed("```\n\n结尾\n\n尾声")
+    assert cleaner.close() == clean_markdown(opening + "\n\n" + code + "```\n\n结尾\n\n尾声")
+
+
+if __name__ == "__main__":
+    test_matches_reference_on_random_markdown()
+    test_matches_reference_on_llm_like_text()
+    test_streaming_emits_before_close()
+    test_unclosed_fence_waits_for_more_output()
+    doc_generator._MIN_CUT_CHARS = 0
+    _check_streaming(CASES // 2)
+    print("OK")
@@ -0,0 +1,102 @@
+"""OCR 常驻子进程测试 - 用假模型加载器验证只加载一次、并发请求排队、预热状态与崩溃后重启"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.ocr_worker import OcrWorker
+
+LOAD_SECONDS = 0.5
+
+
+def fake_loader():
+    """模拟耗时的模型加载；返回的转换函数报告所在进程与加载次数"""
+    time.sleep(LOAD_SECONDS)
+    state = {"loads": int(os.environ.get("FAKE_OCR_LOADS", "0")) + 1}
+    os.environ["FAKE_OCR_LOADS"] = str(state["loads"])
+
+    def _convert(pdf_path: str) -> str:
+        if pdf_path.endswith("crash.pdf"):
+            os._exit(1)
+        if pdf_path.endswith("bad.pdf"):
+            raise ValueError("无法识别")
+        return f"{os.getpid()}:{state['loads']}:{os.path.basename(pdf_path)}"
+
+    return _convert
+
+
+def test_concurrent_requests_load_model_once():
+    worker = OcrWorker(loader=fake_loader)
+    try:
+        assert not worker.status()["warm"]
+        with ThreadPoolExecutor(8) as pool:
+            futures = list(pool.map(lambda i: worker.convert(f"doc{i}.pdf"), range(8)))
+        results = [f.result(timeout=60) for f in futures]
+        pids = {r.split(":")[0] for r in results}
+        loads = {r.split(":")[1] for r in results}
+        assert len(pids) == 1 and pids != {str(os.getpid())}
+        assert loads == {"1"}
+        assert sorted(r.split(":")[2] for r in results) == sorted(f"doc{i}.pdf" for i in range(8))
+
+        status = worker.status()
+        assert status["warm"] and status["running"] and not status["loading"]
+        assert status["served"] == 8
+        assert status["load_seconds"] >= LOAD_SECONDS
+    finally:
+        worker.shutdown()
+    assert not worker.running
+
+
+def test_warmup_then_fast_first_request():
+    worker = OcrWorker(loader=fake_loader)
+    try:
+        worker.warmup()
+        assert worker.status()["loading"]
+        worker.warmup().result(timeout=60)
+        assert worker.status()["warm"]
+        started = time.monotonic()
+        worker.convert("first.pdf").result(timeout=60)
+        assert time.monotonic() - started < LOAD_SECONDS
+    finally:
+        worker.shutdown()
+
+
+def test_errors_and_crash_restart():
+    worker = OcrWorker(loader=fake_loader)
+    try:
+        with pytest.raises(RuntimeError, match="无法识别"):
+            worker.convert("bad.pdf").result(timeout=60)
+        # 转换出错不影响子进程
+        first_pid = worker.convert("ok.pdf").result(timeout=60).split(":")[0]
+
+        with pytest.raises(RuntimeError, match="异常退出"):
+            worker.convert("crash.pdf").result(timeout=60)
+        assert not worker.status()["warm"]
+
+        # 下一个请求自动重启子进程并重新加载
+        second_pid = worker.convert("again.pdf").result(timeout=60).split(":")[0]
+        assert second_pid != first_pid
+        assert worker.status()["restarts"] == 1
+    finally:
+        worker.shutdown()
+
+
+def test_health_reports_ocr_status():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        body = client.get("/api/health").json()
+    assert body["status"] == "ok"
+    assert set(body["ocr"]) >= {"available", "running", "warm", "loading"}
+    assert "job_queue" in body
+
+
+if __name__ == "__main__":
+    test_concurrent_requests_load_model_once()
+    test_warmup_then_fast_first_request()
+    test_errors_and_crash_restart()
+    test_health_reports_ocr_status()
+    print("OK")
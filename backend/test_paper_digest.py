@@ -0,0 +1,105 @@
+"""超长论文分块摘要测试 - 使用桩摘要函数验证切分、并发上限、顺序与摘要大小上限"""
+import asyncio
+import re
+
+from services.rate_limiter import estimate_tokens
+from services.summarizer import build_digest, chunk_text, split_sections, truncate_to_tokens
+
+
+def _long_paper(sections: int = 40, paragraphs: int = 6) -> str:
+    parts = ["基于图神经网络的交通流预测方法\n\n摘要\n本文提出一种新的预测方法。\n\n"]
+    for i in range(1, sections + 1):
+        parts.append(f"{i} 第{i}节\n")
+        for j in range(paragraphs):
+            parts.append(f"【S{i:02d}P{j}】" + "该方法通过时空注意力机制建模路网节点之间的依赖关系。" * 12 + "\n\n")
+    return "".join(parts)
+
+
+class _StubSummarizer:
+    """按目标长度截取片段开头，并记录并发峰值"""
+
+    def __init__(self, latency: float = 0.01, shrink: bool = True):
+        self.latency = latency
+        self.shrink = shrink
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def __call__(self, chunk: str, target_tokens: int) -> str:
+        self.active += 1
+        self.calls += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+            return truncate_to_tokens(chunk, target_tokens) if self.shrink else chunk
+        finally:
+            self.active -= 1
+
+
+def test_estimate_tokens_offline():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("中文字符") == 4
+    assert estimate_tokens("graph neural network") == 5
+    assert estimate_tokens("图 neural") == 3
+
+
+def test_split_by_section_headings():
+    text = "# Title\nintro\n## 1 Method\nbody\n2.1 Details of model\nmore\n参考文献\n[1] ref\n"
+    sections = split_sections(text)
+    assert "".join(sections) == text
+    assert [s.splitlines()[0] for s in sections] == [
+        "# Title", "## 1 Method", "2.1 Details of model", "参考文献",
+    ]
+
+
+def test_chunks_respect_token_limit_and_order():
+    paper = _long_paper()
+    chunks = chunk_text(paper, 3000)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 3000 for c in chunks)
+    markers = [m for c in chunks for m in re.findall(r"【(S\d+P\d)】", c)]
+    assert markers == sorted(markers)
+    assert len(markers) == 40 * 6
+
+
+def test_short_paper_passthrough():
+    stub = _StubSummarizer()
+    paper = "短论文正文。" * 100
+    digest = asyncio.run(build_digest(paper, stub, budget=10000))
+    assert digest == paper
+    assert stub.calls == 0
+
+
+def test_long_paper_digest_bounded_and_concurrent():
+    paper = _long_paper()
+    stub = _StubSummarizer()
+    progress = []
+    digest = asyncio.run(build_digest(
+        paper, stub, budget=8000, chunk_tokens=3000, concurrency=3,
+        on_progress=lambda done, total: progress.append((done, total)),
+    ))
+    assert estimate_tokens(digest) <= 8000
+    assert stub.peak == 3
+    # 每轮都报告进度，最后一条为最后一轮完成
+    assert progress[-1][0] == progress[-1][1]
+    assert len(progress) == stub.calls
+    # 摘要保留原文顺序
+    assert digest.index("S01P0") < digest.index("S20P0") < digest.index("S40P0")
+    print(f"原文 {estimate_tokens(paper)} tokens -> 摘要 {estimate_tokens(digest)} tokens，调用 {stub.calls} 次")
+
+
+def test_digest_bounded_even_if_model_does_not_shrink():
+    paper = _long_paper(sections=10)
+    stub = _StubSummarizer(latency=0, shrink=False)
+    digest = asyncio.run(build_digest(paper, stub, budget=2000, chunk_tokens=1500))
+    assert estimate_tokens(digest) <= 2000
+
+
+if __name__ == "__main__":
+    test_estimate_tokens_offline()
+    test_split_by_section_headings()
+    test_chunks_respect_token_limit_and_order()
+    test_short_paper_passthrough()
+    test_long_paper_digest_bounded_and_concurrent()
+    test_digest_bounded_even_if_model_does_not_shrink()
+    print("OK")
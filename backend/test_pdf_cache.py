@@ -0,0 +1,116 @@
+"""PDF 解析缓存测试 - 命中时跳过解析、解析器签名变化时缓存键随之变化、按容量淘汰最久未访问的结果、
+/api/stats 上报命中与未命中计数"""
+import asyncio
+
+import pytest
+
+from services import pdf_parser
+from services.disk_cache import DiskCache
+
+
+class _Parser:
+    """替代 _parse_uncached：记录实际解析的文件，返回固定长度的文本"""
+
+    def __init__(self):
+        self.parsed = []
+
+    async def __call__(self, file_path):
+        self.parsed.append(file_path)
+        return f"解析结果:{file_path[-5:]}"
+
+
+@pytest.fixture
+def parser(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_parser, "_parse_cache", DiskCache(str(tmp_path / "cache"), 1024 * 1024, suffix=".txt"))
+    parser = _Parser()
+    monkeypatch.setattr(pdf_parser, "_parse_uncached", parser)
+    return parser
+
+
+def _pdf(tmp_path, name: str) -> str:
+    path = tmp_path / name
+    path.write_bytes(f"%PDF-1.4 {name}".encode("utf-8"))
+    return str(path)
+
+
+def _parse(path: str) -> str:
+    return asyncio.run(pdf_parser.parse_pdf(path))
+
+
+def test_hit_skips_parsing(tmp_path, parser):
+    path = _pdf(tmp_path, "a.pdf")
+    first = _parse(path)
+    assert _parse(path) == first
+    assert parser.parsed == [path]
+
+    # 相同内容的另一个文件同样命中
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes(open(path, "rb").read())
+    assert _parse(str(copy)) == first
+    assert parser.parsed == [path]
+    stats = pdf_parser.cache_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+
+
+def test_key_changes_with_parser_signature(tmp_path, parser, monkeypatch):
+    path = _pdf(tmp_path, "a.pdf")
+    file_hash = pdf_parser.hash_file(path)
+    key = pdf_parser._cache_key(file_hash)
+    _parse(path)
+
+    # 提取逻辑版本变化
+    monkeypatch.setattr(pdf_parser, "PARSE_VERSION", pdf_parser.PARSE_VERSION + 1)
+    bumped = pdf_parser._cache_key(file_hash)
+    assert bumped != key
+    _parse(path)
+    assert parser.parsed == [path, path]
+
+    # 解析后端或其版本变化
+    monkeypatch.setattr(pdf_parser, "HAS_MARKER", True)
+    monkeypatch.setattr(pdf_parser, "_package_version", lambda name: "9.9.9")
+    assert pdf_parser._cache_key(file_hash) not in (key, bumped)
+    _parse(path)
+    assert len(parser.parsed) == 3
+
+
+def test_lru_eviction(tmp_path, parser, monkeypatch):
+    a, b, c = (_pdf(tmp_path, name) for name in ("a.pdf", "b.pdf", "c.pdf"))
+    entry_size = len(asyncio.run(parser(a)).encode("utf-8"))
+    parser.parsed.clear()
+    # 只容得下两条解析结果
+    monkeypatch.setattr(pdf_parser, "_parse_cache", DiskCache(str(tmp_path / "small"), entry_size * 2, suffix=".txt"))
+
+    _parse(a)
+    _parse(b)
+    _parse(a)  # 命中，a 成为最近访问
+    _parse(c)  # 淘汰最久未访问的 b
+    assert parser.parsed == [a, b, c]
+    _parse(a)
+    _parse(c)
+    assert parser.parsed == [a, b, c]
+    _parse(b)
+    assert parser.parsed == [a, b, c, b]
+
+
+def test_stats_endpoint_reports_counters(tmp_path, parser, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    path = _pdf(tmp_path, "a.pdf")
+    _parse(path)
+    _parse(path)
+    _parse(path)
+
+    monkeypatch.chdir(tmp_path)
+    with TestClient(main.app) as client:
+        resp = client.get("/api/stats")
+    assert resp.status_code == 200
+    pdf_cache = resp.json()["pdf_cache"]
+    assert pdf_cache["hits"] == 2 and pdf_cache["misses"] == 1 and pdf_cache["entries"] == 1
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(pytest.main([__file__, "-q"]))
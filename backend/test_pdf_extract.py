@@ -0,0 +1,58 @@
+"""PDF 分片提取测试 - 多进程按页范围提取的结果与串行一致且按页序拼接，小文档走串行"""
+import asyncio
+import os
+import tempfile
+
+import fitz
+
+from services import pdf_extract
+from services.pdf_parser import _pages_to_text, _parse_with_pymupdf
+
+
+def _make_pdf(pages: int) -> str:
+    path = os.path.join(tempfile.mkdtemp(), "pages.pdf")
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        if i % 7 != 3:  # 夹杂空白页
+            page.insert_text((72, 72), f"page {i:03d} " + "patent text " * 8)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_page_ranges_cover_all_pages():
+    assert pdf_extract.page_ranges(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    for count, shards in [(300, 4), (65, 4), (17, 1)]:
+        ranges = pdf_extract.page_ranges(count, shards)
+        assert ranges[0][0] == 0 and ranges[-1][1] == count
+        assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+def test_parallel_matches_serial():
+    path = _make_pdf(80)
+    saved = pdf_extract.PDF_PARALLEL_MIN_PAGES
+    pdf_extract.PDF_PARALLEL_MIN_PAGES = 32
+    try:
+        pages = asyncio.run(pdf_extract.extract_pages(path, workers=3))
+        assert pdf_extract._pool is not None
+    finally:
+        pdf_extract.PDF_PARALLEL_MIN_PAGES = saved
+        pdf_extract.shutdown_pool()
+    assert len(pages) == 80
+    assert [p[:8] for p in pages if p.strip()][:3] == ["page 000", "page 001", "page 002"]
+    assert _pages_to_text(pages) == _parse_with_pymupdf(path)
+
+
+def test_small_document_stays_serial():
+    path = _make_pdf(10)
+    pages = asyncio.run(pdf_extract.extract_pages(path, workers=4))
+    assert len(pages) == 10
+    assert pdf_extract._pool is None
+
+
+if __name__ == "__main__":
+    test_page_ranges_cover_all_pages()
+    test_parallel_matches_serial()
+    test_small_document_stays_serial()
+    print("OK")
@@ -0,0 +1,91 @@
+"""逐页 OCR 回退测试 - 混合文档只把含图片的低文本页分批送去 OCR，结果按页序合并"""
+import asyncio
+import os
+import tempfile
+
+import fitz
+
+import services.pdf_parser as pdf_parser
+
+TEXT_LINE = "Born-digital page with plenty of extractable text for the parser. "
+SCANNED = {3, 4, 9, 15}
+
+
+def _make_mixed_pdf(pages: int = 18) -> str:
+    """普通文本页 + 只有图片和少量文字的“扫描页” + 一张完全空白的页"""
+    path = os.path.join(tempfile.mkdtemp(), "mixed.pdf")
+    doc = fitz.open()
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 32, 32), False)
+    pixmap.clear_with(200)
+    for i in range(pages):
+        page = doc.new_page()
+        if i in SCANNED:
+            page.insert_image(fitz.Rect(72, 100, 300, 300), pixmap=pixmap)
+            page.insert_text((72, 72), f"S{i}")
+        elif i == 12:
+            continue  # 空白页：无文字无图片，不需要 OCR
+        else:
+            page.insert_text((72, 72), f"P{i} " + TEXT_LINE)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+class _StubMarker:
+    """读取子 PDF 每页的标记文字，按 Marker 分页格式返回"""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, batch_path: str) -> str:
+        with fitz.open(batch_path) as doc:
+            labels = [doc[i].get_text("text").strip() for i in range(len(doc))]
+        self.batches.append(labels)
+        return "".join(f"\n\n{{{i}}}" + "-" * 48 + f"\n\nOCR({label})" for i, label in enumerate(labels))
+
+
+def _parse(path: str, batch_pages: int):
+    stub = _StubMarker()
+    saved = (pdf_parser.HAS_MARKER, pdf_parser._run_marker, pdf_parser.OCR_BATCH_PAGES)
+    pdf_parser.HAS_MARKER = True
+    pdf_parser._run_marker = stub
+    pdf_parser.OCR_BATCH_PAGES = batch_pages
+    try:
+        text = asyncio.run(pdf_parser._parse_uncached(path))
+    finally:
+        pdf_parser.HAS_MARKER, pdf_parser._run_marker, pdf_parser.OCR_BATCH_PAGES = saved
+    return text, stub
+
+
+def test_only_scanned_pages_are_ocred():
+    path = _make_mixed_pdf()
+    text, stub = _parse(path, batch_pages=3)
+    # 只有 4 个扫描页进入 OCR，按 3 页一批
+    assert stub.batches == [["S3", "S4", "S9"], ["S15"]]
+    # 合并后保持页序
+    order = [text.index(marker) for marker in ("P2 ", "OCR(S3)", "OCR(S4)", "P5 ", "OCR(S9)", "P11", "OCR(S15)", "P17")]
+    assert order == sorted(order)
+    assert "S3\n" not in text  # 扫描页原有的少量文字被 OCR 结果替换
+
+
+def test_digital_document_skips_ocr():
+    path = os.path.join(tempfile.mkdtemp(), "digital.pdf")
+    doc = fitz.open()
+    for i in range(5):
+        doc.new_page().insert_text((72, 72), f"P{i} " + TEXT_LINE)
+    doc.save(path)
+    doc.close()
+    text, stub = _parse(path, batch_pages=8)
+    assert stub.batches == []
+    assert text == pdf_parser._parse_with_pymupdf(path)
+
+
+def test_split_marker_pages_mismatch_keeps_text():
+    assert pdf_parser._split_marker_pages("no separators", 3) == ["no separators", "", ""]
+
+
+if __name__ == "__main__":
+    test_only_scanned_pages_are_ocred()
+    test_digital_document_skips_ocr()
+    test_split_marker_pages_mismatch_keeps_text()
+    print("OK")
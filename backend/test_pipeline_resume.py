@@ -0,0 +1,198 @@
+"""断点续跑测试 - 用桩模型步骤跑完整管道：部分附图失败时不写附图检查点、任务完成并标出缺失的附图，续跑只补生成缺失的附图；
+说明书正文在生成时流式清洗，结果与对全文整段清洗一致"""
+import asyncio
+import os
+import threading
+
+import api.routes as routes
+from services import event_log, figure_process
+from services.checkpoint import CheckpointStore
+
+FIGURE_PROMPTS = "图1：系统结构\n图2：方法流程\n图3：模块连接\n图4：时序关系"
+
+
+def _fake_stream(text: str, chunk: int = 0):
+    """桩模型步骤：输出 text；chunk 大于 0 时按该长度分段输出"""
+    def _step(*args, **kwargs):
+        async def _gen():
+            if chunk <= 0:
+                yield text
+                return
+            for i in range(0, len(text), chunk):
+                yield text[i:i + chunk]
+        return _gen()
+    return _step
+
+
+class _FakeImages:
+    """第一轮 图1 失败，之后全部成功；记录每次请求的序号"""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = {0}
+
+    async def __call__(self, prompt, index, api_key=None):
+        self.calls.append(index)
+        await asyncio.sleep(0)
+        if index in self.fail:
+            return None
+        return b"\x89PNG\r\n\x1a\nfigure-%d" % index
+
+
+def _setup(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(event_log, "EVENT_LOG_DIR", str(tmp_path / "events"))
+    monkeypatch.setattr(figure_process, "FIGURE_POSTPROCESS", False)
+
+    async def _parse_pdf(path, file_hash=None):
+        return "论文全文"
+
+    monkeypatch.setattr(routes, "parse_pdf", _parse_pdf)
+    monkeypatch.setattr(routes, "step_1_basic_structure", _fake_stream("一种方法\n技术领域\n内容"))
+    monkeypatch.setattr(routes, "step_2_embodiments", _fake_stream("实施例一"))
+    monkeypatch.setattr(routes, "step_3_claims", _fake_stream("1. 一种方法。"))
+    monkeypatch.setattr(routes, "step_4_abstract", _fake_stream("本发明公开了一种方法。"))
+    monkeypatch.setattr(routes, "step_5_visual_prompts", _fake_stream(FIGURE_PROMPTS))
+    images = _FakeImages()
+    monkeypatch.setattr(routes, "step_6_generate_figure", images)
+
+    queued = []
+
+    async def _enqueue(task_id):
+        queued.append(task_id)
+        return 0
+
+    monkeypatch.setattr(routes, "_enqueue", _enqueue)
+    return images, queued
+
+
+def _step_status(task_id):
+    """按事件重放各步骤最后的 step_done 状态"""
+    return {e["step"]: e["status"] for e in routes.store.read_events(task_id) if e["type"] == "step_done"}
+
+
+def test_partial_figure_failure_then_resume(tmp_path, monkeypatch):
+    images, queued = _setup(tmp_path, monkeypatch)
+    task_id = "resume-test-0001"
+    task = routes._new_task(task_id, "paper.pdf", None, {})
+    os.makedirs(task["task_dir"])
+    open("paper.pdf", "wb").close()
+    routes.store.create(task_id, task)
+    ckpt = CheckpointStore(task["task_dir"])
+
+    try:
+        asyncio.run(routes.process_patent_pipeline(task_id))
+        t = routes.store.get(task_id)
+        # 文档可下载，任务记为完成并标出缺失的附图
+        assert t["status"] == "completed" and not t["error"]
+        assert t["figures_missing"] == [1]
+        assert asyncio.run(routes.get_status(task_id))["figures_missing"] == [1]
+        assert [os.path.basename(p) for p in t["figures"]] == ["图2.png", "图3.png", "图4.png"]
+        # 文档照常生成，附图检查点未写入
+        assert {"specification", "claims", "abstract"} <= set(t["files"])
+        assert ckpt.has("visual_prompts") and not ckpt.has("figures")
+        # 每个步骤单独报告完成，附图步骤报告失败
+        assert _step_status(task_id) == {**{str(i): "completed" for i in range(6)}, "6": "failed"}
+
+        resp = asyncio.run(routes.resume_task(task_id))
+        assert resp["resume_from"] == "6" and queued == [task_id]
+
+        images.fail = set()
+        images.calls.clear()
+        asyncio.run(routes.process_patent_pipeline(task_id))
+        t = routes.store.get(task_id)
+        # 只补生成缺失的 图1
+        assert images.calls == [0]
+        assert t["status"] == "completed"
+        assert [os.path.basename(p) for p in t["figures"]] == [f"图{i}.png" for i in range(1, 5)]
+        assert ckpt.load("figures") == t["figures"]
+        assert t["figures_missing"] == []
+        # 附图齐全后不能再续跑
+        try:
+            asyncio.run(routes.resume_task(task_id))
+        except routes.HTTPException as e:
+            assert e.status_code == 409
+        else:
+            raise AssertionError("附图齐全的已完成任务应返回 409")
+        assert "figures_doc" in t["files"]
+        # 续跑时从检查点恢复的步骤同样报告完成
+        assert _step_status(task_id) == {str(i): "completed" for i in range(7)}
+    finally:
+        routes.store.delete(task_id)
+
+
+def test_samples_parsed_off_event_loop(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    threads = []
+
+    def _read_sample(ref):
+        threads.append(threading.current_thread())
+        return f"范本 {ref}"
+
+    monkeypatch.setattr(routes, "_read_sample", _read_sample)
+    task_id = "resume-test-0002"
+    # 旧任务记录的是范本文件路径，解析 DOCX 不能阻塞事件循环
+    samples = {"spec_sample": "samples/spec.docx", "claims_sample": "samples/claims.docx"}
+    task = routes._new_task(task_id, "paper.pdf", None, samples)
+    os.makedirs(task["task_dir"])
+    open("paper.pdf", "wb").close()
+    routes.store.create(task_id, task)
+    try:
+        asyncio.run(routes.process_patent_pipeline(task_id))
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+    finally:
+        routes.store.delete(task_id)
+
+
+SPEC_PART_1 = "# 一种方法\n\n## 技术领域\n\n本发明涉及**图像处理**领域。\n\n" + "- 第一要点\n\n" * 40 + "```\n代码\n```"
+SPEC_PART_2 = "### 实施例一\n\n按照 *步骤一* 执行。\n\n\n\n" + "[参考](http://example.com) 说明。\n\n" * 40
+
+
+def test_specification_cleaned_while_streaming(tmp_path, monkeypatch):
+    from docx import Document
+
+    from services import doc_generator
+    from services.doc_generator import generator
+
+    def _paragraphs(path):
+        return [p.text for p in Document(path).paragraphs]
+
+    # 对照：改造前对全文整段清洗得到的段落
+    full_spec = SPEC_PART_1 + routes.SPEC_SECTION_SEPARATOR + SPEC_PART_2
+    expected = [text for text, _, _ in generator.specification_paragraphs(full_spec.split("\n")[0][:25], full_spec)]
+
+    _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(routes, "step_1_basic_structure", _fake_stream(SPEC_PART_1, chunk=7))
+    monkeypatch.setattr(routes, "step_2_embodiments", _fake_stream(SPEC_PART_2, chunk=5))
+    full_calls = []
+    for module in (routes, doc_generator):
+        monkeypatch.setattr(module, "clean_markdown", lambda text: full_calls.append(text) or text)
+    task_id = "resume-test-0003"
+    task = routes._new_task(task_id, "paper.pdf", None, {})
+    os.makedirs(task["task_dir"])
+    open("paper.pdf", "wb").close()
+    routes.store.create(task_id, task)
+    try:
+        asyncio.run(routes.process_patent_pipeline(task_id))
+        spec_path = routes.store.get(task_id)["files"]["specification"]
+        assert _paragraphs(spec_path) == expected
+        # 说明书正文不再整段清洗
+        assert full_calls == []
+    finally:
+        routes.store.delete(task_id)
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    import pytest
+
+    with tempfile.TemporaryDirectory() as d, pytest.MonkeyPatch.context() as mp:
+        test_partial_figure_failure_then_resume(Path(d), mp)
+    with tempfile.TemporaryDirectory() as d, pytest.MonkeyPatch.context() as mp:
+        test_samples_parsed_off_event_loop(Path(d), mp)
+    with tempfile.TemporaryDirectory() as d, pytest.MonkeyPatch.context() as mp:
+        test_specification_cleaned_while_streaming(Path(d), mp)
+    print("OK")
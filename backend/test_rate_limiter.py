@@ -0,0 +1,113 @@
+"""客户端限流测试 - 令牌桶 RPM/TPM 额度、FIFO 公平排队、按任务归集等待时间并在 /status 展示"""
+import asyncio
+import time
+
+import api.routes as routes
+import services.rate_limiter as rate_limiter
+
+MODEL = "test/model"
+
+
+def _install(api_key: str, rpm_capacity: int, rpm_per_second: float, tpm: int = 0) -> rate_limiter._Limiter:
+    """为测试预先创建限流器，并把补充速度调快以缩短测试时间"""
+    limiter = rate_limiter._Limiter(asyncio.get_running_loop())
+    limiter.requests = rate_limiter.TokenBucket(rpm_capacity)
+    limiter.requests.rate = rpm_per_second
+    limiter.tokens = rate_limiter.TokenBucket(tpm)
+    rate_limiter._limiters[(rate_limiter._key_id(api_key), MODEL)] = limiter
+    return limiter
+
+
+def test_fifo_queueing_under_rpm():
+    async def _main():
+        _install("fifo-key", rpm_capacity=2, rpm_per_second=20)
+        order = []
+
+        async def _call(i: int):
+            await rate_limiter.acquire("fifo-key", MODEL, 10, expected_output=0)
+            order.append(i)
+
+        start = time.perf_counter()
+        tasks = []
+        for i in range(10):
+            tasks.append(asyncio.create_task(_call(i)))
+            await asyncio.sleep(0)  # 固定到达顺序
+        await asyncio.gather(*tasks)
+        return order, time.perf_counter() - start
+
+    order, elapsed = asyncio.run(_main())
+    assert order == list(range(10)), f"未按到达顺序放行: {order}"
+    # 前 2 个立即放行，其余 8 个按 20 次/秒补充
+    assert 0.35 <= elapsed < 0.8, f"{elapsed:.2f}s"
+    print(f"10 次调用（突发 2，20 次/秒）耗时 {elapsed:.2f}s")
+
+
+def test_keys_are_isolated():
+    async def _main():
+        _install("slow-key", rpm_capacity=1, rpm_per_second=1)
+        await rate_limiter.acquire("slow-key", MODEL, 1, expected_output=0)
+        blocked = asyncio.create_task(rate_limiter.acquire("slow-key", MODEL, 1, expected_output=0))
+        start = time.perf_counter()
+        await rate_limiter.acquire("other-key", MODEL, 1, expected_output=0)
+        other = time.perf_counter() - start
+        blocked.cancel()
+        await asyncio.gather(blocked, return_exceptions=True)
+        return other
+
+    assert asyncio.run(_main()) < 0.05
+
+
+def test_token_budget_and_settle():
+    async def _main():
+        limiter = _install("tpm-key", rpm_capacity=0, rpm_per_second=0, tpm=6000)
+        reservation = await rate_limiter.acquire("tpm-key", MODEL, 1000, expected_output=2000)
+        assert limiter.tokens.available() <= 3000
+        # 实际只用了 1500，退还多预占的部分
+        reservation.settle(1500)
+        assert 4490 <= limiter.tokens.available() <= 4600
+        assert limiter.state()["rpm_limit"] == 0
+
+    asyncio.run(_main())
+
+
+def test_estimate_tokens():
+    assert rate_limiter.estimate_tokens("专利说明书") == 5
+    assert rate_limiter.estimate_tokens("a" * 40) == 10
+    assert rate_limiter.estimate_message_tokens([{"role": "user", "content": "专利" + "a" * 8}]) == 4
+
+
+def test_waits_reported_in_status():
+    task_id = "rate-limit-status"
+    routes.store.create(task_id, routes._new_task(task_id, "x.pdf", "", {}))
+
+    async def _main():
+        _install("status-key", rpm_capacity=1, rpm_per_second=10)
+        token = rate_limiter.current_task.set(task_id)
+        try:
+            for _ in range(3):
+                await rate_limiter.acquire("status-key", MODEL, 10, expected_output=0)
+            live = (await routes.get_status(task_id))["rate_limit"]
+        finally:
+            rate_limiter.current_task.reset(token)
+        return live
+
+    try:
+        live = asyncio.run(_main())
+        assert live["waits"] == 2
+        assert live["wait_seconds"] >= 0.15
+        assert live["limiters"][MODEL]["rpm_limit"] == 1
+        # 任务结束后保留汇总
+        routes.store.update(task_id, rate_limit=rate_limiter.forget_task(task_id))
+        final = asyncio.run(routes.get_status(task_id))["rate_limit"]
+        assert final["waits"] == 2 and "limiters" not in final
+    finally:
+        routes.store.delete(task_id)
+
+
+if __name__ == "__main__":
+    test_fifo_queueing_under_rpm()
+    test_keys_are_isolated()
+    test_token_budget_and_settle()
+    test_estimate_tokens()
+    test_waits_reported_in_status()
+    print("OK")
@@ -0,0 +1,85 @@
+"""SSE 批量合并测试 - 统计 content 帧数与传输字节的减少量，并校验与其他事件的相对顺序"""
+import asyncio
+import json
+
+import api.routes as routes
+from services.chunk_batcher import ChunkBatcher
+
+DELTAS = 2000
+DELTA_INTERVAL = 0.0005
+LOG_EVERY = 500
+
+
+def _frame(msg: dict) -> str:
+    return f"data: {json.dumps(msg, ensure_ascii=False)}\n\n"
+
+
+def _simulate(task_id: str):
+    """模拟 LLM 逐 token 输出，期间穿插日志事件；返回未合并时应发出的事件序列"""
+    routes.store.create(task_id, {"status": "processing", "files": {}, "figures": [], "error": ""})
+    expected = []
+
+    async def _producer():
+        for i in range(DELTAS):
+            text = f"字{i % 10}"
+            routes._push_chunk(task_id, "content", step="1", text=text)
+            expected.append({"type": "content", "step": "1", "text": text})
+            if (i + 1) % LOG_EVERY == 0:
+                routes._push_log(task_id, f"log {i + 1}")
+                expected.append({"type": "log", "message": f"log {i + 1}"})
+            await asyncio.sleep(DELTA_INTERVAL)
+        routes._update_task(task_id, status="completed")
+
+    asyncio.run(_producer())
+    events = routes.store.read_events(task_id)
+    routes.store.delete(task_id)
+    return expected, events
+
+
+def _merge_content(events):
+    """把相邻 content 合并，得到与批量无关的规范序列"""
+    merged = []
+    for e in events:
+        if e["type"] == "content" and merged and merged[-1]["type"] == "content" \
+                and merged[-1]["step"] == e["step"]:
+            merged[-1] = {**merged[-1], "text": merged[-1]["text"] + e["text"]}
+        else:
+            merged.append(dict(e))
+    return merged
+
+
+def test_batching_reduces_frames_and_preserves_order():
+    expected, events = _simulate("batch-test")
+
+    assert _merge_content(events) == _merge_content(expected)
+
+    before_frames = len(expected)
+    after_frames = len(events)
+    before_bytes = sum(len(_frame(e).encode()) for e in expected)
+    after_bytes = sum(len(_frame(e).encode()) for e in events)
+    print(f"帧数 {before_frames} -> {after_frames}，字节 {before_bytes} -> {after_bytes}")
+    assert after_frames * 10 <= before_frames
+    assert after_bytes * 2 <= before_bytes
+
+
+def test_size_limit_flushes_immediately():
+    emitted = []
+    batcher = ChunkBatcher(lambda tid, msg: emitted.append(msg), window=10, max_chars=8)
+
+    async def _main():
+        batcher.add("t", "3", "abcd")
+        batcher.add("t", "4", "xy")
+        assert emitted == []
+        batcher.add("t", "3", "efgh")
+        assert emitted == [
+            {"type": "content", "step": "3", "text": "abcdefgh"},
+            {"type": "content", "step": "4", "text": "xy"},
+        ]
+
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    test_batching_reduces_frames_and_preserves_order()
+    test_size_limit_flushes_immediately()
+    print("测试通过")
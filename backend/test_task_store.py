@@ -0,0 +1,155 @@
+"""任务存储测试 - 两个 SQLiteTaskStore 实例（模拟两个 worker 进程）共用一个数据库：
+状态跨实例可见、事件可从另一实例回放、淘汰时删除事件日志；写入不在调用线程中等待数据库锁；
+进程崩溃后遗留的执行中任务在下次启动时标记为失败"""
+import os
+import sqlite3
+import time
+
+import pytest
+
+from services import event_log, task_store
+from services.task_store import SQLiteTaskStore
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(event_log, "EVENT_LOG_DIR", str(tmp_path / "events"))
+    path = str(tmp_path / "tasks.db")
+    a, b = SQLiteTaskStore(path), SQLiteTaskStore(path)
+    yield a, b
+    a.close()
+    b.close()
+
+
+def test_create_update_visible_across_instances(stores):
+    a, b = stores
+    a.create("t1", {"status": "queued", "files": {}, "figures": []})
+    a.update("t1", status="processing", step="2")
+    # 写入方立即读到自己的修改
+    assert a.get("t1")["step"] == "2"
+    assert a.get_status("t1") == "processing"
+
+    a.flush()
+    t = b.get("t1")
+    assert t["status"] == "processing" and t["step"] == "2" and t["figures"] == []
+    assert b.get_status("t1") == "processing"
+
+    # 另一实例的修改与本实例合并，不互相覆盖
+    b.update("t1", files={"claims": "权利要求书.docx"})
+    b.flush()
+    a.update("t1", status="completed")
+    a.flush()
+    t = b.get("t1")
+    assert t["status"] == "completed" and t["files"] == {"claims": "权利要求书.docx"}
+
+
+def test_writer_thread_commits_without_flush(stores):
+    a, b = stores
+    a.create("t2", {"status": "queued"})
+    deadline = time.monotonic() + 2
+    while b.get("t2") is None:
+        assert time.monotonic() < deadline, "写入线程未提交"
+        time.sleep(0.01)
+
+
+def test_events_replay_from_other_instance(stores):
+    a, b = stores
+    a.create("t3", {"status": "processing"})
+    for i in range(5):
+        a.append_event("t3", {"type": "content", "step": "1", "text": f"第{i}段"})
+    a.flush()
+    assert [e["text"] for e in b.read_events("t3")] == [f"第{i}段" for i in range(5)]
+
+    a.append_event("t3", {"type": "done", "status": "completed"})
+    a.close_events("t3")
+    assert b.read_events("t3")[-1] == {"type": "done", "status": "completed"}
+
+
+def test_eviction_deletes_event_log(stores):
+    a, b = stores
+    a.create("t4", {"status": "processing"})
+    a.append_event("t4", {"type": "log", "message": "开始"})
+    a.update("t4", status="completed")
+    a.close_events("t4")
+    a.flush()
+    log_path = event_log.event_log_path("t4")
+    assert os.path.exists(log_path)
+
+    b.retention = -1
+    assert b.evict_expired(force=True) == 1
+    assert not os.path.exists(log_path)
+    assert b.get("t4") is None
+    b.flush()
+    assert a.get("t4") is None
+
+
+def test_update_does_not_wait_for_db_lock(stores, monkeypatch):
+    a, _ = stores
+    a.create("t5", {"status": "processing"})
+    a.flush()
+    # 另一个连接长时间持有写锁
+    other = sqlite3.connect(a.path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.perf_counter()
+        for i in range(100):
+            a.update("t5", step=str(i))
+        elapsed = time.perf_counter() - start
+        assert elapsed < 0.1, f"update 在调用线程中等待了数据库锁: {elapsed:.2f}s"
+        assert a.get("t5")["step"] == "99"
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    a.flush()
+    assert a.get("t5")["step"] == "99"
+
+
+def test_failed_commit_keeps_changes(stores, monkeypatch):
+    a, b = stores
+    monkeypatch.setattr(task_store, "TASK_DB_BUSY_TIMEOUT_MS", 50)
+    path = a.path
+    c = SQLiteTaskStore(path)
+    try:
+        c.create("t6", {"status": "processing"})
+        other = sqlite3.connect(path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        with pytest.raises(sqlite3.OperationalError):
+            c.flush()
+        other.execute("ROLLBACK")
+        other.close()
+        # 提交失败的修改仍在本进程可见，锁释放后写入
+        assert c.get_status("t6") == "processing"
+        c.flush()
+        assert b.get_status("t6") == "processing"
+    finally:
+        c.close()
+
+
+def test_orphaned_tasks_marked_failed_on_startup(stores):
+    a, b = stores
+    a.create("t7", {"status": "processing", "error": ""})
+    a.create("t8", {"status": "queued", "error": ""})
+    b.create("t9", {"status": "processing", "error": ""})
+    a.flush()
+    b.flush()
+    # 模拟 a 所在进程被 kill -9：心跳不再更新（不调用 close）
+    conn = sqlite3.connect(a.path, isolation_level=None)
+    conn.execute("UPDATE workers SET heartbeat = 0 WHERE owner = ?", (a.owner,))
+    conn.close()
+
+    c = SQLiteTaskStore(a.path)
+    try:
+        for task_id in ("t7", "t8"):
+            t = c.get(task_id)
+            assert t["status"] == "failed" and t["error"] == task_store.ORPHAN_ERROR
+        # 仍在运行的进程的任务不受影响
+        assert c.get_status("t9") == "processing"
+        assert c.recover_orphans() == []
+    finally:
+        c.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,180 @@
+"""范本库测试 - 规范化解析、按内容去重、LRU 命中与 /templates、/upload 按 ID 引用"""
+import hashlib
+import os
+import shutil
+
+import pytest
+
+from services import templates
+from services.templates import TemplateLibrary, normalize_text, parse_template_file
+
+
+def _sha256(path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _docx(path, paragraphs):
+    from docx import Document
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    doc.save(str(path))
+
+
+def test_normalize_and_parse(tmp_path):
+    assert normalize_text("﻿第一行  \r\n\r\n\r\n\r\n第二行\r") == "第一行\n\n第二行"
+
+    gbk = tmp_path / "claims.txt"
+    gbk.write_bytes("1. 一种交通流预测方法，其特征在于：\r\n".encode("gbk"))
+    assert parse_template_file(str(gbk)) == "1. 一种交通流预测方法，其特征在于："
+
+    spec = tmp_path / "spec.docx"
+    _docx(spec, ["技术领域", "", "背景技术  "])
+    assert parse_template_file(str(spec)) == "技术领域\n背景技术"
+
+
+def test_add_dedupes_and_serves_from_lru(tmp_path, monkeypatch):
+    src = tmp_path / "spec.docx"
+    _docx(src, ["技术领域", "本发明涉及交通预测。"])
+    library = TemplateLibrary(str(tmp_path / "lib"), cache_size=2)
+
+    meta = library.add(str(src), _sha256(src), "spec.docx", "spec")
+    again = library.add(str(src), _sha256(src), "renamed.docx", "spec")
+    assert again == meta
+    assert library.parses == 1
+
+    # 命中 LRU 时不读磁盘，也不再解析
+    monkeypatch.setattr(templates, "parse_template_file", lambda path: pytest.fail("不应重新解析"))
+    assert library.text(meta["template_id"]) == "技术领域\n本发明涉及交通预测。"
+    assert library.stats()["hits"] == 1
+    monkeypatch.undo()
+
+    # 挤出 LRU 后从存盘的规范化文本读回
+    for i in range(2):
+        other = tmp_path / f"t{i}.txt"
+        other.write_text(f"范本 {i}", encoding="utf-8")
+        library.add(str(other), _sha256(other), other.name, "claims")
+    assert meta["template_id"] not in library._texts
+    assert library.text(meta["template_id"]).startswith("技术领域")
+    assert library.stats()["misses"] == 1
+
+    # 新实例（模拟重启）从磁盘恢复元信息
+    reopened = TemplateLibrary(str(tmp_path / "lib"))
+    assert reopened.get(meta["template_id"]) == meta
+    assert len(reopened.list()) == 3
+
+    with pytest.raises(KeyError):
+        library.text("0" * 16)
+    with pytest.raises(KeyError):
+        library.text("../../etc/passwd")
+
+
+def test_template_endpoints_and_upload_by_id(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+    from api import routes
+
+    from services import event_log
+
+    library = TemplateLibrary(str(tmp_path / "lib"))
+    monkeypatch.setattr(routes, "template_library", library)
+    # 只验证上传与范本登记，不真正执行管道；事件日志写到临时目录
+    monkeypatch.setattr(event_log, "EVENT_LOG_DIR", str(tmp_path / "events"))
+
+    async def _enqueue(task_id):
+        return 0
+
+    monkeypatch.setattr(routes, "_enqueue", _enqueue)
+
+    with TestClient(main.app) as client:
+        resp = client.post(
+            "/api/templates",
+            files={"file": ("spec.txt", "说明书范本\r\n".encode("utf-8"), "text/plain")},
+            data={"kind": "spec"},
+        )
+        assert resp.status_code == 200
+        template_id = resp.json()["template_id"]
+        assert resp.json()["chars"] == len("说明书范本")
+
+        again = client.post(
+            "/api/templates",
+            files={"file": ("copy.txt", "说明书范本\r\n".encode("utf-8"), "text/plain")},
+            data={"kind": "spec"},
+        )
+        assert again.json()["template_id"] == template_id
+        assert [t["template_id"] for t in client.get("/api/templates").json()["templates"]] == [template_id]
+
+        bad_kind = client.post(
+            "/api/templates", files={"file": ("x.txt", b"x", "text/plain")}, data={"kind": "other"},
+        )
+        assert bad_kind.status_code == 400
+
+        missing = client.post(
+            "/api/upload",
+            files={"file": ("paper.pdf", b"%PDF-1.4", "application/pdf")},
+            data={"spec_template_id": "f" * 16},
+        )
+        assert missing.status_code == 400
+
+        resp = client.post(
+            "/api/upload",
+            files={
+                "file": ("paper.pdf", b"%PDF-1.4", "application/pdf"),
+                "claims_sample": ("claims.txt", "权利要求范本".encode("gbk"), "text/plain"),
+            },
+            data={"spec_template_id": template_id},
+        )
+        assert resp.status_code == 200
+        task_id = resp.json()["task_id"]
+        task = routes.store.get(task_id)
+        samples = task["samples"]
+    routes.store.delete(task_id)
+    shutil.rmtree(task["task_dir"], ignore_errors=True)
+    os.remove(task["pdf_path"])
+
+    assert samples["spec_sample"] == template_id
+    assert routes._read_sample(samples["spec_sample"]) == "说明书范本"
+    assert routes._read_sample(samples["claims_sample"]) == "权利要求范本"
+    assert library.parses == 2
+
+
+def test_corrupt_docx_rejected_with_400(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+    from api import routes
+
+    library = TemplateLibrary(str(tmp_path / "lib"))
+    monkeypatch.setattr(routes, "template_library", library)
+    corrupt = b"PK\x03\x04 not really a docx"
+    before_temp, before_samples = set(os.listdir("temp")), set(os.listdir("samples"))
+
+    with TestClient(main.app) as client:
+        resp = client.post(
+            "/api/templates",
+            files={"file": ("bad.docx", corrupt, "application/octet-stream")},
+            data={"kind": "spec"},
+        )
+        assert resp.status_code == 400
+        assert "无法解析" in resp.json()["detail"]
+
+        resp = client.post("/api/upload", files={
+            "file": ("paper.pdf", b"%PDF-1.4", "application/pdf"),
+            "spec_sample": ("bad.docx", corrupt, "application/octet-stream"),
+        })
+        assert resp.status_code == 400
+
+    # 未登记范本，PDF 与暂存文件均已删除
+    assert library.list() == []
+    assert set(os.listdir("temp")) == before_temp
+    assert set(os.listdir("samples")) == before_samples
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as d:
+        test_normalize_and_parse(Path(d))
+    print("OK")
@@ -0,0 +1,196 @@
+"""上传流式落盘测试 - 200 MB 上传期间事件循环保持响应、哈希正确、按字段限制大小、
+按 Content-Length 在读取请求体之前拒绝超大请求"""
+import asyncio
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from fastapi import UploadFile
+
+from services.uploads import RequestSizeLimit, UploadTooLarge, save_upload
+
+BIG_SIZE = 200 * 1024 * 1024
+
+
+class _PatternFile:
+    """按需生成内容的只读文件对象，避免测试本身占用 200 MB 内存"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.pos = 0
+        self.block = bytes(range(256)) * 4096
+
+    def read(self, n: int = -1) -> bytes:
+        if n < 0:
+            n = self.size - self.pos
+        n = min(n, self.size - self.pos, len(self.block))
+        self.pos += n
+        return self.block[:n]
+
+
+def _expected_sha256(size: int) -> str:
+    src, hasher = _PatternFile(size), hashlib.sha256()
+    for chunk in iter(lambda: src.read(1024 * 1024), b""):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+async def _measure_lag(work):
+    """work 执行期间每 10ms 打点一次，返回 (work 结果, 最大打点间隔)"""
+    max_gap = 0.0
+    stop = asyncio.Event()
+
+    async def _ticker():
+        nonlocal max_gap
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            max_gap = max(max_gap, now - last)
+            last = now
+
+    ticker = asyncio.create_task(_ticker())
+    try:
+        result = await work
+    finally:
+        stop.set()
+        await ticker
+    return result, max_gap
+
+
+def test_large_upload_keeps_event_loop_responsive(tmp_path):
+    upload = UploadFile(file=_PatternFile(BIG_SIZE), filename="big.pdf")
+    dest = str(tmp_path / "big.pdf")
+    started = time.perf_counter()
+    (sha256, size), max_gap = asyncio.run(
+        _measure_lag(save_upload(upload, dest, "file", BIG_SIZE))
+    )
+    elapsed = time.perf_counter() - started
+    print(f"200 MB 落盘 {elapsed:.2f}s，事件循环最大停顿 {max_gap * 1000:.0f}ms")
+    assert size == BIG_SIZE == os.path.getsize(dest)
+    assert sha256 == _expected_sha256(BIG_SIZE)
+    assert max_gap < 0.25
+
+
+def test_limit_enforced_while_streaming(tmp_path):
+    # 大小未知时边写边计数，超限即中止并删除已写入部分
+    upload = UploadFile(file=_PatternFile(5 * 1024 * 1024), filename="x.pdf")
+    dest = str(tmp_path / "x.pdf")
+    with pytest.raises(UploadTooLarge) as exc:
+        asyncio.run(save_upload(upload, dest, "spec_sample", 2 * 1024 * 1024))
+    assert exc.value.field == "spec_sample"
+    assert not os.path.exists(dest)
+
+
+def test_known_size_rejected_without_copy(tmp_path):
+    upload = UploadFile(file=io.BytesIO(b"x" * 100), filename="x.txt", size=100)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(save_upload(upload, str(tmp_path / "x.txt"), "claims_sample", 10))
+    assert upload.file.tell() == 0
+
+
+def test_upload_endpoint_returns_413_per_field(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+    from api import routes
+
+    monkeypatch.setattr(routes, "MAX_SAMPLE_BYTES", 1024)
+    before = set(os.listdir("temp"))
+    with TestClient(main.app) as client:
+        resp = client.post("/api/upload", files={
+            "file": ("paper.pdf", b"%PDF-1.4 small", "application/pdf"),
+            "spec_sample": ("spec.txt", b"x" * 4096, "text/plain"),
+        })
+    assert resp.status_code == 413
+    assert "spec_sample" in resp.json()["detail"]
+    # 已写入的论文 PDF 也被清理
+    assert set(os.listdir("temp")) == before
+
+
+def test_oversized_pdf_registers_no_templates(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+    from api import routes
+    from services.templates import TemplateLibrary
+
+    library = TemplateLibrary(str(tmp_path / "templates"))
+    monkeypatch.setattr(routes, "template_library", library)
+    monkeypatch.setattr(routes, "MAX_PDF_BYTES", 1024)
+    before_temp, before_samples = set(os.listdir("temp")), set(os.listdir("samples"))
+    with TestClient(main.app) as client:
+        resp = client.post("/api/upload", files={
+            "file": ("paper.pdf", b"%PDF-1.4 " + b"x" * 4096, "application/pdf"),
+            "spec_sample": ("spec.txt", "一种方法的说明书范本".encode(), "text/plain"),
+        })
+    assert resp.status_code == 413
+    assert "file" in resp.json()["detail"]
+    # 大小检查全部通过之前不登记范本，暂存文件与 PDF 均被清理
+    assert library.list() == []
+    assert set(os.listdir("temp")) == before_temp
+    assert set(os.listdir("samples")) == before_samples
+
+
+def test_oversized_request_rejected_before_body_is_read():
+    called, received, sent = [], [], []
+
+    async def _app(scope, receive, send):
+        called.append(scope["path"])
+
+    async def _receive():
+        received.append(True)
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def _send(message):
+        sent.append(message)
+
+    middleware = RequestSizeLimit(_app, limits={"/api/upload": 1024})
+
+    def _scope(path, length):
+        return {
+            "type": "http", "method": "POST", "path": path,
+            "headers": [(b"content-length", str(length).encode())],
+        }
+
+    asyncio.run(middleware(_scope("/api/upload", 10 * 1024 * 1024), _receive, _send))
+    assert sent[0]["status"] == 413
+    # 未读取请求体，也未进入路由
+    assert received == [] and called == []
+
+    sent.clear()
+    asyncio.run(middleware(_scope("/api/upload", 1024), _receive, _send))
+    asyncio.run(middleware(_scope("/api/other", 10 * 1024 * 1024), _receive, _send))
+    assert called == ["/api/upload", "/api/other"] and sent == []
+
+
+def test_upload_endpoint_rejects_by_content_length(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    before = set(os.listdir("temp"))
+    with TestClient(main.app) as client:
+        resp = client.post(
+            "/api/upload",
+            content=b"x" * 1024,
+            headers={
+                "Content-Type": "multipart/form-data; boundary=x",
+                "Content-Length": str(10 * 1024 * 1024 * 1024),
+            },
+        )
+    assert resp.status_code == 413
+    assert set(os.listdir("temp")) == before
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as d:
+        test_large_upload_keeps_event_loop_responsive(Path(d))
+        test_limit_enforced_while_streaming(Path(d))
+        test_known_size_rejected_without_copy(Path(d))
+    print("OK")
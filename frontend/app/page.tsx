@@ -50,13 +50,57 @@ export default function Home() {
     const [isDone, setIsDone] = useState(false);
     const [files, setFiles] = useState<Record<string, string>>({});
     const [figureCount, setFigureCount] = useState(0);
+    // 生成失败的附图序号（从 1 开始）；文档已可下载，可续跑补生成
+    const [figuresMissing, setFiguresMissing] = useState<number[]>([]);
+    const [resuming, setResuming] = useState(false);
     const [error, setError] = useState("");
 
     // Log State
     const [logs, setLogs] = useState<string[]>([]);
     const [showLog, setShowLog] = useState(false);
 
-    const contentRef = useRef("");
+    // 并发步骤（权利要求书 / 摘要 / 附图提示词）的内容按 step 分别累积；
+    // 面板默认跟随最近进入的步骤，用户点选某个步骤后固定显示该步骤，再次点击恢复跟随
+    const contentRef = useRef<Record<string, string>>({});
+    const labelRef = useRef<Record<string, string>>({});
+    const runningRef = useRef<string[]>([]);
+    const activeStepRef = useRef("");
+    const pinnedRef = useRef(false);
+    const [activeStep, setActiveStep] = useState("");
+    const [pinned, setPinned] = useState(false);
+
+    const resetStepView = () => {
+        contentRef.current = {};
+        labelRef.current = {};
+        runningRef.current = [];
+        activeStepRef.current = "";
+        pinnedRef.current = false;
+        setActiveStep("");
+        setPinned(false);
+    };
+
+    const showStep = useCallback((step: string) => {
+        activeStepRef.current = step;
+        setActiveStep(step);
+        setCurrentStepLabel(
+            labelRef.current[step] || INITIAL_STEPS.find((s) => s.id === step)?.label || ""
+        );
+        setCurrentContent(contentRef.current[step] || "");
+    }, []);
+
+    const handleSelectStep = (step: string) => {
+        if (pinnedRef.current && step === activeStepRef.current) {
+            // 再次点击已固定的步骤：恢复跟随最近进入的步骤
+            pinnedRef.current = false;
+            setPinned(false);
+            const running = runningRef.current;
+            showStep(running.length ? running[running.length - 1] : step);
+            return;
+        }
+        pinnedRef.current = true;
+        setPinned(true);
+        showStep(step);
+    };
 
     // ===== Save API Key =====
     const handleSaveApiKey = async () => {
@@ -88,6 +132,7 @@ export default function Home() {
         setIsDone(false);
         setFiles({});
         setFigureCount(0);
+        setFiguresMissing([]);
         setLogs([]);
 
         const formData = new FormData();
@@ -95,13 +140,18 @@ export default function Home() {
         if (specSample) formData.append("spec_sample", specSample);
         if (claimsSample) formData.append("claims_sample", claimsSample);
         if (abstractSample) formData.append("abstract_sample", abstractSample);
+        formData.append("api_key", apiKey);
 
         try {
             const res = await fetch(`${API_BASE}/upload`, { method: "POST", body: formData });
             const data = await res.json();
+            if (!res.ok) {
+                setError("上传失败：" + (data.detail || res.status));
+                return;
+            }
             setTaskId(data.task_id);
             setIsStreaming(true);
-            contentRef.current = "";
+            resetStepView();
             setPhase("generating");
             connectSSE(data.task_id);
         } catch (e) {
@@ -120,21 +170,40 @@ export default function Home() {
                 const msg = JSON.parse(event.data);
 
                 if (msg.type === "step") {
-                    setCurrentStepLabel(msg.label);
+                    // 只标记进入的步骤；完成由各步骤自己的 step_done 报告（步骤 3/4/5 并发执行）
+                    labelRef.current[msg.step] = msg.label;
+                    runningRef.current = [...runningRef.current.filter((id) => id !== msg.step), msg.step];
                     setSteps((prev) =>
-                        prev.map((s) => {
-                            if (s.id === msg.step) return { ...s, status: "processing" as const };
-                            if (parseInt(s.id) < parseInt(msg.step)) return { ...s, status: "completed" as const };
-                            return s;
-                        })
+                        prev.map((s) => (s.id === msg.step ? { ...s, status: "processing" as const } : s))
                     );
-                    contentRef.current = "";
-                    setCurrentContent("");
+                    if (!pinnedRef.current) showStep(msg.step);
+                }
+
+                if (msg.type === "step_done") {
+                    const status = msg.status === "failed" ? ("failed" as const) : ("completed" as const);
+                    runningRef.current = runningRef.current.filter((id) => id !== msg.step);
+                    setSteps((prev) => prev.map((s) => (s.id === msg.step ? { ...s, status } : s)));
+                    // 跟随模式下当前步骤结束，切到仍在运行的最近一个步骤
+                    const running = runningRef.current;
+                    if (!pinnedRef.current && msg.step === activeStepRef.current && running.length) {
+                        showStep(running[running.length - 1]);
+                    }
                 }
 
                 if (msg.type === "content") {
-                    contentRef.current += msg.text;
-                    setCurrentContent(contentRef.current);
+                    const step = msg.step ?? activeStepRef.current;
+                    contentRef.current[step] = (contentRef.current[step] || "") + msg.text;
+                    if (step === activeStepRef.current) {
+                        setCurrentContent(contentRef.current[step]);
+                    }
+                }
+
+                if (msg.type === "reset") {
+                    // 上游中断后重新生成：丢弃该步骤已显示的内容
+                    contentRef.current[msg.step] = "";
+                    if (msg.step === activeStepRef.current) {
+                        setCurrentContent("");
+                    }
                 }
 
                 if (msg.type === "file_ready") {
@@ -142,7 +211,7 @@ export default function Home() {
                 }
 
                 if (msg.type === "figure_ready") {
-                    setFigureCount(msg.index + 1);
+                    setFigureCount(msg.count ?? msg.index + 1);
                 }
 
                 if (msg.type === "log") {
@@ -151,6 +220,9 @@ export default function Home() {
                 }
 
                 if (msg.type === "error") {
+                    setSteps((prev) =>
+                        prev.map((s) => (s.status === "processing" ? { ...s, status: "failed" as const } : s))
+                    );
                     setError(msg.message);
                     setIsStreaming(false);
                     es.close();
@@ -159,10 +231,14 @@ export default function Home() {
                 if (msg.type === "done") {
                     setIsStreaming(false);
                     if (msg.status === "completed") {
-                        setSteps((prev) => prev.map((s) => ({ ...s, status: "completed" as const })));
+                        // 附图步骤失败（部分附图缺失）时保留失败标记
+                        setSteps((prev) =>
+                            prev.map((s) => (s.status === "failed" ? s : { ...s, status: "completed" as const }))
+                        );
                         setIsDone(true);
                         setFiles(msg.files || {});
                         setFigureCount(msg.figures || 0);
+                        setFiguresMissing(msg.figures_missing || []);
                         setPhase("done");
                     } else {
                         setError(msg.error || "任务失败");
@@ -178,7 +254,36 @@ export default function Home() {
             setIsStreaming(false);
             es.close();
         };
-    }, []);
+    }, [showStep]);
+
+    // ===== Resume: 补生成缺失的附图 =====
+    const handleResumeFigures = async () => {
+        if (!taskId) return;
+        setResuming(true);
+        setError("");
+        try {
+            const res = await fetch(`${API_BASE}/resume/${taskId}`, { method: "POST" });
+            const data = await res.json();
+            if (!res.ok) {
+                setError("续跑失败：" + (data.detail || res.status));
+                return;
+            }
+            // 事件流从头回放，界面状态按新的一轮重建
+            setSteps(INITIAL_STEPS);
+            setCurrentContent("");
+            setIsDone(false);
+            setFiguresMissing([]);
+            setLogs([]);
+            resetStepView();
+            setIsStreaming(true);
+            setPhase("generating");
+            connectSSE(taskId);
+        } catch (e) {
+            setError("续跑失败：" + String(e));
+        } finally {
+            setResuming(false);
+        }
+    };
 
     // ===== Render =====
     return (
@@ -461,7 +566,10 @@ export default function Home() {
                         </motion.div>
 
                         <div className="w-full max-w-5xl mb-6">
-                            <WorkflowPipeline steps={steps} />
+                            <WorkflowPipeline steps={steps} selectedId={activeStep} onSelect={handleSelectStep} />
+                            <p className="text-center text-[11px] text-[var(--text-tertiary)] mt-1">
+                                {pinned ? "已固定显示所选步骤，再次点击恢复跟随最新步骤" : "点击已开始的步骤查看其输出"}
+                            </p>
                         </div>
 
                         <div className="w-full max-w-5xl mb-8">
@@ -504,13 +612,36 @@ export default function Home() {
                                 <span className="text-3xl">🎉</span>
                             </motion.div>
                             <h2 className="text-3xl font-bold tracking-tight mb-2">文书生成完毕</h2>
-                            <p className="text-[var(--text-secondary)] text-sm">全部文档已准备就绪，可预览或下载</p>
+                            <p className="text-[var(--text-secondary)] text-sm">
+                                {figuresMissing.length ? "文档已准备就绪，部分附图未能生成" : "全部文档已准备就绪，可预览或下载"}
+                            </p>
                         </motion.div>
 
                         <div className="w-full max-w-5xl mb-8">
                             <WorkflowPipeline steps={steps} />
                         </div>
 
+                        {figuresMissing.length > 0 && (
+                            <div className="w-full max-w-3xl mb-6 p-4 rounded-2xl bg-amber-50 dark:bg-amber-950/30 border border-amber-200 dark:border-amber-800 text-amber-700 dark:text-amber-400 text-sm flex items-center gap-4">
+                                <span className="flex-1">
+                                    ⚠️ 图{figuresMissing.join("、图")} 生成失败，其余文件可正常下载；可只补生成缺失的附图
+                                </span>
+                                <button
+                                    onClick={handleResumeFigures}
+                                    disabled={resuming}
+                                    className="btn-primary px-5 py-2 text-sm whitespace-nowrap"
+                                >
+                                    {resuming ? "提交中..." : "补生成缺失附图"}
+                                </button>
+                            </div>
+                        )}
+
+                        {error && (
+                            <div className="w-full max-w-3xl mb-6 p-4 rounded-2xl bg-red-50 dark:bg-red-950/30 border border-red-200 dark:border-red-800 text-red-600 dark:text-red-400 text-sm">
+                                ⚠️ {error}
+                            </div>
+                        )}
+
                         {/* Download Center + Figures */}
                         <div className="w-full max-w-3xl">
                             <DownloadCenter taskId={taskId} files={files} figureCount={figureCount} />
@@ -524,10 +655,12 @@ export default function Home() {
                                 setPhase("config");
                                 setTaskId(null);
                                 setSteps(INITIAL_STEPS);
+                                resetStepView();
                                 setCurrentContent("");
                                 setIsDone(false);
                                 setFiles({});
                                 setFigureCount(0);
+                                setFiguresMissing([]);
                                 setPdfFile(null);
                                 setError("");
                                 setLogs([]);
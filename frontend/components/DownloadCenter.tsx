@@ -14,6 +14,7 @@ const FILE_CONFIG = [
     { key: "specification", label: "说明书", desc: "发明专利说明书全文", icon: FileText, color: "from-blue-500 to-cyan-400" },
     { key: "claims", label: "权利要求书", desc: "独立权利要求与从属权利要求", icon: FileText, color: "from-violet-500 to-purple-400" },
     { key: "abstract", label: "说明书摘要", desc: "技术方案核心摘要", icon: FileText, color: "from-amber-500 to-orange-400" },
+    { key: "figures_doc", label: "说明书附图", desc: "全部附图及图号标注", icon: Image, color: "from-pink-500 to-rose-400" },
     { key: "visual_prompts", label: "附图提示词", desc: "专利附图生成提示词", icon: Eye, color: "from-emerald-500 to-green-400" },
 ];
 
@@ -22,6 +23,8 @@ const API_BASE = "http://localhost:8000/api";
 export default function DownloadCenter({ taskId, files, figureCount = 0 }: DownloadCenterProps) {
     const downloadUrl = (type: string) => `${API_BASE}/download/${taskId}/${type}`;
     const imageUrl = (idx: number) => `${API_BASE}/image/${taskId}/${idx}`;
+    const thumbnailUrl = (idx: number) => `${API_BASE}/thumbnail/${taskId}/${idx}`;
+    const bundleUrl = `${API_BASE}/bundle/${taskId}`;
     const availableCount = FILE_CONFIG.filter(f => f.key in files).length;
 
     const [currentFigure, setCurrentFigure] = useState(0);
@@ -124,18 +127,25 @@ export default function DownloadCenter({ taskId, files, figureCount = 0 }: Downl
                         )}
                     </div>
 
-                    {/* Thumbnail dots */}
+                    {/* Thumbnail strip */}
                     {figureCount > 1 && (
                         <div className="flex justify-center gap-2 mt-4">
                             {Array.from({ length: figureCount }, (_, i) => (
                                 <button
                                     key={i}
                                     onClick={() => setCurrentFigure(i)}
-                                    className={`w-2 h-2 rounded-full transition-all ${i === currentFigure
-                                            ? "bg-[var(--accent)] w-6"
-                                            : "bg-gray-300 dark:bg-zinc-600 hover:bg-gray-400"
+                                    className={`w-16 h-10 rounded-lg overflow-hidden bg-white border-2 transition-all ${i === currentFigure
+                                            ? "border-[var(--accent)]"
+                                            : "border-transparent opacity-60 hover:opacity-100"
                                         }`}
-                                />
+                                >
+                                    <img
+                                        src={thumbnailUrl(i)}
+                                        alt={`图${i + 1}`}
+                                        loading="lazy"
+                                        className="w-full h-full object-contain"
+                                    />
+                                </button>
                             ))}
                         </div>
                     )}
@@ -163,23 +173,20 @@ export default function DownloadCenter({ taskId, files, figureCount = 0 }: Downl
                 transition={{ delay: 0.6 }}
             >
                 <button
-                    disabled={availableCount === 0}
+                    disabled={availableCount === 0 && figureCount === 0}
                     className="btn-primary w-full py-4 text-base flex items-center justify-center gap-3"
                     onClick={() => {
-                        FILE_CONFIG.forEach(({ key }) => {
-                            if (key in files) {
-                                const a = document.createElement("a");
-                                a.href = downloadUrl(key);
-                                a.download = "";
-                                document.body.appendChild(a);
-                                a.click();
-                                document.body.removeChild(a);
-                            }
-                        });
+                        // 服务端流式打包为单个 ZIP，一次请求下载全部文档与附图
+                        const a = document.createElement("a");
+                        a.href = bundleUrl;
+                        a.download = "";
+                        document.body.appendChild(a);
+                        a.click();
+                        document.body.removeChild(a);
                     }}
                 >
                     <Package className="w-5 h-5" />
-                    一键下载全部文档 ({availableCount} 份)
+                    一键下载全部文件 ({availableCount} 份文档{figureCount > 0 ? ` · ${figureCount} 张附图` : ""})
                 </button>
             </motion.div>
         </div>
@@ -11,9 +11,13 @@ export interface StepData {
 
 interface WorkflowPipelineProps {
     steps: StepData[];
+    // 当前在输出面板中显示的步骤
+    selectedId?: string;
+    // 点选已开始（非 pending）的步骤；不传则节点不可点击
+    onSelect?: (id: string) => void;
 }
 
-export default function WorkflowPipeline({ steps }: WorkflowPipelineProps) {
+export default function WorkflowPipeline({ steps, selectedId, onSelect }: WorkflowPipelineProps) {
     return (
         <div className="w-full overflow-x-auto py-4 px-2 scrollbar-hide">
             <div className="flex items-center justify-center min-w-max">
@@ -22,6 +26,7 @@ export default function WorkflowPipeline({ steps }: WorkflowPipelineProps) {
                     const prevStep = index > 0 ? steps[index - 1] : null;
                     const isConnectorActive = prevStep?.status === "completed" && step.status === "processing";
                     const isConnectorDone = prevStep?.status === "completed" && step.status === "completed";
+                    const selectable = !!onSelect && step.status !== "pending";
 
                     return (
                         <div key={step.id} className="flex items-center">
@@ -44,10 +49,15 @@ export default function WorkflowPipeline({ steps }: WorkflowPipelineProps) {
                                     damping: 30,
                                     delay: index * 0.06,
                                 }}
-                                className="flex flex-col items-center gap-2"
+                                className={`flex flex-col items-center gap-2 ${selectable ? "cursor-pointer" : ""}`}
+                                onClick={selectable ? () => onSelect?.(step.id) : undefined}
+                                title={selectable ? `查看「${step.label}」的输出` : undefined}
                             >
                                 <div
-                                    className={`node-base ${step.status === "processing"
+                                    className={`node-base ${onSelect && step.id === selectedId
+                                            ? "ring-2 ring-[var(--accent)] ring-offset-2 ring-offset-transparent"
+                                            : ""
+                                        } ${step.status === "processing"
                                             ? "node-processing"
                                             : step.status === "completed"
                                                 ? "node-completed"